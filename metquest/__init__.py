@@ -3,7 +3,17 @@ from .fetch_reactions import *
 from .generate_partitions import *
 from .get_reaction_types import *
 from .guided_bfs import *
-from .pathway_assembler import find_pathways
+from .pathway_writer import PathwayWriter
+from .pathway_archive import save_pathway_archive, load_pathway_archive, \
+    PathwayArchive
+from .pathway_index import build_pathway_index, PathwayIndex
+from .pathway_stats import PathwayStats
+from .pathway_store import PathwayStore, SpilledPathways
+from .pathway_assembler import find_pathways, find_pathways_for_cutoffs, \
+    extend_pathways, find_best_pathways, save_pathway_state, load_pathway_state
+from .pathway_costs import number_of_organisms, number_of_exchange_reactions
 from .construct_graph import create_graph
+from .compile_graph import CompiledGraph, save_compiled_graph, \
+    load_compiled_graph
 from .package_data import __version__
 from .example.run_this_example import *
\ No newline at end of file
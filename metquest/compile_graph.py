@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import struct
+import zipfile
+import numpy as np
+
+# Version of the format of the files written by save_compiled_graph
+GRAPH_FILE_VERSION = 1
+
+
+class CompiledGraph(object):
+    """
+    Integer-indexed, read-only representation of the bipartite metabolic
+    graph. Every node is assigned an integer identifier, and the adjacency
+    of the graph is stored in CSR (compressed sparse row) form, i.e., the
+    predecessors of node i are
+    ``pred_indices[pred_indptr[i]:pred_indptr[i + 1]]``.
+
+    Attributes
+    ----------
+    node_names : list
+        Symbol table mapping node identifiers to node names
+    node_ids : dict
+        Dictionary mapping node names to node identifiers
+    node_type : numpy array
+        Bipartite attribute of every node (0 metabolites, 1 reactions)
+    pred_indptr, pred_indices : numpy array
+        CSR arrays of the predecessors of every node
+    succ_indptr, succ_indices : numpy array
+        CSR arrays of the successors of every node
+    reactions : list
+        Identifiers of all reaction nodes
+    metabolites : list
+        Identifiers of all metabolite nodes
+    rxn_inputs : list
+        For every node, a frozenset of its predecessors. This is
+        the set of input metabolites for reaction nodes.
+    rxn_outputs : list
+        For every node, a tuple of its successors. This is
+        the tuple of output metabolites for reaction nodes.
+    """
+
+    def __init__(self, node_names, node_type, pred_indptr, pred_indices,
+                 succ_indptr, succ_indices):
+        self.node_names = list(node_names)
+        self.node_type = np.asarray(node_type, dtype=np.int8)
+        self.pred_indptr = np.asarray(pred_indptr, dtype=np.int64)
+        self.pred_indices = np.asarray(pred_indices, dtype=np.int64)
+        self.succ_indptr = np.asarray(succ_indptr, dtype=np.int64)
+        self.succ_indices = np.asarray(succ_indices, dtype=np.int64)
+        self.reactions = np.flatnonzero(self.node_type == 1).tolist()
+        self.metabolites = np.flatnonzero(self.node_type == 0).tolist()
+
+    def __getattr__(self, name):
+        # Python tuples are used in the innermost loops of the algorithms,
+        # since indexing numpy arrays element-wise is slower. They are
+        # derived from the arrays only when they are first used, so that
+        # graphs which are only saved or loaded do not create them.
+        if name == 'node_ids':
+            value = {nodename: idx for idx, nodename in enumerate(self.node_names)}
+        elif name == '_pred':
+            value = _split_csr(self.pred_indptr, self.pred_indices)
+        elif name == '_succ':
+            value = _split_csr(self.succ_indptr, self.succ_indices)
+        elif name == 'rxn_inputs':
+            value = [frozenset(entry) for entry in self._pred]
+        elif name == 'rxn_outputs':
+            value = self._succ
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
+    def __getstate__(self):
+        # Only the symbol table and the CSR arrays are pickled, and the
+        # remaining attributes are derived from them when unpickling
+        return {'node_names': self.node_names, 'node_type': self.node_type,
+                'pred_indptr': self.pred_indptr,
+                'pred_indices': self.pred_indices,
+                'succ_indptr': self.succ_indptr,
+                'succ_indices': self.succ_indices}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self.node_names)
+
+    def __contains__(self, name):
+        return name in self.node_ids
+
+    def predecessors(self, nodeid):
+        """Returns the identifiers of the predecessors of a node"""
+        return self._pred[nodeid]
+
+    def successors(self, nodeid):
+        """Returns the identifiers of the successors of a node"""
+        return self._succ[nodeid]
+
+    def name(self, nodeid):
+        """Returns the name of the node with the given identifier"""
+        return self.node_names[nodeid]
+
+    def ids(self, names):
+        """
+        Returns the set of identifiers of the given node names. Names
+        which are not present in the graph are ignored.
+        """
+        node_ids = self.node_ids
+        return set(node_ids[name] for name in names if name in node_ids)
+
+    def names(self, nodeids):
+        """Returns the set of names of the given node identifiers"""
+        node_names = self.node_names
+        return set(node_names[idx] for idx in nodeids)
+
+    def without_reactions(self, rxnids):
+        """
+        Returns a compiled graph in which the given reactions have no
+        edges. The node identifiers are unchanged, so that identifiers can
+        be shared between both graphs.
+
+        Parameters
+        ----------
+        rxnids : iterable
+            Identifiers of the reactions to be disconnected
+
+        Returns
+        -------
+        CompiledGraph
+            Graph without the edges of the given reactions
+        """
+        removed = np.zeros(len(self.node_names), dtype=bool)
+        removed[list(rxnids)] = True
+        if not removed.any():
+            return self
+        pred_indptr, pred_indices = _drop_from_csr(
+            self.pred_indptr, self.pred_indices, removed)
+        succ_indptr, succ_indices = _drop_from_csr(
+            self.succ_indptr, self.succ_indices, removed)
+        return CompiledGraph(self.node_names, self.node_type, pred_indptr,
+                             pred_indices, succ_indptr, succ_indices)
+
+
+def compile_graph(graph_object):
+    """
+    This function converts the bipartite NetworkX DiGraph created by
+    construct_graph into a CompiledGraph, in which nodes are integer
+    identifiers and the adjacency is stored as CSR arrays.
+
+    Parameters
+    ----------
+    graph_object : NetworkX DiGraph Object
+        Bipartite graph of the metabolic network
+
+    Returns
+    -------
+    compiled_graph : CompiledGraph
+        Integer-indexed representation of the graph
+
+    Notes
+    -----
+    Nodes are numbered in the order in which they are stored in the
+    DiGraph, and the order of the predecessors and the successors of
+    every node is retained. Hence, algorithms run on the compiled graph
+    visit the nodes in the same order as they would on the DiGraph.
+    """
+    if isinstance(graph_object, CompiledGraph):
+        return graph_object
+    node_names = list(graph_object.nodes())
+    node_ids = {name: idx for idx, name in enumerate(node_names)}
+    node_type = [attributes.get('bipartite', 0)
+                 for _, attributes in graph_object.nodes(data=True)]
+    pred_indptr, pred_indices = _adjacency_to_csr(
+        graph_object.pred, node_names, node_ids)
+    succ_indptr, succ_indices = _adjacency_to_csr(
+        graph_object.succ, node_names, node_ids)
+    return CompiledGraph(node_names, node_type, pred_indptr, pred_indices,
+                         succ_indptr, succ_indices)
+
+
+def save_compiled_graph(compiled_graph, file_name, namemap=None):
+    """
+    This function saves a compiled graph, along with the dictionary
+    mapping the adhoc reaction names to the reaction names in the models,
+    to an uncompressed .npz archive, which can be memory-mapped by
+    load_compiled_graph.
+
+    Parameters
+    ----------
+    compiled_graph : CompiledGraph
+        Compiled graph to be saved
+    file_name : str
+        Name of the file (with the extension .npz)
+    namemap : dict
+        Dictionary mapping the adhoc reaction names to reaction names in
+        the model
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    The archive contains the CSR arrays and the node types of the graph.
+    The node names, and the keys and values of the namemap, are stored as
+    string tables, i.e., the UTF-8 encoded strings joined together, and the
+    offsets at which every string starts. The predecessors of a reaction
+    in the CSR arrays are the input metabolites of the reaction.
+    """
+    if namemap is None:
+        namemap = {}
+    arrays = {'format_version': np.array([GRAPH_FILE_VERSION], dtype=np.int64),
+              'node_type': compiled_graph.node_type,
+              'pred_indptr': compiled_graph.pred_indptr,
+              'pred_indices': compiled_graph.pred_indices,
+              'succ_indptr': compiled_graph.succ_indptr,
+              'succ_indices': compiled_graph.succ_indices}
+    for table_name, strings in (('node_names', compiled_graph.node_names),
+                                ('namemap_keys', list(namemap.keys())),
+                                ('namemap_values', list(namemap.values()))):
+        arrays[table_name], arrays[table_name + '_offsets'] = _string_table(strings)
+    with open(file_name, 'wb') as filetowrite:
+        np.savez(filetowrite, **arrays)
+
+
+def load_compiled_graph(file_name, mmap_mode='r'):
+    """
+    This function loads a compiled graph and the namemap saved by
+    save_compiled_graph. Neither NetworkX nor pickle is required.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file
+    mmap_mode : str
+        Mode in which the arrays are memory-mapped ('r' for read-only, or
+        'c' for copy-on-write), as in numpy.load. If None, the arrays are
+        read into memory.
+
+    Returns
+    -------
+    compiled_graph : CompiledGraph
+        Compiled graph
+    namemap : dict
+        Dictionary mapping the adhoc reaction names to reaction names in
+        the model
+
+    Notes
+    -----
+    When the arrays are memory-mapped, the CSR arrays of the graph are not
+    copied into memory, and the pages of the file are shared by all the
+    processes which load the same file.
+    """
+    if mmap_mode is None:
+        with np.load(file_name, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+    else:
+        arrays = _memory_map_archive(file_name, mmap_mode)
+    if 'format_version' not in arrays or \
+            int(arrays['format_version'][0]) != GRAPH_FILE_VERSION:
+        raise ValueError('%s is not a compiled graph file of version %d'
+                         % (file_name, GRAPH_FILE_VERSION))
+    node_names, namemap_keys, namemap_values = [
+        _strings(arrays[table_name], arrays[table_name + '_offsets'])
+        for table_name in ('node_names', 'namemap_keys', 'namemap_values')]
+    compiled_graph = CompiledGraph(
+        node_names, arrays['node_type'], arrays['pred_indptr'],
+        arrays['pred_indices'], arrays['succ_indptr'], arrays['succ_indices'])
+    return compiled_graph, dict(zip(namemap_keys, namemap_values))
+
+
+def _string_table(strings):
+    """
+    Returns the UTF-8 encoded strings joined together as a byte array,
+    and the offsets at which every string starts and the last one ends.
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(entry) for entry in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _strings(data, offsets):
+    """
+    Returns the strings of a string table created by _string_table.
+    """
+    data = data.tobytes()
+    offsets = offsets.tolist()
+    return [data[offsets[idx]:offsets[idx + 1]].decode('utf-8')
+            for idx in range(len(offsets) - 1)]
+
+
+def _memory_map_archive(file_name, mmap_mode):
+    """
+    Memory-maps every array of an uncompressed .npz archive, which is
+    possible since every array is stored as an .npy file whose bytes are
+    contiguous in the archive.
+    """
+    arrays = {}
+    with zipfile.ZipFile(file_name) as archive, open(file_name, 'rb') as archivefile:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('%s is compressed, and cannot be memory-mapped'
+                                 % file_name)
+            # The local header of the entry is followed by the name of the
+            # entry, an extra field and the data
+            archivefile.seek(info.header_offset)
+            name_length, extra_length = struct.unpack(
+                '<HH', archivefile.read(30)[26:30])
+            archivefile.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(archivefile)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(archivefile)
+            else:
+                header = np.lib.format.read_array_header_2_0(archivefile)
+            shape, fortran_order, dtype = header
+            if dtype.hasobject:
+                raise ValueError('%s contains objects, and cannot be memory-mapped'
+                                 % file_name)
+            name = info.filename[:-len('.npy')]
+            if int(np.prod(shape)) == 0:
+                # Empty arrays cannot be memory-mapped
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(
+                    file_name, dtype=dtype, mode=mmap_mode,
+                    offset=archivefile.tell(), shape=shape,
+                    order='F' if fortran_order else 'C')
+    return arrays
+
+
+def _adjacency_to_csr(adjacency, node_names, node_ids):
+    """
+    Converts a NetworkX adjacency view into CSR index arrays.
+    """
+    indptr = [0]
+    indices = []
+    for name in node_names:
+        indices.extend(node_ids[neighbour] for neighbour in adjacency[name])
+        indptr.append(len(indices))
+    return indptr, indices
+
+
+def _split_csr(indptr, indices):
+    """
+    Splits CSR index arrays into a list of tuples, one per row.
+    """
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    return [tuple(indices[indptr[row]:indptr[row + 1]])
+            for row in range(len(indptr) - 1)]
+
+
+def _drop_from_csr(indptr, indices, removed):
+    """
+    Removes all the entries of the rows and columns marked in removed.
+    """
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    keep = ~(removed[rows] | removed[indices])
+    counts = np.bincount(rows[keep], minlength=len(indptr) - 1)
+    new_indptr = np.concatenate(([0], np.cumsum(counts)))
+    return new_indptr, indices[keep]
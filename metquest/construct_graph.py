@@ -4,104 +4,160 @@ from __future__ import absolute_import
 
 import os
 import itertools
+import multiprocessing
 import sys
-from pickle import dump
+import numpy as np
 import networkx as nx
 from metquest import fetch_reactions
+from metquest.compile_graph import CompiledGraph, save_compiled_graph
 
 
-def _create_graph_with_internal_reaction(organismsdata):
+def _internal_reactions_of_organism(organismdata):
     """
-    This function creates a NetworkX DiGraph object which consists of
-    reactions and metabolites happening inside the organisms in a community.
-    This makes use of the reaction information i.e., irreversible and
-    reversible, which is obtained from another script fetch_reactions.
+    This function returns the nodes and the edges of the internal
+    reactions of an organism, in the order in which they are added to
+    the graph. The nodes are numbered from 0 in this order, and the edges
+    are given as pairs of these local node numbers.
 
     Parameters
     ----------
-    organismsdata : dict
-        Dictionary containing the reaction information about organisms
+    organismdata : dict
+        Dictionary containing the reaction information about an organism
 
     Returns
     -------
-    G : NetworkX DiGraph Object
-        Bipartite graph consisting of internal reactions in organisms
+    node_names : list
+        Reaction nodes of the organism, followed by its metabolite nodes
+    node_type : numpy array
+        Bipartite attribute of every node (0 metabolites, 1 reactions)
+    node_index : dict
+        Dictionary mapping the node names to the local node numbers
+    edges : numpy array
+        Array of shape (2, number of edges) with the source and the target
+        of every edge between the metabolites and the reactions
     """
-    G = nx.DiGraph()
-    for modelname in organismsdata:
-        G.add_nodes_from(organismsdata[modelname]
-                         ['irreversible_rxn_no'], bipartite=1)
-        G.add_nodes_from(organismsdata[modelname]
-                         ['reversible_rxn_no'], bipartite=1)
-        G.add_nodes_from(organismsdata[modelname]
-                         ['reversible_back_rxn_no'], bipartite=1)
-        irrev_lhs_nodes = list(set(
-            [item for sublist in organismsdata[modelname]['irreversible_lhs_nodes']
-             for item in sublist]))
-        irrev_rhs_nodes = list(set(
-            [item for sublist in organismsdata[modelname]['irreversible_rhs_nodes']
-             for item in sublist]))
-        rev_lhs_nodes = list(set(
-            [item for sublist in organismsdata[modelname]['reversible_lhs_nodes']
-             for item in sublist]))
-        rev_rhs_nodes = list(set(
-            [item for sublist in organismsdata[modelname]['reversible_rhs_nodes']
-             for item in sublist]))
-        G.add_nodes_from(irrev_lhs_nodes, bipartite=0)
-        G.add_nodes_from(irrev_rhs_nodes, bipartite=0)
-        G.add_nodes_from(rev_lhs_nodes, bipartite=0)
-        G.add_nodes_from(rev_rhs_nodes, bipartite=0)
-        for irrevidx in range(len(organismsdata[modelname]['irreversible_rxn_no'])):
-            for lhsmetidx in range(len(organismsdata[modelname]['irreversible_lhs_nodes'][irrevidx])):
-                G.add_edges_from([(organismsdata[modelname]['irreversible_lhs_nodes'][irrevidx]
-                                   [lhsmetidx],
-                                   organismsdata[modelname]['irreversible_rxn_no'][irrevidx])])
-            for rhsmetidx in range(len(organismsdata[modelname]['irreversible_rhs_nodes'][irrevidx])):
-                G.add_edges_from([(organismsdata[modelname]['irreversible_rxn_no'][irrevidx],
-                                   organismsdata[modelname]['irreversible_rhs_nodes'][irrevidx][rhsmetidx])])
-        for revidx in range(len(organismsdata[modelname]['reversible_rxn_no'])):
-            for lhsmetidxrev in range(len(organismsdata[modelname]['reversible_lhs_nodes'][revidx])):
-                G.add_edges_from([(organismsdata[modelname]['reversible_lhs_nodes'][revidx]
-                                   [lhsmetidxrev],
-                                   organismsdata[modelname]['reversible_rxn_no'][revidx])])
-                G.add_edges_from([(organismsdata[modelname]['reversible_back_rxn_no'][revidx],
-                                   organismsdata[modelname]['reversible_lhs_nodes'][revidx][lhsmetidxrev])])
-            for rhsmetidxrev in range(len(organismsdata[modelname]['reversible_rhs_nodes'][revidx])):
-                G.add_edges_from([(organismsdata[modelname]['reversible_rxn_no'][revidx],
-                                   organismsdata[modelname]['reversible_rhs_nodes'][revidx][rhsmetidxrev])])
-                G.add_edges_from([(organismsdata[modelname]['reversible_rhs_nodes'][revidx]
-                                   [rhsmetidxrev],
-                                   organismsdata[modelname]['reversible_back_rxn_no'][revidx])])
-    return G
+    reaction_nodes = organismdata['irreversible_rxn_no'] + \
+        organismdata['reversible_rxn_no'] + \
+        organismdata['reversible_back_rxn_no']
+    irrev_lhs_nodes = list(set(
+        [item for sublist in organismdata['irreversible_lhs_nodes']
+         for item in sublist]))
+    irrev_rhs_nodes = list(set(
+        [item for sublist in organismdata['irreversible_rhs_nodes']
+         for item in sublist]))
+    rev_lhs_nodes = list(set(
+        [item for sublist in organismdata['reversible_lhs_nodes']
+         for item in sublist]))
+    rev_rhs_nodes = list(set(
+        [item for sublist in organismdata['reversible_rhs_nodes']
+         for item in sublist]))
+    node_index = dict.fromkeys(reaction_nodes)
+    number_of_reactions = len(node_index)
+    node_index.update(dict.fromkeys(
+        irrev_lhs_nodes + irrev_rhs_nodes + rev_lhs_nodes + rev_rhs_nodes))
+    node_names = list(node_index)
+    for nodeid, name in enumerate(node_names):
+        node_index[name] = nodeid
+    node_type = np.zeros(len(node_names), dtype=np.int8)
+    node_type[:number_of_reactions] = 1
+    sources = []
+    targets = []
+    for irrevidx, irrevrxn in enumerate(organismdata['irreversible_rxn_no']):
+        rxnid = node_index[irrevrxn]
+        for lhsmet in organismdata['irreversible_lhs_nodes'][irrevidx]:
+            sources.append(node_index[lhsmet])
+            targets.append(rxnid)
+        for rhsmet in organismdata['irreversible_rhs_nodes'][irrevidx]:
+            sources.append(rxnid)
+            targets.append(node_index[rhsmet])
+    for revidx, revrxn in enumerate(organismdata['reversible_rxn_no']):
+        rxnid = node_index[revrxn]
+        backrxnid = node_index[organismdata['reversible_back_rxn_no'][revidx]]
+        for lhsmetrev in organismdata['reversible_lhs_nodes'][revidx]:
+            metid = node_index[lhsmetrev]
+            sources.extend((metid, backrxnid))
+            targets.extend((rxnid, metid))
+        for rhsmetrev in organismdata['reversible_rhs_nodes'][revidx]:
+            metid = node_index[rhsmetrev]
+            sources.extend((rxnid, metid))
+            targets.extend((metid, backrxnid))
+    edges = np.array([sources, targets], dtype=np.int64).reshape(2, -1)
+    return node_names, node_type, node_index, edges
 
 
-def _create_graph_with_exchange_reactions(G, orgs, namemap):
+def _community_graph(orgs, internal_reactions, namemap):
     """
-    This function first identifies the common exchange metabolites
-    and the non-common exchange metabolites and adds them to the
-    DiGraph object generated above.
+    This function assembles the graph of a community from the nodes and
+    the edges of the internal reactions of every organism, and adds the
+    exchange reactions. The common exchange metabolites and the non-common
+    exchange metabolites are identified and added to the graph.
 
     Parameters
     ----------
-    G : NetworkX DiGraph Object
-        Bipartite graph of reaction network from organisms
     orgs : dict
         Dictionary consisting of irreversible, reversible and exchange
         reactions pertaining to the organisms. If more than one organism
         is used, this dictionary consists of information about all the
         organisms.
+    internal_reactions : dict
+        Nodes and edges of every organism returned by
+        _internal_reactions_of_organism
     namemap : dict
         Dictionary mapping the adhoc reaction names to reaction names in
-        the model
+        the model, to which the names of the exchange reactions are added
 
     Returns
     -------
-    G : NetworkX DiGraph Object
-        Bipartite graph consisting of internal and exchange reactions in organisms
+    node_names : list
+        Names of the nodes of the graph
+    node_type : numpy array
+        Bipartite attribute of every node (0 metabolites, 1 reactions)
+    edges : numpy array
+        Array of shape (2, number of edges) with the source and the target
+        of every edge, in the order in which they are added to the graph
     namemap : dict
-        Dictionary mapping the adhoc exchange reaction names to reaction names in
-        the model
+        Dictionary mapping the adhoc exchange reaction names to reaction
+        names in the model
+
+    Notes
+    -----
+    Every node of the internal reactions of an organism is identified by
+    the organism and its local node number, so that the nodes and edges of
+    the organisms are concatenated after offsetting the local numbers.
+    Only the nodes of the exchange reactions are looked up by name. The
+    nodes and edges are in the same order as they would be in a NetworkX
+    DiGraph to which they are added one organism at a time.
     """
+    node_names = []
+    node_types = []
+    edge_blocks = []
+    offsets = {}
+    for orgnames in orgs:
+        org_names, org_type, _, org_edges = internal_reactions[orgnames]
+        offsets[orgnames] = len(node_names)
+        node_names.extend(org_names)
+        node_types.append(org_type)
+        edge_blocks.append(org_edges + offsets[orgnames])
+    exchange_ids = {}
+    exchange_types = []
+
+    def _node_ids(names, bipartite, orgnames=None):
+        # Nodes of the exchange reactions are added if they are neither
+        # added before nor internal metabolites of the organism
+        node_index = internal_reactions[orgnames][2] if orgnames else {}
+        ids = np.empty(len(names), dtype=np.int64)
+        for pos, name in enumerate(names):
+            nodeid = exchange_ids.get(name)
+            if nodeid is None and name in node_index:
+                nodeid = node_index[name] + offsets[orgnames]
+            if nodeid is None:
+                nodeid = len(node_names)
+                exchange_ids[name] = nodeid
+                node_names.append(name)
+                exchange_types.append(bipartite)
+            ids[pos] = nodeid
+        return ids
+
     metabolite_exchanged = []
     for orgnames in orgs:
         exc_met = orgs[orgnames]['exchange_metab_nodes']
@@ -110,67 +166,81 @@ def _create_graph_with_exchange_reactions(G, orgs, namemap):
     common_exchange_metabolite = list(
         set.intersection(*list(map(set, metabolite_exchanged))))
     common_exchange_metabolite.sort()
-    #  Adding the common exchange metabolites to the graph
+    exchange_metabolites = []
     for orgnames in orgs:
-        renamed_exc_met = [orgnames + ' ' +
-                           comexcmet for comexcmet in common_exchange_metabolite]
-        number_exc_met = list(range(0, len(common_exchange_metabolite)))
-        mod_exc_rxn_number = ['Org_%s ER' %
-                              orgnames + str(num + 1) for num in number_exc_met]
-        mod_exc_rev_rxn_number = ['Org_%s ERR' %
-                                  orgnames + str(num + 1) for num in number_exc_met]
-        G.add_nodes_from(mod_exc_rxn_number, bipartite=1)
-        G.add_nodes_from(mod_exc_rev_rxn_number, bipartite=1)
-        G.add_nodes_from(common_exchange_metabolite, bipartite=0)
-        G.add_nodes_from(renamed_exc_met, bipartite=0)
-        for k in range(len(renamed_exc_met)):
-            namemap[mod_exc_rxn_number[k]] = common_exchange_metabolite[k]
-            namemap[mod_exc_rev_rxn_number[k]] = common_exchange_metabolite[k]
-            G.add_edges_from([(renamed_exc_met[k], mod_exc_rxn_number[k])])
-            G.add_edges_from(
-                [(mod_exc_rxn_number[k], common_exchange_metabolite[k])])
-            G.add_edges_from(
-                [(common_exchange_metabolite[k], mod_exc_rev_rxn_number[k])])
-            G.add_edges_from([(mod_exc_rev_rxn_number[k], renamed_exc_met[k])])
+        exchange_metabolites.append((orgnames, common_exchange_metabolite, 'ER'))
     #  Adding the non common exchange metabolites to the graph
     for orgnames in orgs:
         metitems = orgs[orgnames]['exchange_metab_nodes']
         non_common_exc_met = list(
             set(metitems) - set(common_exchange_metabolite))
         non_common_exc_met.sort()
-        renamed_non_common_exc_met = [
-            orgnames + ' ' + s for s in non_common_exc_met]
-        number_non_common_exc_met = list(range(0, len(non_common_exc_met)))
-        mod_non_common_exc_rxn_number = [
-            'Org_%s NCER' % orgnames + str(num + 1) for num in number_non_common_exc_met]
-        mod_non_common_exc_rev_rxn_number = [
-            'Org_%s NCERR' % orgnames + str(num + 1) for num in number_non_common_exc_met]
-        G.add_nodes_from(mod_non_common_exc_rxn_number, bipartite=1)
-        G.add_nodes_from(mod_non_common_exc_rev_rxn_number, bipartite=1)
-        G.add_nodes_from(non_common_exc_met, bipartite=0)
-        G.add_nodes_from(renamed_non_common_exc_met, bipartite=0)
-        for k in range(len(renamed_non_common_exc_met)):
-            namemap[mod_non_common_exc_rxn_number[k]] = non_common_exc_met[k]
-            namemap[mod_non_common_exc_rev_rxn_number[k]
-                   ] = non_common_exc_met[k]
-            G.add_edges_from(
-                [(renamed_non_common_exc_met[k], mod_non_common_exc_rxn_number[k])])
-            G.add_edges_from(
-                [(mod_non_common_exc_rxn_number[k], non_common_exc_met[k])])
-            G.add_edges_from(
-                [(non_common_exc_met[k], mod_non_common_exc_rev_rxn_number[k])])
-            G.add_edges_from(
-                [(mod_non_common_exc_rev_rxn_number[k], renamed_non_common_exc_met[k])])
-    return G, namemap
-
-
-def create_graph(path_name_with_models, no_of_orgs):
+        exchange_metabolites.append((orgnames, non_common_exc_met, 'NCER'))
+    for orgnames, exc_met, rxn_type in exchange_metabolites:
+        renamed_exc_met = [orgnames + ' ' + met for met in exc_met]
+        exc_rxn_number = ['Org_%s %s' % (orgnames, rxn_type) + str(num + 1)
+                          for num in range(len(exc_met))]
+        exc_rev_rxn_number = ['Org_%s %sR' % (orgnames, rxn_type) + str(num + 1)
+                              for num in range(len(exc_met))]
+        rxnids = _node_ids(exc_rxn_number, 1)
+        revrxnids = _node_ids(exc_rev_rxn_number, 1)
+        metids = _node_ids(exc_met, 0)
+        renamedids = _node_ids(renamed_exc_met, 0, orgnames)
+        namemap.update(zip(exc_rxn_number, exc_met))
+        namemap.update(zip(exc_rev_rxn_number, exc_met))
+        # Every exchange metabolite is transported by a pair of reactions
+        # between the organism and the common pool of metabolites
+        edge_blocks.append(np.array([
+            np.column_stack((renamedids, rxnids, metids, revrxnids)).ravel(),
+            np.column_stack((rxnids, metids, revrxnids, renamedids)).ravel()]))
+    node_type = np.concatenate(node_types + [np.array(exchange_types, dtype=np.int8)])
+    edges = np.concatenate(edge_blocks, axis=1)
+    # Edges which are added again are ignored, as in a NetworkX DiGraph
+    _, first_edges = np.unique(edges[0] * len(node_names) + edges[1],
+                               return_index=True)
+    if len(first_edges) < edges.shape[1]:
+        edges = edges[:, np.sort(first_edges)]
+    return node_names, node_type, edges, namemap
+
+
+def _compile_community_graph(node_names, node_type, edges):
+    """
+    This function creates the CompiledGraph of a community graph returned
+    by _community_graph, whose predecessors and successors are in the
+    order in which the edges are added.
+    """
+    number_of_nodes = len(node_names)
+    csr_arrays = []
+    for rows, columns in ((edges[1], edges[0]), (edges[0], edges[1])):
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(number_of_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=number_of_nodes), out=indptr[1:])
+        csr_arrays.extend((indptr, columns[order]))
+    return CompiledGraph(node_names, node_type, *csr_arrays)
+
+
+def _networkx_community_graph(node_names, node_type, edges):
+    """
+    This function creates the NetworkX DiGraph of a community graph
+    returned by _community_graph.
+    """
+    G = nx.DiGraph()
+    G.add_nodes_from((name, {'bipartite': bipartite}) for name, bipartite
+                     in zip(node_names, node_type.tolist()))
+    G.add_edges_from(zip([node_names[nodeid] for nodeid in edges[0].tolist()],
+                         [node_names[nodeid] for nodeid in edges[1].tolist()]))
+    return G
+
+
+def create_graph(path_name_with_models, no_of_orgs, n_jobs=1, sbml_reader='cobra',
+                 cache_file=None):
     """
     This function creates bipartite graph of the organisms based on the
     path provided and the number of organsisms. For instance, if a folder
     has 3 model files, and the number of organisms is 2, 3 (3C2) different
-    bipartite graphs are created. The graph objects and the dictionary
-    are saved as gpickle and pickle files respectively.
+    bipartite graphs are created. Every graph is saved along with the
+    dictionary as a compiled graph file (.npz), which can be loaded using
+    load_compiled_graph in compile_graph.
 
     Parameters
     ----------
@@ -178,41 +248,84 @@ def create_graph(path_name_with_models, no_of_orgs):
         Absolute path name of the folder containing the models.
     no_of_orgs : int
         Number of organisms to be used for creating the DiGraph.
+    n_jobs : int
+        Number of processes used to read the models, and to create and
+        save the graphs of the different combinations of organisms.
+    sbml_reader : str
+        'cobra' or 'streaming', the reader used to read the models, as in
+        segregate_reactions_from_models in fetch_reactions
+    cache_file : str
+        Library file in which the models are cached, as in
+        segregate_reactions_from_models in fetch_reactions
 
     Returns
     -------
     H : NetworkX DiGraph Object
         Bipartite graph consisting of internal and exchange reactions in organisms
+        (of the last combination of organisms)
     full_name_map : dict
         Dictionary mapping the adhoc reaction names to reaction names in
         the model
-    """
 
+    Notes
+    -----
+    The internal reactions of every organism are obtained only once, and
+    the graph of every combination is assembled from them as arrays, as
+    in _community_graph. A NetworkX DiGraph is created only for the last
+    combination, which is returned. When n_jobs is more than 1, the graphs
+    of all the combinations but the last are created and saved by a pool
+    of worker processes, while the graph of the last combination is
+    created by this process.
+    """
+    global _combination_data
     organisms_reaction_data, partial_name_map = \
-        fetch_reactions.segregate_reactions_from_models(path_name_with_models)
+        fetch_reactions.segregate_reactions_from_models(path_name_with_models,
+                                                        cache_file=cache_file,
+                                                        n_jobs=n_jobs,
+                                                        sbml_reader=sbml_reader)
     if organisms_reaction_data:
         organisms_names = list(organisms_reaction_data.keys())
         all_possible_combis = list(itertools.combinations(
             list(range(len(organisms_names))), int(no_of_orgs)))
         if all_possible_combis:
-            for ncom in range(len(all_possible_combis)):
-                file_name = ''
-                current_combination = {}
-                for numincom in range(len(all_possible_combis[ncom])):
-                    current_combination[organisms_names[all_possible_combis[ncom][numincom]]] = \
-                        organisms_reaction_data[organisms_names[all_possible_combis[ncom][numincom]]]
-                    file_name = file_name + \
-                        organisms_names[all_possible_combis[ncom]
-                                        [numincom]] + '_'
-                H = _create_graph_with_internal_reaction(current_combination)
-                H, full_name_map = _create_graph_with_exchange_reactions(
-                    H, current_combination, partial_name_map)              
-                print('Number of edges in graph', len(H.edges()))
-                print('Number of nodes in graph', len(H.nodes()))
-                if os.access(path_name_with_models, os.W_OK):
-                    with open(file_name + 'namemap' + '.pickle', 'wb') as filetodump:
-                        dump(full_name_map, filetodump)
-                    nx.write_gpickle(H, file_name + '.gpickle')
+            internal_reactions = {}
+            for modelname in organisms_names:
+                internal_reactions[modelname] = _internal_reactions_of_organism(
+                    organisms_reaction_data[modelname])
+            _combination_data = (path_name_with_models, organisms_names,
+                                 organisms_reaction_data, partial_name_map,
+                                 internal_reactions)
+            save_graph = os.access(path_name_with_models, os.W_OK)
+            other_combis = all_possible_combis[:-1]
+            if n_jobs > 1 and other_combis and \
+                    'fork' in multiprocessing.get_all_start_methods():
+                # The workers are forked, so that they share the reaction
+                # data of the organisms with this process
+                pool = multiprocessing.get_context('fork').Pool(n_jobs)
+                try:
+                    graph_sizes = pool.map_async(
+                        _create_combination_graph,
+                        [(combination, save_graph) for combination in other_combis],
+                        chunksize=1)
+                    community_graph = _build_combination_graph(all_possible_combis[-1])
+                    graph_sizes = graph_sizes.get()
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                graph_sizes = [_create_combination_graph((combination, save_graph))
+                               for combination in other_combis]
+                community_graph = _build_combination_graph(all_possible_combis[-1])
+            if save_graph:
+                _save_combination_graph(all_possible_combis[-1], community_graph)
+            node_names, node_type, edges, full_name_map = community_graph
+            H = _networkx_community_graph(node_names, node_type, edges)
+            graph_sizes.append((edges.shape[1], len(node_names)))
+            _combination_data = None
+            for number_of_edges, number_of_nodes in graph_sizes:
+                print('Number of edges in graph', number_of_edges)
+                print('Number of nodes in graph', number_of_nodes)
+                if save_graph:
                     print('Graph and namemap saved for file(s) in', path_name_with_models)
             sys.path.append(path_name_with_models)
         else:
@@ -224,3 +337,54 @@ def create_graph(path_name_with_models, no_of_orgs):
         print("Cannot create graph")
         sys.exit()
     return H, full_name_map
+
+
+# Reaction data of the organisms used by _create_combination_graph, which
+# is shared with the worker processes of create_graph
+_combination_data = None
+
+
+def _build_combination_graph(combination):
+    """
+    This function creates the bipartite graph of a combination of
+    organisms, which is given as the indices of the organisms, and returns
+    it as in _community_graph.
+    """
+    _, organisms_names, organisms_reaction_data, partial_name_map, \
+        internal_reactions = _combination_data
+    current_combination = {}
+    for orgidx in combination:
+        current_combination[organisms_names[orgidx]] = \
+            organisms_reaction_data[organisms_names[orgidx]]
+    # Every combination has its own exchange reactions, which are
+    # added to a copy of the names of the internal reactions
+    return _community_graph(current_combination, internal_reactions,
+                            dict(partial_name_map))
+
+
+def _save_combination_graph(combination, community_graph):
+    """
+    This function saves the graph and the names of the reactions of a
+    combination of organisms in the folder containing the models.
+    """
+    node_names, node_type, edges, full_name_map = community_graph
+    path_name_with_models, organisms_names = _combination_data[:2]
+    file_name = ''
+    for orgidx in combination:
+        file_name = file_name + organisms_names[orgidx] + '_'
+    save_compiled_graph(_compile_community_graph(node_names, node_type, edges),
+                        os.path.join(path_name_with_models, file_name + '.npz'),
+                        full_name_map)
+
+
+def _create_combination_graph(task):
+    """
+    This function creates the graph of a combination of organisms, saves
+    it if required, and returns the number of edges and nodes in it.
+    """
+    combination, save_graph = task
+    community_graph = _build_combination_graph(combination)
+    if save_graph:
+        _save_combination_graph(combination, community_graph)
+    node_names, _, edges, _ = community_graph
+    return edges.shape[1], len(node_names)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import time
+import tracemalloc
+import numpy as np
+from metquest import construct_graph
+
+
+def synthetic_organisms(number_of_organisms, number_of_reactions=2500,
+                        number_of_metabolites=1800, number_of_exchanges=300,
+                        seed=0):
+    """
+    This function creates the reaction data of organisms with random
+    reactions, in the same form as segregate_reactions_from_models in
+    fetch_reactions. The exchange metabolites of every organism are drawn
+    from a common pool, so that the organisms have common and non-common
+    exchange metabolites.
+
+    Parameters
+    ----------
+    number_of_organisms : int
+        Number of organisms
+    number_of_reactions : int
+        Number of internal reactions of every organism, of which a third
+        are reversible
+    number_of_metabolites : int
+        Number of metabolites of every organism
+    number_of_exchanges : int
+        Number of exchange metabolites of every organism
+    seed : int
+        Seed of the random number generator
+
+    Returns
+    -------
+    organisms_reaction_data : dict
+        Dictionary of all model data (reaction information about all the
+        organisms)
+    namemap : dict
+        Dictionary mapping the adhoc reaction names to reaction names in
+        the model
+    """
+    random_state = np.random.RandomState(seed)
+    pool = ['m%d_e' % metidx for metidx in range(2 * number_of_exchanges)]
+    organisms_reaction_data = {}
+    namemap = {}
+    for orgidx in range(number_of_organisms):
+        orgname = 'org%d' % orgidx
+        exchange_mets = sorted(random_state.choice(
+            pool, number_of_exchanges, replace=False).tolist())
+        metabolites = ['%s %s' % (orgname, metid) for metid in exchange_mets] + \
+            ['%s m%d_c' % (orgname, metidx) for metidx in
+             range(number_of_metabolites - number_of_exchanges)]
+        sides = []
+        for _ in range(number_of_reactions):
+            mets = random_state.choice(len(metabolites),
+                                       random_state.randint(2, 7), replace=False)
+            split = random_state.randint(1, len(mets))
+            sides.append(([metabolites[metidx] for metidx in mets[:split]],
+                          [metabolites[metidx] for metidx in mets[split:]]))
+        number_of_reversible = number_of_reactions // 3
+        irreversible = sides[number_of_reversible:]
+        reversible = sides[:number_of_reversible]
+        organismdata = {
+            'exchange_metab_nodes': exchange_mets,
+            'irreversible_lhs_nodes': [lhs for lhs, _ in irreversible],
+            'irreversible_rhs_nodes': [rhs for _, rhs in irreversible],
+            'reversible_lhs_nodes': [lhs for lhs, _ in reversible],
+            'reversible_rhs_nodes': [rhs for _, rhs in reversible],
+            'irreversible_rxn_no': ['Org_%s IR' % orgname + str(num + 1)
+                                    for num in range(len(irreversible))],
+            'reversible_rxn_no': ['Org_%s RR' % orgname + str(num + 1)
+                                  for num in range(len(reversible))],
+            'reversible_back_rxn_no': ['Org_%s RevBR' % orgname + str(num + 1)
+                                       for num in range(len(reversible))]}
+        for rxntype in ('irreversible_rxn_no', 'reversible_rxn_no',
+                        'reversible_back_rxn_no'):
+            for num, rxn in enumerate(organismdata[rxntype]):
+                namemap[rxn] = 'R%d' % num
+        organisms_reaction_data[orgname] = organismdata
+    return organisms_reaction_data, namemap
+
+
+def benchmark_community_graph(organism_counts=(1, 10, 50, 100, 200)):
+    """
+    This function measures the time taken and the peak memory used to
+    construct the graph of a community of synthetic organisms, for
+    different numbers of organisms. The construction is timed in two
+    steps: creating the compiled graph from the reaction data of the
+    organisms, and creating the NetworkX DiGraph of the community.
+
+    Parameters
+    ----------
+    organism_counts : tuple
+        Numbers of organisms in the communities
+
+    Returns
+    -------
+    results : list
+        For every number of organisms, a tuple with the number of
+        organisms, the number of nodes and edges, the time taken (s) and
+        the peak memory (MB) to create the compiled graph, and the time
+        taken and the peak memory to create the NetworkX DiGraph
+    """
+    results = []
+    print('Organisms\tNodes\tEdges\tCompiled graph (s)\tPeak memory (MB)'
+          '\tNetworkX graph (s)\tPeak memory (MB)')
+    for number_of_organisms in organism_counts:
+        organisms_reaction_data, namemap = synthetic_organisms(number_of_organisms)
+        tracemalloc.start()
+        tic = time.perf_counter()
+        internal_reactions = {}
+        for orgname in organisms_reaction_data:
+            internal_reactions[orgname] = \
+                construct_graph._internal_reactions_of_organism(
+                    organisms_reaction_data[orgname])
+        node_names, node_type, edges, _ = construct_graph._community_graph(
+            organisms_reaction_data, internal_reactions, dict(namemap))
+        construct_graph._compile_community_graph(node_names, node_type, edges)
+        compiled_time = time.perf_counter() - tic
+        compiled_memory = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+        tracemalloc.reset_peak()
+        tic = time.perf_counter()
+        construct_graph._networkx_community_graph(node_names, node_type, edges)
+        networkx_time = time.perf_counter() - tic
+        networkx_memory = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+        tracemalloc.stop()
+        results.append((number_of_organisms, len(node_names), edges.shape[1],
+                        compiled_time, compiled_memory, networkx_time,
+                        networkx_memory))
+        print('%d\t%d\t%d\t%.2f\t%.1f\t%.2f\t%.1f' % results[-1])
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_community_graph()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+from metquest.fetch_reactions import segregate_reactions_from_models
+
+# Models bundled with COBRA which are read by default, of which the
+# first is decompressed, so that both .xml and .xml.gz files are read
+COBRA_MODELS = ('textbook.xml.gz', 'salmonella.xml.gz')
+
+
+def check_sbml_readers(path_name=None):
+    """
+    This function reads the models in a folder using COBRA and using the
+    streaming reader in read_sbml, and checks that both readers give the
+    same data for every organism and the same names of the reactions.
+
+    Parameters
+    ----------
+    path_name : str
+        Full path name where the '.xml' (or '.xml.gz') files are. By
+        default, the models in COBRA_MODELS, which are bundled with COBRA,
+        are copied to a temporary folder, one of them as an '.xml' file
+        and the others as '.xml.gz' files.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    AssertionError
+        If the readers give different data
+
+    Notes
+    -----
+    The models are not cached, so that every model is read by both
+    readers.
+    """
+    if path_name is None:
+        temporary_dir = tempfile.mkdtemp(prefix='metquest_sbml_')
+        try:
+            _copy_cobra_models(temporary_dir)
+            return check_sbml_readers(temporary_dir)
+        finally:
+            shutil.rmtree(temporary_dir)
+    cobra_info, cobra_namemap = segregate_reactions_from_models(
+        path_name, use_cache=False, sbml_reader='cobra')
+    streaming_info, streaming_namemap = segregate_reactions_from_models(
+        path_name, use_cache=False, sbml_reader='streaming')
+    if not cobra_info:
+        raise AssertionError('No model was read from ' + path_name)
+    differences = [orgname for orgname in sorted(set(cobra_info) | set(streaming_info))
+                   if cobra_info.get(orgname) != streaming_info.get(orgname)]
+    if cobra_namemap != streaming_namemap:
+        differences.append('namemap')
+    if differences:
+        raise AssertionError('The readers give different data for ' +
+                             ', '.join(differences))
+    print('The readers give the same data for', ', '.join(sorted(cobra_info)))
+
+
+def _copy_cobra_models(path_name):
+    """
+    This function copies the models in COBRA_MODELS to a folder, and
+    decompresses the first one.
+    """
+    import cobra
+    data_dir = os.path.join(os.path.dirname(cobra.__file__), 'data')
+    for modelidx, model_file in enumerate(COBRA_MODELS):
+        source_file = os.path.join(data_dir, model_file)
+        if modelidx == 0:
+            with gzip.open(source_file, 'rb') as filetoread, \
+                    open(os.path.join(path_name, model_file[:-len('.gz')]),
+                         'wb') as filetowrite:
+                shutil.copyfileobj(filetoread, filetowrite)
+        else:
+            shutil.copy(source_file, path_name)
+
+
+if __name__ == '__main__':
+    check_sbml_readers(*sys.argv[1:2])
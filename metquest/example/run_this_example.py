@@ -30,18 +30,18 @@ def run_this_example():
     for files in listdir(data_dir):
         if files.endswith('.txt'):
             if files.startswith('seed'):
-                with open(files, 'r') as seedfile:
+                with open(join(data_dir, files), 'r') as seedfile:
                     seedmetslist = seedfile.read().splitlines()
                 seed_metabolites = set(seedmetslist)
             elif files.startswith('source'):
-                with open(files, 'r') as sourcefile:
+                with open(join(data_dir, files), 'r') as sourcefile:
                     source_metabolites = sourcefile.read().splitlines()
             elif files.startswith('target'):
-                with open(files, 'r') as targetfile:
+                with open(join(data_dir, files), 'r') as targetfile:
                     # Target metabolites can be multiple values
                     targetmetabolites = targetfile.read().splitlines()
             elif files.startswith('cutoff'):
-                with open(files, 'r') as cutofffile:
+                with open(join(data_dir, files), 'r') as cutofffile:
                     cutoff_list = cutofffile.read().splitlines()  # Cutoff can be multiple values
     for mets in source_metabolites:
         seed_metabolites.add(mets)
@@ -60,10 +60,11 @@ def run_this_example():
             break
     if metfoundingraph:
         folder_to_create = 'foo'
+        pathway_tables = pathway_assembler.find_pathways_for_cutoffs(
+            G, seed_metabolites, cutoff_list)
         for currenttarmet in targetmetabolites:  # multiple target mets
             for cutoff in cutoff_list:  # multiple cutoffs
-                pathway_table, cyclic_pathways, scope = \
-                                pathway_assembler.find_pathways(G, seed_metabolites, int(cutoff))
+                pathway_table, cyclic_pathways, scope = pathway_tables[int(cutoff)]
                 assert currenttarmet in pathway_table
                 assert len(pathway_table['iJO1366 pyr_c'][15]) == 806
                 number_of_pathways = []
@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 import os
-import sys
+import json
+import time
+import argparse
+import multiprocessing
+from contextlib import redirect_stdout
 from collections import Counter
 from itertools import combinations
-from metquest.pathway_assembler import find_pathways
+from metquest.pathway_assembler import find_pathways_for_cutoffs
 from metquest.construct_graph import create_graph
+from metquest.fetch_reactions import SBML_READERS
+from metquest.model_cache import HOME_CACHE_FILE
+from metquest.guided_bfs import forward_pass_batch
+from metquest.pathway_writer import PathwayWriter
+from metquest.pathway_archive import save_pathway_archive
+from metquest.pathway_index import build_pathway_index
+from metquest.package_data import __version__
 
 
 def write_output_to_file(pathway_table, currenttarmet, cutoff, cyclic_pathways,
@@ -43,102 +54,20 @@ def write_output_to_file(pathway_table, currenttarmet, cutoff, cyclic_pathways,
     Returns
     -------
     None
+
+    Notes
+    -----
+    The files are written by a PathwayWriter, which can also write them
+    while the pathways are found (see run_metquest_job).
     """
-    pred = G.predecessors
-    succ = G.successors
-    all_pathways_count = []
-    path_count = []
-    cyclic_pathway_count = []
-    if currenttarmet in pathway_table:
-        for plen in pathway_table[currenttarmet]:
-            all_pathways_count.append(
-                len(pathway_table[currenttarmet][plen]))
-            if plen <= int(cutoff):
-                path_count.append(
-                    len(pathway_table[currenttarmet][plen]))
-        if currenttarmet in cyclic_pathways:
-            for plen in cyclic_pathways[currenttarmet]:
-                if plen <= int(cutoff):
-                    cyclic_pathway_count.append(
-                        len(cyclic_pathways[currenttarmet][plen]))
-            cycfname = folder_to_create + 'cyclic_pathways_' + currenttarmet.replace(' ', '') + \
-                '_' + 'leq_plen_' + str(cutoff) + '.txt'
-            pathnumcount = 0
-            with open(cycfname, 'w') as filetowrite:
-                print('\nWriting cyclic pathways to a file')
-                for idx in cyclic_pathways[currenttarmet]:
-                    if idx <= int(cutoff):
-                        filetowrite.write('Path length ' +
-                                          str(idx) + '\n')
-                    for items in cyclic_pathways[currenttarmet][idx]:
-                        pathnumcount += 1
-                        filetowrite.write(
-                            str(pathnumcount) + '\n')
-                        for entities in list(items):
-                            filetowrite.write(
-                                namemap[entities] + '\t' + ' + '.join(pred(entities)) +
-                                '->' + ' + '.join(succ(entities)))
-                            filetowrite.write('\n')
-                        filetowrite.write('--------------------\n')
-
-        if int(cutoff) in pathway_table[currenttarmet]:
-            for sourcemets in source_metabolites:
-                seedfname = folder_to_create + 'branched_pathways_from_seed_' + \
-                        currenttarmet.replace(' ', '') + \
-                        '_' + 'leq_plen_' + str(cutoff) + '.txt'
-                pathnumcount = 0
-                with open(seedfname, 'w') as filetowrite:
-                    print('Writing branched pathways (from seed) to a file')
-                    for idx in pathway_table[currenttarmet]:
-                        if idx <= int(cutoff):
-                            filetowrite.write('Path length ' +
-                                              str(idx) + '\n')
-                            for items in pathway_table[currenttarmet][idx]:
-                                pathnumcount += 1
-                                filetowrite.write(
-                                    str(pathnumcount) + '\n')
-                                for entities in list(items):
-                                    filetowrite.write(
-                                        namemap[entities] + '\t' +
-                                        ' + '.join(pred(entities))
-                                        + '->' + ' + '.join(succ(entities)))
-                                    filetowrite.write('\n')
-                                filetowrite.write(
-                                    '--------------------\n')
-                            filetowrite.write('--------------------\n')
-                only_source_to_target = []
-
-                for sourcemets in source_metabolites:
-                    for idx in pathway_table[currenttarmet]:
-                        if idx <= int(cutoff):
-                            for items in pathway_table[currenttarmet][idx]:
-                                if set(succ(sourcemets)).intersection(items):
-                                    only_source_to_target.append(
-                                        list(items))
-                    if only_source_to_target:
-                        sourcefname = folder_to_create + 'branched_pathways_from_source_' + \
-                                    currenttarmet.replace(' ', '') + \
-                                    '_' + 'leq_plen_' + str(cutoff) + '.txt'
-
-                        with open(sourcefname, 'w') as filetowrite:
-                            print('Writing branched pathways (from source) to a file \n')
-                            for currentidx, listentries in enumerate(only_source_to_target):
-                                filetowrite.write(str(currentidx+1) + '\n')
-                                filetowrite.write('Path length ' +
-                                                  str(len(listentries)) + '\n')
-                                for entities in listentries:
-                                    filetowrite.write(
-                                        namemap[entities] + '\t' +
-                                        ' + '.join(pred(entities))
-                                        + '->' + ' + '.join(succ(entities)))
-                                    filetowrite.write('\n')
-                                filetowrite.write('--------------------\n')
-    else:
-        print(currenttarmet, ': Target could not be found.')
-        print('Consider changing the cut-off or the seed metabolite set')
+    writer = PathwayWriter(G, namemap, currenttarmet, cutoff,
+                           folder_to_create, source_metabolites)
+    writer.write_column(cutoff, pathway_table, cyclic_pathways)
+    writer.close()
 
 
-def find_pathways_starting_from_source(source_metabolites, pathway_table, currenttarmet, cutoff, G):
+def find_pathways_starting_from_source(source_metabolites, pathway_table, currenttarmet, cutoff, G,
+                                       pathway_index=None):
     """
     This function finds all pathways starting from the source metabolites
 
@@ -156,6 +85,9 @@ def find_pathways_starting_from_source(source_metabolites, pathway_table, curren
         Maximum pathway length cutoff
     G : NetworkX DiGraph Object
         Bipartite graph of the metabolic network
+    pathway_index : PathwayIndex
+        Inverted index of the pathways of the target, as returned by
+        build_pathway_index. It is created if it is not given.
 
     Returns
     -------
@@ -171,13 +103,15 @@ def find_pathways_starting_from_source(source_metabolites, pathway_table, curren
     most_different_paths = {}
     only_source_to_target = []
     if currenttarmet in pathway_table:
+        if pathway_index is None:
+            pathway_index = build_pathway_index(pathway_table, currenttarmet)
+        within_cutoff = pathway_index.size_bitmap(cutoff)
         for sourcemets in source_metabolites:
-            for idx in pathway_table[currenttarmet]:
-                if idx <= int(cutoff):
-                    for items in pathway_table[currenttarmet][idx]:
-                        if set(succ(sourcemets)).intersection(items):
-                            only_source_to_target.append(
-                                list(items))
+            # Pathways containing a reaction which consumes the source
+            from_source = pathway_index.containing_any(succ(sourcemets))
+            only_source_to_target.extend(
+                list(items) for items in
+                pathway_index.pathways(from_source & within_cutoff))
             if len(only_source_to_target) > 1:
                 # Sometimes there can be only one pathway producing target
                 # To find most different paths from source
@@ -266,20 +200,19 @@ def print_summary(scope, currenttarmet, pathway_table, cutoff, cyclic_pathways,
         print('Minimum number of steps to produce ',
               currenttarmet, ' : ', int(minsteps))
         # Finding essential reactions and exchange metabolites
-        all_reactions_involved = []
-        for plen in pathway_table[currenttarmet]:
-            for pathways in pathway_table[currenttarmet][plen]:
-                for reactions in pathways:
-                    all_reactions_involved.append(reactions)
+        pathway_index = build_pathway_index(pathway_table, currenttarmet)
+        all_reactions_involved = pathway_index.reaction_counts()
         exchange_candidates_inverted_dict = find_pathways_involving_exchange_mets(number_of_xml,
                                                                                   pathway_table,
                                                                                   currenttarmet,
                                                                                   seed_metabolites,
-                                                                                  namemap, G)
+                                                                                  namemap, G,
+                                                                                  pathway_index)
         most_different_paths, only_source_to_target = find_pathways_starting_from_source(source_metabolites,
                                                                                          pathway_table,
                                                                                          currenttarmet,
-                                                                                         cutoff, G)
+                                                                                         cutoff, G,
+                                                                                         pathway_index)
         # Two most different paths
         if most_different_paths:
             print('Number of branched pathways from source whose size <=',
@@ -326,8 +259,10 @@ def find_important_reactions(all_reactions_involved, currenttarmet, seed_metabol
 
     Parameters
     ----------
-    all_reactions_involved : list
-        list of all reactions found in all the pathways from source to target
+    all_reactions_involved : list or dict
+        list of all reactions found in all the pathways from source to target,
+        or the number of pathways in which every reaction is found, as given
+        by PathwayIndex.reaction_counts
     currenttarmet : str
         Current target metabolite
     seed_metabolites : set
@@ -380,7 +315,7 @@ def find_important_reactions(all_reactions_involved, currenttarmet, seed_metabol
 
 
 def find_pathways_involving_exchange_mets(number_of_xml, pathway_table, currenttarmet,
-                                          seed_metabolites, namemap, G):
+                                          seed_metabolites, namemap, G, pathway_index=None):
     """
     This function identifies the pathways producing the target metabolites,
     which involve exchange metabolites. This function prints output only when
@@ -404,6 +339,9 @@ def find_pathways_involving_exchange_mets(number_of_xml, pathway_table, currentt
         the model
     G : NetworkX DiGraph Object
         Bipartite graph of the metabolic network
+    pathway_index : PathwayIndex
+        Inverted index of the pathways of the target, as returned by
+        build_pathway_index. It is created if it is not given.
 
     Returns
     -------
@@ -414,18 +352,18 @@ def find_pathways_involving_exchange_mets(number_of_xml, pathway_table, currentt
     """
     pred = G.predecessors
     succ = G.successors
-    exchange_reactions = []
     exchange_candidates_inverted_dict = {}
     if number_of_xml > 1:
-        for plen in pathway_table[currenttarmet]:
-            for pathways in pathway_table[currenttarmet][plen]:
-                for reactions in pathways:
-                    if not set(pred(reactions)).issubset(seed_metabolites):
-                        #  'ER' is an adhoc reaction name assigned to exchange
-                        #  reactions in the models.
-                        if 'ER' in reactions:
-                            exchange_reactions.append(reactions)
-        exchange_candidates = Counter(exchange_reactions)
+        if pathway_index is None:
+            pathway_index = build_pathway_index(pathway_table, currenttarmet)
+        # Number of pathways in which every exchange reaction is found
+        exchange_candidates = Counter()
+        for reactions, count in pathway_index.reaction_counts().items():
+            if not set(pred(reactions)).issubset(seed_metabolites):
+                #  'ER' is an adhoc reaction name assigned to exchange
+                #  reactions in the models.
+                if 'ER' in reactions:
+                    exchange_candidates[reactions] = count
 
         for keys, values in exchange_candidates.items():
             exchange_candidates_inverted_dict[values] = \
@@ -486,96 +424,505 @@ def find_jaccard_between_paths(only_source_to_target):
     return jaccard_values, path_combinations
 
 
-def execute_all_codes():
+def screen_media(G, media, seed_metabolites, folder_to_create):
     """
-    This function executes all the codes including constructing graphs and executing metquest.
+    This function determines the scope of every medium in a list of media,
+    without assembling the pathways. The metabolites which can be produced
+    from every medium, along with the minimum number of steps required to
+    produce them, are written to a file.
+
+    Parameters
+    ----------
+    G : NetworkX DiGraph Object
+        Bipartite graph of the metabolic network
+    media : list
+        List of sets of metabolites present in every medium
+    seed_metabolites : set
+        Set of seed metabolites, which are added to every medium
+    folder_to_create : str
+        Name of the folder where results have to be written
+
+    Returns
+    -------
+    lower_bound : numpy array
+        Minimum number of steps required to reach every metabolite from
+        every medium (one row per medium). Metabolites which cannot be
+        reached have -1.
+    metabolites : list
+        Names of the metabolites corresponding to the columns
+    """
+    seed_sets = [seed_metabolites | medium for medium in media]
+    lower_bound, scope, metabolites = forward_pass_batch(G, seed_sets)
+    scopefname = folder_to_create + 'scope_of_media.txt'
+    with open(scopefname, 'w') as filetowrite:
+        print('Writing scope of media to a file')
+        filetowrite.write('Medium\tNumber of metabolites in scope\t' +
+                          '\t'.join(metabolites) + '\n')
+        for mediumidx in range(len(seed_sets)):
+            filetowrite.write(
+                str(mediumidx + 1) + '\t' + str(scope[mediumidx].sum()) + '\t' +
+                '\t'.join(map(str, lower_bound[mediumidx].tolist())) + '\n')
+    print('Number of media screened : ', len(seed_sets))
+    return lower_bound, metabolites
+
+
+def _parse_arguments(argv=None):
+    """
+    This function parses the command line arguments of execute_all_codes.
+
+    Parameters
+    ----------
+    argv : list
+        Arguments to parse. By default, the command line arguments
+        (sys.argv[1:]). Unknown arguments are reported as errors.
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        Parsed command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='MetQuest: Enumerating all possible biosynthetic '
+                    'pathways in metabolic networks')
+    parser.add_argument('foldername', nargs='?',
+                        help='Path containing the input folders')
+    parser.add_argument('--screen-media', action='store_true',
+                        help='Only determine the scope of every medium in the '
+                             'media file, without assembling the pathways')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='Save the pathway table after every column in '
+                             'Results/pathway_state.pickle, and resume from '
+                             'this file if it exists')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of folders evaluated at the same time')
+    parser.add_argument('--sbml-reader', choices=SBML_READERS, default='cobra',
+                        help='Read the models using COBRA, or using the '
+                             'streaming reader, which does not construct '
+                             'COBRA models')
+    parser.add_argument('--stream-pathways', action='store_true',
+                        help='Write the pathways to the files while they '
+                             'are found, instead of after the pathway '
+                             'table is filled')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write the time taken, the work done and the '
+                             'most expensive reactions of every column of '
+                             'the pathway table to Results/pathway_stats.json')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        metavar='MB',
+                        help='Maximum memory (in MB) taken by the pathways '
+                             'kept in memory. Beyond it, pathways of the '
+                             'columns already filled are spilled to a '
+                             'temporary file in the Results folder')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        metavar='SECONDS',
+                        help='Maximum time taken to find the pathways of a '
+                             'folder. Beyond it, the pathways found till '
+                             'the last column completed are written')
+    parser.add_argument('--model-cache', nargs='?', const=HOME_CACHE_FILE,
+                        default=None, metavar='FILE',
+                        help='Cache the reactions read from the models in '
+                             'this library file (by default, %s), so that '
+                             'models which have not changed are not read '
+                             'again' % HOME_CACHE_FILE)
+    parser.add_argument('--prune-to-targets', action='store_true',
+                        help='Evaluate only the reactions which can be part '
+                             'of a pathway of a target within the largest '
+                             'cutoff. This is faster, but when the number '
+                             'of pathways of a metabolite is limited, the '
+                             'pathways found may differ')
+    return parser.parse_args(argv)
+
+
+def run_metquest_job(folder_name, screen=False, checkpoint=False,
+                     sbml_reader='cobra', stream_pathways=False, profile=False,
+                     memory_budget=None, time_budget=None, model_cache=None,
+                     prune_to_targets=False):
+    """
+    This function constructs the graph of the models in a folder and
+    finds the pathways for the seed, target metabolites and cutoffs given
+    in the folder (or the scope of every medium, if screen is True). The
+    results are written to the Results folder inside the folder, along
+    with a pathway archive of all the targets for every cutoff (see
+    save_pathway_archive).
+
+    Parameters
+    ----------
+    folder_name : str
+        Path of the folder containing the models and the data files
+    screen : bool
+        If True, only the scope of every medium in the media file is
+        determined, as in screen_media
+    checkpoint : bool
+        If True, the pathway table is saved after every column, and the
+        computation resumes from the saved table if it exists
+    sbml_reader : str
+        'cobra' or 'streaming', the reader used to read the models, as in
+        segregate_reactions_from_models in fetch_reactions
+    stream_pathways : bool
+        If True, the pathways of every target are written to the files
+        while the pathway table is filled, by PathwayWriter. The pathways
+        are then written in increasing order of their sizes.
+    profile : bool
+        If True, the profile of every column of the pathway table (see
+        PathwayStats) is written to Results/pathway_stats.json
+    memory_budget : int
+        If given, the maximum number of bytes taken by the pathways in
+        memory, beyond which the pathways are spilled to a temporary file
+        in the Results folder, as in find_pathways
+    time_budget : float
+        If given, the maximum time (s) taken to find the pathways, as in
+        find_pathways. The pathways found till the last column completed
+        are then written.
+    model_cache : str
+        If given, the library file in which the models are cached, as in
+        segregate_reactions_from_models in fetch_reactions
+    prune_to_targets : bool
+        If True, only the reactions which can lead to the targets are
+        evaluated, as when targets are given to find_pathways. Since
+        maxnumpath then applies to other combinations of pathways, the
+        pathways found may differ from those found otherwise.
+
+    Returns
+    -------
+    job_summary : dict
+        Dictionary with the folder name, the outcome of the job
+        ('completed', 'not executed' or 'failed'), the error message if
+        any, the time taken for constructing the graph, finding the
+        pathways and the complete job, in seconds, and if the pathway
+        table was filled partially since the time budget was exceeded,
+        the last column completed and the reason (otherwise None)
+    """
+    folder_name = os.path.abspath(folder_name)
+    job_summary = {'folder': folder_name, 'outcome': 'failed', 'error': '',
+                   'graph_time': None, 'pathway_time': None,
+                   'total_time': None, 'last_column': None,
+                   'stop_reason': None}
+    tic = time.perf_counter()
+    try:
+        _run_job(folder_name, screen, checkpoint, sbml_reader,
+                 stream_pathways, profile, memory_budget, time_budget,
+                 model_cache, prune_to_targets, job_summary)
+    # create_graph exits if the models cannot be read
+    except (Exception, SystemExit) as error:
+        job_summary['outcome'] = 'failed'
+        job_summary['error'] = '%s: %s' % (type(error).__name__, error)
+        print('MetQuest failed for', folder_name, ':', job_summary['error'])
+    job_summary['total_time'] = time.perf_counter() - tic
+    return job_summary
+
+
+def _run_job(current_evaluation_folder, screen, checkpoint, sbml_reader,
+             stream_pathways, profile, memory_budget, time_budget,
+             model_cache, prune_to_targets, job_summary):
+    """
+    This function carries out the job of run_metquest_job, and updates
+    job_summary.
+    """
+    number_of_files_in_current_folder = os.listdir(current_evaluation_folder)
+    number_of_xml = len(
+        [filenames for filenames in number_of_files_in_current_folder if '.xml' in filenames])
+    print('Currently evaluating files in', os.path.basename(current_evaluation_folder))
+    print('Number of networks', number_of_xml)
+    tic = time.perf_counter()
+    G, namemap = create_graph(
+        current_evaluation_folder, number_of_xml, sbml_reader=sbml_reader,
+        cache_file=model_cache)
+    job_summary['graph_time'] = time.perf_counter() - tic
+    seed_metabolites = set()
+    source_metabolites = []
+    media = []
+    for files in os.listdir(current_evaluation_folder):
+        file_path = os.path.join(current_evaluation_folder, files)
+        if files.endswith('.txt'):
+            if files.startswith('seed'):
+                with open(file_path, 'r') as seedfile:
+                    seedmetslist = seedfile.read().splitlines()
+                seed_metabolites = set(seedmetslist)
+            elif files.startswith('source'):
+                with open(file_path, 'r') as sourcefile:
+                    source_metabolites = sourcefile.read().splitlines()
+            elif files.startswith('target'):
+                with open(file_path, 'r') as targetfile:
+                    # Target metabolites can be multiple values
+                    targetmetabolites = targetfile.read().splitlines()
+            elif files.startswith('cutoff'):
+                with open(file_path, 'r') as cutofffile:
+                    cutoff_list = cutofffile.read().splitlines()  # Cutoff can be multiple values
+            elif files.startswith('media'):
+                with open(file_path, 'r') as mediafile:
+                    # One medium per line, whose metabolites
+                    # are separated by tabs
+                    media = [set(line.split('\t')) for line in
+                             mediafile.read().splitlines() if line]
+    for mets in source_metabolites:
+        seed_metabolites.add(mets)
+    # Every job writes to the Results folder in its own folder
+    folder_to_create = os.path.join(current_evaluation_folder, 'Results', '')
+    if screen:
+        if not os.path.exists(folder_to_create):
+            os.makedirs(folder_to_create)
+        tic = time.perf_counter()
+        screen_media(G, media, seed_metabolites, folder_to_create)
+        job_summary['pathway_time'] = time.perf_counter() - tic
+        job_summary['outcome'] = 'completed'
+        print('\n')
+        return
+    metfoundingraph = True
+    for metabs in seed_metabolites:
+        if metabs not in G:
+            print(metabs, 'not in G. MetQuest will not be executed')
+            print('Please check the metabolite names')
+            job_summary['error'] = metabs + ' not in G'
+            metfoundingraph = False
+            break
+    for metabs in targetmetabolites:
+        if metabs not in G:
+            print(metabs, 'not in G. MetQuest will not be executed')
+            print('Please check the metabolite names')
+            job_summary['error'] = metabs + ' not in G'
+            metfoundingraph = False
+            break
+    if metfoundingraph:
+        if not os.path.exists(folder_to_create):
+            os.makedirs(folder_to_create)
+        state_file = None
+        stats_file = None
+        if profile:
+            stats_file = os.path.join(folder_to_create, 'pathway_stats.json')
+        if checkpoint:
+            state_file = os.path.join(folder_to_create,
+                                      'pathway_state.pickle')
+        writers = {}
+        pathway_callback = None
+        if stream_pathways:
+            for currenttarmet in targetmetabolites:
+                for cutoff in cutoff_list:
+                    writers[currenttarmet, cutoff] = PathwayWriter(
+                        G, namemap, currenttarmet, cutoff, folder_to_create,
+                        source_metabolites)
+
+            def pathway_callback(column, pathway_table, cyclic_pathways):
+                for writer in writers.values():
+                    writer.write_column(column, pathway_table,
+                                        cyclic_pathways)
+        tic = time.perf_counter()
+        # The pathways are found only once for all the
+        # cutoffs, since the seed metabolites are the same
+        targets = None
+        if prune_to_targets:
+            # Only the reactions which can lead to the targets
+            # are evaluated
+            targets = set(targetmetabolites)
+        pathway_tables = find_pathways_for_cutoffs(
+            G, seed_metabolites, cutoff_list, targets=targets,
+            state_file=state_file, pathway_callback=pathway_callback,
+            stats_file=stats_file, memory_budget=memory_budget,
+            spill_directory=folder_to_create, time_budget=time_budget)
+        largest_table = pathway_tables[max(int(cutoff) for cutoff in cutoff_list)][0]
+        job_summary['last_column'] = largest_table.column
+        job_summary['stop_reason'] = largest_table.stop_reason
+        for currenttarmet in targetmetabolites:  # multiple target mets
+            for cutoff in cutoff_list:  # multiple cutoffs
+                pathway_table, cyclic_pathways, scope = \
+                    pathway_tables[int(cutoff)]
+                print_summary(scope, currenttarmet, pathway_table, cutoff, cyclic_pathways,
+                              namemap, source_metabolites, seed_metabolites,
+                              number_of_xml, G)
+                writer = writers.pop((currenttarmet, cutoff), None)
+                if writer is None:
+                    write_output_to_file(pathway_table, currenttarmet, cutoff,
+                                         cyclic_pathways, folder_to_create,
+                                         namemap, source_metabolites, G)
+                else:
+                    # The columns filled before resuming from a checkpoint
+                    # are written now
+                    writer.write_column(cutoff, pathway_table, cyclic_pathways)
+                    writer.close()
+        for cutoff in dict.fromkeys(cutoff_list):
+            pathway_table, cyclic_pathways, _ = pathway_tables[int(cutoff)]
+            print('Writing pathways of all targets to a pathway archive')
+            save_pathway_archive(
+                folder_to_create + 'pathways_leq_plen_' + str(cutoff) + '.npz',
+                pathway_table, cyclic_pathways, targetmetabolites, cutoff,
+                namemap)
+        job_summary['pathway_time'] = time.perf_counter() - tic
+        job_summary['outcome'] = 'completed'
+        print('\n')
+    else:
+        job_summary['outcome'] = 'not executed'
+
+
+def _run_job_with_log(job):
+    """
+    This function runs a job in a worker process, and writes the messages
+    printed by the job to the file metquest_log.txt in the Results folder
+    of the job, so that the messages of different jobs are not mixed.
+    """
+    folder_name, screen, checkpoint, sbml_reader, stream_pathways, profile, \
+        memory_budget, time_budget, model_cache, prune_to_targets = job
+    folder_to_create = os.path.join(folder_name, 'Results')
+    if not os.path.exists(folder_to_create):
+        os.makedirs(folder_to_create)
+    with open(os.path.join(folder_to_create, 'metquest_log.txt'), 'w') as logfile:
+        with redirect_stdout(logfile):
+            job_summary = run_metquest_job(folder_name, screen, checkpoint,
+                                           sbml_reader, stream_pathways,
+                                           profile, memory_budget,
+                                           time_budget, model_cache,
+                                           prune_to_targets)
+    print('Finished', os.path.basename(folder_name), ':', job_summary['outcome'])
+    return job_summary
+
+
+def run_metquest_jobs(folder_names, jobs=1, screen=False, checkpoint=False,
+                      sbml_reader='cobra', stream_pathways=False, profile=False,
+                      memory_budget=None, time_budget=None, model_cache=None,
+                      prune_to_targets=False):
+    """
+    This function runs run_metquest_job for every folder, on a pool of
+    worker processes.
+
+    Parameters
+    ----------
+    folder_names : list
+        Paths of the folders containing the models and the data files
+    jobs : int
+        Number of jobs run at the same time. If it is 1, the jobs are run
+        one after another in this process, and if it is less than 1, the
+        number of processors is used.
+    screen : bool
+        As in run_metquest_job
+    checkpoint : bool
+        As in run_metquest_job
+    sbml_reader : str
+        As in run_metquest_job
+    stream_pathways : bool
+        As in run_metquest_job
+    profile : bool
+        As in run_metquest_job
+    memory_budget : int
+        As in run_metquest_job
+    time_budget : float
+        As in run_metquest_job, for every job
+    model_cache : str
+        As in run_metquest_job
+    prune_to_targets : bool
+        As in run_metquest_job
+
+    Returns
+    -------
+    manifest : list
+        Summary of every job returned by run_metquest_job, in the order
+        of the folders
+
+    Notes
+    -----
+    When the jobs are run on a pool, the messages printed by every job
+    are written to Results/metquest_log.txt in its folder.
+    """
+    folder_names = [os.path.abspath(folder_name) for folder_name in folder_names]
+    if jobs < 1:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        return [run_metquest_job(folder_name, screen, checkpoint, sbml_reader,
+                                 stream_pathways, profile, memory_budget,
+                                 time_budget, model_cache, prune_to_targets)
+                for folder_name in folder_names]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        manifest = pool.map(
+            _run_job_with_log,
+            [(folder_name, screen, checkpoint, sbml_reader, stream_pathways,
+              profile, memory_budget, time_budget, model_cache,
+              prune_to_targets)
+             for folder_name in folder_names],
+            chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return manifest
+
+
+def write_manifest(manifest, file_name):
+    """
+    This function writes the summary of the jobs returned by
+    run_metquest_jobs to a JSON file.
 
     Parameters
     ----------
+    manifest : list
+        Summary of every job
+    file_name : str
+        Name of the JSON file
+
+    Returns
+    -------
     None
+    """
+    with open(file_name, 'w') as filetowrite:
+        json.dump({'version': __version__, 'jobs': manifest}, filetowrite,
+                  indent=2)
+
+
+def execute_all_codes(argv=None):
+    """
+    This function executes all the codes including constructing graphs and executing metquest.
+
+    Parameters
+    ----------
+    argv : list
+        Command line arguments, such as ['Inputs', '--jobs', '4']. By
+        default, the arguments given to the program (sys.argv[1:]). Other
+        programs which call this function should give their arguments,
+        since unknown arguments are reported as errors.
 
     Returns
     -------
     None
 
+    Notes
+    -----
+    Every folder in the input folder is a job, which is run by
+    run_metquest_job. The jobs are run on a pool of --jobs processes, and
+    the outcome and the time taken by every job are written to
+    metquest_manifest.json in the input folder.
     """
-    try:
-        inputfoldername = sys.argv[1]
-    except:
+    arguments = _parse_arguments(argv)
+    inputfoldername = arguments.foldername
+    if not inputfoldername:
         inputfoldername = input('Enter folder name with all files \n')
 
     if '~' in inputfoldername:
         inputfoldername = os.path.expanduser(inputfoldername)
+    inputfoldername = os.path.abspath(inputfoldername)
     list_of_files = []
     try:
         list_of_files = next(os.walk(inputfoldername))[1]
-        if list_of_files:
-        #    list_of_files = os.listdir(inputfoldername)   
-            for foldernames in list_of_files:
-                
-                # To go through only folders
-                if os.path.isdir(os.path.join(inputfoldername, foldernames)):
-                    current_evaluation_folder = os.path.join(
-                        inputfoldername, foldernames)
-                    number_of_files_in_current_folder = os.listdir(
-                        current_evaluation_folder)
-                    number_of_xml = len(
-                        [filenames for filenames in number_of_files_in_current_folder if '.xml' in filenames])
-                    print('Currently evaluating files in', foldernames)
-                    print('Number of networks', number_of_xml)
-                    G, namemap = create_graph(
-                        current_evaluation_folder, number_of_xml)
-                    for files in os.listdir('.'):
-                        if files.endswith('.txt'):
-                            if files.startswith('seed'):
-                                with open(files, 'r') as seedfile:
-                                    seedmetslist = seedfile.read().splitlines()
-                                seed_metabolites = set(seedmetslist)
-                            elif files.startswith('source'):
-                                with open(files, 'r') as sourcefile:
-                                    source_metabolites = sourcefile.read().splitlines()
-                            elif files.startswith('target'):
-                                with open(files, 'r') as targetfile:
-                                    # Target metabolites can be multiple values
-                                    targetmetabolites = targetfile.read().splitlines()
-                            elif files.startswith('cutoff'):
-                                with open(files, 'r') as cutofffile:
-                                    cutoff_list = cutofffile.read().splitlines()  # Cutoff can be multiple values
-                    for mets in source_metabolites:
-                        seed_metabolites.add(mets)
-                    metfoundingraph = True
-                    for metabs in seed_metabolites:
-                        if metabs not in G:
-                            print(metabs, 'not in G. MetQuest will not be executed')
-                            print('Please check the metabolite names')
-                            metfoundingraph = False
-                            break
-                    for metabs in targetmetabolites:
-                        if metabs not in G:
-                            print(metabs, 'not in G. MetQuest will not be executed')
-                            print('Please check the metabolite names')
-                            metfoundingraph = False
-                            break
-                    if metfoundingraph:
-                        folder_to_create = 'Results/'
-                        if not os.path.exists(folder_to_create):
-                            os.makedirs(folder_to_create)
-                        for currenttarmet in targetmetabolites:  # multiple target mets
-                            for cutoff in cutoff_list:  # multiple cutoffs
-                                pathway_table, cyclic_pathways, scope = find_pathways(
-                                    G, seed_metabolites, int(cutoff))
-                                print_summary(scope, currenttarmet, pathway_table, cutoff, cyclic_pathways,
-                                              namemap, source_metabolites, seed_metabolites,
-                                              number_of_xml, G)
-                                write_output_to_file(pathway_table, currenttarmet, cutoff,
-                                                     cyclic_pathways, folder_to_create,
-                                                     namemap, source_metabolites, G)
-                        print('\n')
-                    os.chdir('../')
-        else:
-            print('Folder with data files not found')
-            print('Please follow the prescribed folder format')
-    except:
+    except StopIteration:
         print('Path name is incorrect. Please check the path name')
-
-        
\ No newline at end of file
+        return
+    if list_of_files:
+        # To go through only folders
+        folder_names = [os.path.join(inputfoldername, foldernames)
+                        for foldernames in list_of_files
+                        if os.path.isdir(os.path.join(inputfoldername, foldernames))]
+        memory_budget = None
+        if arguments.memory_budget is not None:
+            memory_budget = int(arguments.memory_budget * 1024 * 1024)
+        model_cache = None
+        if arguments.model_cache is not None:
+            model_cache = os.path.expanduser(arguments.model_cache)
+        manifest = run_metquest_jobs(folder_names, arguments.jobs,
+                                     arguments.screen_media,
+                                     arguments.checkpoint,
+                                     arguments.sbml_reader,
+                                     arguments.stream_pathways,
+                                     arguments.profile, memory_budget,
+                                     arguments.time_budget, model_cache,
+                                     arguments.prune_to_targets)
+        manifest_file = os.path.join(inputfoldername, 'metquest_manifest.json')
+        write_manifest(manifest, manifest_file)
+        print('Summary of the jobs written to', manifest_file)
+    else:
+        print('Folder with data files not found')
+        print('Please follow the prescribed folder format')
@@ -4,23 +4,56 @@ from __future__ import absolute_import
 
 import os
 import glob
-import cobra
+import multiprocessing
+import sqlite3
+import time
 from metquest.get_reaction_types import find_different_reaction_types
+from metquest.model_cache import ModelCache, default_cache_file, model_key
+from metquest.read_sbml import read_sbml_model
 
+# Readers which can be used to read the SBML models
+SBML_READERS = ('cobra', 'streaming')
+# Minimum size (in bytes) of the uncached model files, apart from the
+# largest one, for which the models are read by a pool of processes. The
+# largest model is read by one process in any case, and smaller models do
+# not pay for starting the pool and sending their data back.
+POOL_MIN_BYTES = 8 * 2 ** 20
 
-def segregate_reactions_from_models(path_name):
+
+def segregate_reactions_from_models(path_name, cache_file=None, use_cache=True,
+                                    n_jobs=1, sbml_reader='cobra'):
     """
     This function gets the data pertaining to the reactions and the
     metabolites from the models of multiple organisms.
-    This requires as input the pathname where the '.xml' files are located.
-    From this path, this function reads all the files using the functions
-    in the COBRA toolbox and generates the stoichiometric model for these
-    SBML models.
+    This requires as input the pathname where the '.xml' (or '.xml.gz')
+    files are located. From this path, this function reads all the files
+    using the functions in the COBRA toolbox (or the streaming reader in
+    read_sbml) and generates the stoichiometric model for these SBML models.
 
     Parameters
     ----------
     path_name : str
         full path name where the model files are
+    cache_file : str
+        Library file in which the data of the models is cached. The data
+        of a model is read from this file if the model has been read
+        before by the same reader, and the model is not read again. By
+        default, the file given by default_cache_file in model_cache is
+        used, i.e., the models are cached only if the environment variable
+        METQUEST_MODEL_CACHE is set.
+    use_cache : bool
+        If False, the models are always read, and are not cached, even if
+        a library file is given.
+    n_jobs : int
+        Maximum number of processes used to read the models which are not
+        cached. The models are read by this process if there is only one
+        processor, or if the models are too small for a pool to be faster
+        (see POOL_MIN_BYTES).
+    sbml_reader : str
+        'cobra' to read the models using COBRA, or 'streaming' to read
+        them using read_sbml_model in read_sbml, which parses only the
+        data required to construct the graph, without constructing COBRA
+        models. Both give the same data.
 
     Returns
     -------
@@ -31,89 +64,220 @@ def segregate_reactions_from_models(path_name):
         Dictionary mapping the adhoc reaction names to reaction names in
         the model
 
+    Notes
+    -----
+    The models are read by a pool of worker processes when n_jobs is more
+    than 1, and the model files which are not cached, apart from the
+    largest one, have at least POOL_MIN_BYTES bytes in all. The data of
+    the models is combined in the order of the file names, so that the
+    result does not depend on the order in which the workers finish. The
+    time taken to load every model is printed.
     """
+    if sbml_reader not in SBML_READERS:
+        raise ValueError('sbml_reader should be one of %s, not %r'
+                         % (', '.join(SBML_READERS), sbml_reader))
     all_organisms_info = {}
     namemap = {}
-    os.chdir(path_name)
-    file_names = glob.glob('*.xml')
+    # The files are read with their full path names, so that the current
+    # working directory is not changed
+    file_names = [os.path.basename(file_path) for extension in ('*.xml', '*.xml.gz')
+                  for file_path in glob.glob(os.path.join(path_name, extension))]
     if not file_names:
-        print("There are no .xml files. Please check the path")
+        print("There are no .xml or .xml.gz files. Please check the path")
     print("Filenames", file_names)
-    for model_names in file_names:
-        model = cobra.io.read_sbml_model(model_names)
-        stoi = cobra.util.array.create_stoichiometric_matrix(model)
-        if model.id:
-            current_model_name = model.id
+    cache = None
+    if cache_file is None:
+        cache_file = default_cache_file()
+    if use_cache and cache_file is not None:
+        try:
+            cache = ModelCache(cache_file)
+            print('Models are cached in', cache_file)
+        except (OSError, sqlite3.Error) as error:
+            print('Models cannot be cached in', cache_file, ':', error)
+    try:
+        models = {}
+        load_times = {}
+        keys = {}
+        if cache is not None:
+            for model_names in file_names:
+                tic = time.perf_counter()
+                keys[model_names] = model_key(os.path.join(path_name, model_names),
+                                              sbml_reader)
+                cached_model = cache.get(keys[model_names])
+                if cached_model is not None:
+                    models[model_names] = cached_model
+                    load_times[model_names] = time.perf_counter() - tic
+        models_to_read = [model_names for model_names in file_names
+                          if model_names not in models]
+        number_of_processes = _number_of_processes(path_name, models_to_read,
+                                                   n_jobs)
+        if number_of_processes > 1:
+            pool = multiprocessing.Pool(number_of_processes)
+            try:
+                models_read = pool.map(
+                    _timed_read_model,
+                    [(path_name, model_names, sbml_reader)
+                     for model_names in models_to_read],
+                    chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            print("Model ID not found; using file name instead")
-            current_model_name = model_names.split('.')[0]
-        current_organisms_info = {current_model_name: {'exchange_metab_nodes': [],
-                                                       'irreversible_lhs_nodes': [],
-                                                       'irreversible_rhs_nodes': [],
-                                                       'reversible_rhs_nodes': [],
-                                                       'reversible_lhs_nodes': [],
-                                                       'irreversible_rxn_no': [],
-                                                       'reversible_rxn_no': [],
-                                                       'total_nodes': [],
-                                                       'model_rxns': [],
-                                                       'metabolites': [],
-                                                       'exch_rxn_name': [],
-                                                       'irrev_rxn_name': [],
-                                                       'rev_rxn_name': []}}
-        rxns_in_model = []
-        mets_in_model = []
-        for metab in model.metabolites:
-            mets_in_model.append(metab.id)
-        for reac in model.reactions:
-            rxns_in_model.append(reac.id)
-        stoi_matrix = stoi.T
-        exchange_nodes, irrev_lhs_nodes, irrev_rhs_nodes, rev_lhs_nodes, rev_rhs_nodes, \
-            exc_name, irrev_rxn_name, rev_rxn_name = find_different_reaction_types(
-                stoi_matrix, model, current_model_name)
-        current_organisms_info[current_model_name][
-            'exchange_metab_nodes'] = exchange_nodes
-        current_organisms_info[current_model_name][
-            'irreversible_lhs_nodes'] = irrev_lhs_nodes
-        current_organisms_info[current_model_name][
-            'irreversible_rhs_nodes'] = irrev_rhs_nodes
-        current_organisms_info[current_model_name][
-            'reversible_lhs_nodes'] = rev_lhs_nodes
-        current_organisms_info[current_model_name][
-            'reversible_rhs_nodes'] = rev_rhs_nodes
-        current_organisms_info[current_model_name]['exch_rxn_name'] = exc_name
-        current_organisms_info[current_model_name][
-            'irrev_rxn_name'] = irrev_rxn_name
-        current_organisms_info[current_model_name][
-            'rev_rxn_name'] = rev_rxn_name
-
-        irrev_rxn_number = []
-        for num in range(len(irrev_lhs_nodes)):
-            modified_name_irrev = 'Org_%s IR' % current_model_name + str(num + 1)
-            irrev_rxn_number.append(modified_name_irrev)
-            namemap[modified_name_irrev] = irrev_rxn_name[num]
-
-        rev_rxn_number = []
-        for num in range(len(rev_lhs_nodes)):
-            modified_name_rev = 'Org_%s RR' % current_model_name + str(num + 1)
-            rev_rxn_number.append(modified_name_rev)
-            namemap[modified_name_rev] = rev_rxn_name[num]
-
-        rev_back_rxn_number = []
-        for num in range(len(rev_lhs_nodes)):
-            modified_name_back_rev = 'Org_%s RevBR' % current_model_name + \
-                str(num + 1)
-            rev_back_rxn_number.append(modified_name_back_rev)
-            namemap[modified_name_back_rev] = rev_rxn_name[num]
-
-        current_organisms_info[current_model_name][
-            'reversible_rxn_no'] = rev_rxn_number
-        current_organisms_info[current_model_name][
-            'irreversible_rxn_no'] = irrev_rxn_number
-        current_organisms_info[current_model_name]['total_nodes'] = len(
-            exchange_nodes) + len(irrev_lhs_nodes) + len(rev_lhs_nodes)
-        current_organisms_info[current_model_name]['model_rxns'] = rxns_in_model
-        current_organisms_info[current_model_name][
-            'reversible_back_rxn_no'] = rev_back_rxn_number
-        current_organisms_info[current_model_name]['metabolites'] = mets_in_model
+            models_read = [_timed_read_model((path_name, model_names, sbml_reader))
+                           for model_names in models_to_read]
+        for model_names, (model_data, timetaken) in zip(models_to_read, models_read):
+            models[model_names] = model_data
+            load_times[model_names] = timetaken
+            if cache is not None:
+                try:
+                    cache.put(keys[model_names], model_data)
+                except sqlite3.Error as error:
+                    print('Model', model_names, 'cannot be cached:', error)
+    finally:
+        if cache is not None:
+            cache.close()
+    # The models are combined in the order of the file names
+    for model_names in file_names:
+        current_organisms_info, model_namemap = models[model_names]
+        print('Time taken to load', model_names, load_times[model_names])
+        namemap.update(model_namemap)
         all_organisms_info.update(current_organisms_info)
     return all_organisms_info, namemap
+
+
+def _number_of_processes(path_name, models_to_read, n_jobs):
+    """
+    This function returns the number of processes used to read the models,
+    which is 1 if a pool of processes would not be faster.
+    """
+    number_of_processes = min(n_jobs, len(models_to_read), os.cpu_count() or 1)
+    if number_of_processes < 2:
+        return 1
+    file_sizes = sorted(os.path.getsize(os.path.join(path_name, model_names))
+                        for model_names in models_to_read)
+    if sum(file_sizes[:-1]) < POOL_MIN_BYTES:
+        print('The models are read by this process, since they are too small '
+              'for a pool of processes to be faster')
+        return 1
+    return number_of_processes
+
+
+def _timed_read_model(task):
+    """
+    This function reads a model using _read_model, and returns its data
+    along with the time taken to read it.
+    """
+    path_name, model_names, sbml_reader = task
+    tic = time.perf_counter()
+    model_data = _read_model(path_name, model_names, sbml_reader)
+    return model_data, time.perf_counter() - tic
+
+
+def _read_model(path_name, model_names, sbml_reader='cobra'):
+    """
+    This function reads an SBML model using COBRA (or the streaming
+    reader), and finds the different types of reactions in it.
+
+    Parameters
+    ----------
+    path_name : str
+        full path name where the model files are
+    model_names : str
+        Name of the model file
+    sbml_reader : str
+        'cobra' or 'streaming', as in segregate_reactions_from_models
+
+    Returns
+    -------
+    current_organisms_info : dict
+        Dictionary of the model data of the organism
+    model_namemap : dict
+        Dictionary mapping the adhoc reaction names to reaction names in
+        the model
+    """
+    model_namemap = {}
+    if sbml_reader == 'streaming':
+        model = read_sbml_model(os.path.join(path_name, model_names))
+        stoi = model.stoichiometric_matrix
+    else:
+        # COBRA is imported only when a model is read, since models which
+        # are cached or read by the streaming reader do not require it
+        import cobra
+        model = cobra.io.read_sbml_model(os.path.join(path_name, model_names))
+        # The stoichiometric matrix is built as a sparse matrix, since only
+        # a few metabolites take part in every reaction
+        stoi = cobra.util.array.create_stoichiometric_matrix(model, array_type='lil')
+    if model.id:
+        current_model_name = model.id
+    else:
+        print("Model ID not found; using file name instead")
+        current_model_name = model_names.split('.')[0]
+    current_organisms_info = {current_model_name: {'exchange_metab_nodes': [],
+                                                   'irreversible_lhs_nodes': [],
+                                                   'irreversible_rhs_nodes': [],
+                                                   'reversible_rhs_nodes': [],
+                                                   'reversible_lhs_nodes': [],
+                                                   'irreversible_rxn_no': [],
+                                                   'reversible_rxn_no': [],
+                                                   'total_nodes': [],
+                                                   'model_rxns': [],
+                                                   'metabolites': [],
+                                                   'exch_rxn_name': [],
+                                                   'irrev_rxn_name': [],
+                                                   'rev_rxn_name': []}}
+    rxns_in_model = []
+    mets_in_model = []
+    for metab in model.metabolites:
+        mets_in_model.append(metab.id)
+    for reac in model.reactions:
+        rxns_in_model.append(reac.id)
+    stoi_matrix = stoi.T.tocsr()
+    exchange_nodes, irrev_lhs_nodes, irrev_rhs_nodes, rev_lhs_nodes, rev_rhs_nodes, \
+        exc_name, irrev_rxn_name, rev_rxn_name = find_different_reaction_types(
+            stoi_matrix, model, current_model_name)
+    current_organisms_info[current_model_name][
+        'exchange_metab_nodes'] = exchange_nodes
+    current_organisms_info[current_model_name][
+        'irreversible_lhs_nodes'] = irrev_lhs_nodes
+    current_organisms_info[current_model_name][
+        'irreversible_rhs_nodes'] = irrev_rhs_nodes
+    current_organisms_info[current_model_name][
+        'reversible_lhs_nodes'] = rev_lhs_nodes
+    current_organisms_info[current_model_name][
+        'reversible_rhs_nodes'] = rev_rhs_nodes
+    current_organisms_info[current_model_name]['exch_rxn_name'] = exc_name
+    current_organisms_info[current_model_name][
+        'irrev_rxn_name'] = irrev_rxn_name
+    current_organisms_info[current_model_name][
+        'rev_rxn_name'] = rev_rxn_name
+
+    irrev_rxn_number = []
+    for num in range(len(irrev_lhs_nodes)):
+        modified_name_irrev = 'Org_%s IR' % current_model_name + str(num + 1)
+        irrev_rxn_number.append(modified_name_irrev)
+        model_namemap[modified_name_irrev] = irrev_rxn_name[num]
+
+    rev_rxn_number = []
+    for num in range(len(rev_lhs_nodes)):
+        modified_name_rev = 'Org_%s RR' % current_model_name + str(num + 1)
+        rev_rxn_number.append(modified_name_rev)
+        model_namemap[modified_name_rev] = rev_rxn_name[num]
+
+    rev_back_rxn_number = []
+    for num in range(len(rev_lhs_nodes)):
+        modified_name_back_rev = 'Org_%s RevBR' % current_model_name + \
+            str(num + 1)
+        rev_back_rxn_number.append(modified_name_back_rev)
+        model_namemap[modified_name_back_rev] = rev_rxn_name[num]
+
+    current_organisms_info[current_model_name][
+        'reversible_rxn_no'] = rev_rxn_number
+    current_organisms_info[current_model_name][
+        'irreversible_rxn_no'] = irrev_rxn_number
+    current_organisms_info[current_model_name]['total_nodes'] = len(
+        exchange_nodes) + len(irrev_lhs_nodes) + len(rev_lhs_nodes)
+    current_organisms_info[current_model_name]['model_rxns'] = rxns_in_model
+    current_organisms_info[current_model_name][
+        'reversible_back_rxn_no'] = rev_back_rxn_number
+    current_organisms_info[current_model_name]['metabolites'] = mets_in_model
+    return current_organisms_info, model_namemap
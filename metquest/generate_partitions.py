@@ -2,10 +2,14 @@
 
 from __future__ import absolute_import
 
-from itertools import product
+from functools import lru_cache
 
+# Maximum number of distinct arguments for which the partitions are cached
+PARTITION_CACHE_SIZE = 65536
 
-def generate_partitions(maximumvalue, lbnumlist, columnvalue):
+
+def generate_partitions(maximumvalue, lbnumlist, columnvalue,
+                        available_lengths=None):
     """
     This code takes as input the columnvalue (j), values of the shortest path
     of each of the metabolites (given as a list) and the sum that has to be
@@ -14,18 +18,23 @@ def generate_partitions(maximumvalue, lbnumlist, columnvalue):
     Parameters
     ----------
     maximumvalue : int
-        Maximum values which the numbers can take
+        Desired sum to be obtained
     lbnumlist : list
         a list of values pertaining to the length of shortest paths of
         every metabolite
     columnvalue : int
-        Desired sum to be obtained
-        All the partitions of numbers which will generate the desired sum
-        whose values are between the values for shortest paths and the
-        maximum values.
+        Maximum value which the numbers can take
+    available_lengths : list
+        If given, a collection of numbers for every metabolite, which are
+        the sizes of the pathways found for the metabolite. Only the
+        partitions whose numbers are all available are generated.
+
     Returns
     -------
     all_partitions : List of tuples
+        All the partitions of numbers which will generate the desired sum
+        whose values are between the values for shortest paths and the
+        maximum value, in lexicographic order.
 
     Notes
     -----
@@ -33,18 +42,83 @@ def generate_partitions(maximumvalue, lbnumlist, columnvalue):
     and the shortest path of the metabolites is 4,3 respectively, and the
     maximum sum that has to be obtained is 8, then
 
-    >>> generate_partitions(7,[4,3],8)
+    >>> generate_partitions(8, [4, 3], 7)
     [(4, 4), (5, 3)]
 
-    >>> generate_partitions(4, [2,1,1], 5)
+    >>> generate_partitions(5, [2, 1, 1], 4)
     [(2, 1, 2), (2, 2, 1), (3, 1, 1)]
 
+    >>> generate_partitions(5, [2, 1, 1], 4, [{2, 3}, {1}, {1, 2}])
+    [(2, 1, 2), (3, 1, 1)]
+
+    The numbers are chosen one at a time, and a number is tried only if
+    the remaining numbers can still add up to the rest of the sum, so that
+    only the partitions which are returned are generated. The partitions
+    for the same arguments are computed only once. When available_lengths
+    is given, the partitions are cached by the sizes available for every
+    metabolite between its lower bound and columnvalue, which do not
+    change while a column of the pathway table is filled.
+    """
+    if available_lengths is None:
+        return list(_bounded_compositions(maximumvalue, tuple(lbnumlist),
+                                          columnvalue))
+    candidates = tuple(tuple(sorted(length for length in lengths
+                                    if lbnum <= length <= columnvalue))
+                       for lbnum, lengths in zip(lbnumlist, available_lengths))
+    return list(_available_compositions(maximumvalue, candidates))
+
+
+@lru_cache(maxsize=PARTITION_CACHE_SIZE)
+def _bounded_compositions(maximumvalue, lbnumlist, columnvalue):
     """
-    all_combinations = []
-    for entry in lbnumlist:
-        all_combinations.append(list(range(entry, columnvalue + 1)))
-    all_partitions = []
-    for partitions in product(*all_combinations):
-        if sum(partitions) == maximumvalue:
-            all_partitions.append(partitions)
-    return all_partitions
+    Returns the partitions of maximumvalue whose numbers are between the
+    values in lbnumlist and columnvalue, as a tuple.
+    """
+    return tuple(_compositions(
+        maximumvalue, [range(lbnum, columnvalue + 1) for lbnum in lbnumlist]))
+
+
+@lru_cache(maxsize=PARTITION_CACHE_SIZE)
+def _available_compositions(maximumvalue, candidates):
+    """
+    Returns the partitions of maximumvalue with one number from every
+    sorted tuple of candidates, as a tuple.
+    """
+    return tuple(_compositions(maximumvalue, candidates))
+
+
+def _compositions(maximumvalue, candidates):
+    """
+    Yields the tuples with one number from every sorted list of candidates,
+    whose sum is maximumvalue, in lexicographic order.
+    """
+    if not candidates:
+        if maximumvalue == 0:
+            yield ()
+        return
+    if any(not values for values in candidates):
+        return
+    # Smallest and largest sums of the numbers after every position
+    min_rest = [0] * len(candidates)
+    max_rest = [0] * len(candidates)
+    for idx in range(len(candidates) - 2, -1, -1):
+        min_rest[idx] = min_rest[idx + 1] + candidates[idx + 1][0]
+        max_rest[idx] = max_rest[idx + 1] + candidates[idx + 1][-1]
+    last = len(candidates) - 1
+    partition = [0] * len(candidates)
+
+    def _fill(idx, remaining):
+        for value in candidates[idx]:
+            if value + min_rest[idx] > remaining:
+                break
+            if value + max_rest[idx] < remaining:
+                continue
+            partition[idx] = value
+            if idx == last:
+                yield tuple(partition)
+            else:
+                for entry in _fill(idx + 1, remaining - value):
+                    yield entry
+
+    for entry in _fill(0, maximumvalue):
+        yield entry
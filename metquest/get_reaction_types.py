@@ -3,6 +3,7 @@
 from __future__ import absolute_import
 
 import numpy as np
+from scipy import sparse
 
 
 def find_different_reaction_types(stoi_matrix, model, current_model_name):
@@ -12,8 +13,9 @@ def find_different_reaction_types(stoi_matrix, model, current_model_name):
 
     Parameters
     ----------
-    stoi_matrix : numpy array
-        full path name where the model files are
+    stoi_matrix : scipy.sparse matrix or numpy array
+        Stoichiometric matrix, whose rows are the reactions and whose
+        columns are the metabolites of the model
     model : COBRA model object
         COBRA model object created from SBML models
     current_model_name : str
@@ -41,120 +43,92 @@ def find_different_reaction_types(stoi_matrix, model, current_model_name):
 
     """
 
-    xdim = np.shape(stoi_matrix)
-    reactants_of_reaction = []
-    total_metabolites_in_reaction = []
-    products_of_reaction = []
-    number_of_reactants_in_reaction = []
-    total_number_of_metabs_in_reaction = []
-    number_of_products_in_reaction = []
-    exchange_reaction_idx = []
-    reaction_identifiers = []
-    reaction_in_model = []
-    metabolite_identifiers = []
-    for metab in model.metabolites:
-        metabolite_identifiers.append(metab.id)
-    for rxns in model.reactions:
-        reaction_identifiers.append(rxns.id)
-        reaction_in_model.append(rxns.reaction)
-    for rxnidx in range(xdim[0]):
-        reactants_of_reaction.append(np.where(stoi_matrix[rxnidx] == -1))
-        total_metabolites_in_reaction.append(np.where(stoi_matrix[rxnidx] != 0))
-        products_of_reaction.append(np.where(stoi_matrix[rxnidx] == 1))
-        number_of_reactants_in_reaction.append(len(reactants_of_reaction[rxnidx][0]))
-        total_number_of_metabs_in_reaction.append(len(total_metabolites_in_reaction[rxnidx][0]))
-        number_of_products_in_reaction.append(len(products_of_reaction[rxnidx][0]))
+    stoi_matrix = sparse.csr_matrix(stoi_matrix)
+    stoi_matrix.eliminate_zeros()
+    stoi_matrix.sort_indices()
+    number_of_reactions = stoi_matrix.shape[0]
+    metabolite_identifiers = [metab.id for metab in model.metabolites]
+    reaction_identifiers = [rxns.id for rxns in model.reactions]
+    # Row of every entry of the matrix, in the order of the CSR arrays
+    entry_rows = np.repeat(np.arange(number_of_reactions),
+                           np.diff(stoi_matrix.indptr))
+    number_of_reactants_in_reaction = np.bincount(
+        entry_rows[stoi_matrix.data == -1], minlength=number_of_reactions)
+    number_of_products_in_reaction = np.bincount(
+        entry_rows[stoi_matrix.data == 1], minlength=number_of_reactions)
+    total_number_of_metabs_in_reaction = np.diff(stoi_matrix.indptr)
 
-        # Case 1 - Presence of bulk metabolites in the medium
+    # Case 1 - Presence of bulk metabolites in the medium
+    # Assuming the bulk metabolites end in 'b'
+    bulk_reaction = np.array([rxns.reaction[-1:] == 'b' for rxns in model.reactions],
+                             dtype=bool)
+    bulk_exchange = bulk_reaction & (number_of_reactants_in_reaction == 1) & \
+        (number_of_products_in_reaction == 1)
+    # Case 2 - Presence of exchange metabolites
+    other_exchange = ~bulk_reaction & (total_number_of_metabs_in_reaction == 1) & \
+        ((number_of_reactants_in_reaction == 1) |
+         (number_of_products_in_reaction == 1))
+    exchange_reaction = bulk_exchange | other_exchange
+    exchange_rxn_ids = [reaction_identifiers[excentry] for excentry
+                        in np.flatnonzero(exchange_reaction)]
+    # The exchange metabolite is the first metabolite of the reaction. The
+    # metabolites of the bulk reactions are listed first.
+    first_metabolite = stoi_matrix.indices[stoi_matrix.indptr[:-1][exchange_reaction]]
+    exchange_met_ids = [metabolite_identifiers[metind] for metind in
+                        np.concatenate((first_metabolite[bulk_exchange[exchange_reaction]],
+                                        first_metabolite[other_exchange[exchange_reaction]]))]
+
+    rxns_lowerbound = np.array([rxns.lower_bound for rxns in model.reactions], dtype=float)
+    rxns_upperbound = np.array([rxns.upper_bound for rxns in model.reactions], dtype=float)
+    reversible_rxns = np.flatnonzero(~exchange_reaction & (rxns_lowerbound < 0) &
+                                     (rxns_upperbound >= 0))
+    irreversible_rxns = np.flatnonzero(~exchange_reaction & (rxns_lowerbound >= 0) &
+                                       (rxns_upperbound >= 0))
+    metabolite_names = np.array(["%s %s" % (current_model_name, metid)
+                                 for metid in metabolite_identifiers], dtype=object)
 
-        if reaction_in_model[rxnidx][-1] == 'b':  # Assuming the bulk metabolites end in 'b'
-            if (number_of_reactants_in_reaction[rxnidx] == 1 and
-                    number_of_products_in_reaction[rxnidx] == 1):
-                exchange_reaction_idx.append(rxnidx)
-        # Case 2 - Presence of exchange metabolites
-        elif (number_of_reactants_in_reaction[rxnidx] == 1 and
-              total_number_of_metabs_in_reaction[rxnidx] == 1):
-            exchange_reaction_idx.append(rxnidx)
-        elif (number_of_products_in_reaction[rxnidx] == 1 and
-              total_number_of_metabs_in_reaction[rxnidx] == 1):
-            exchange_reaction_idx.append(rxnidx)
-    exchange_met_ids = []
-    exchange_met_index = []
-    exchange_rxn_ids = []
-    for excentry in exchange_reaction_idx:
-        exchange_rxn_ids.append(reaction_identifiers[excentry])
-        if reaction_in_model[excentry][-1] == 'b':
-            exchange_met_ids.append(metabolite_identifiers
-                                    [np.nonzero(stoi_matrix[excentry])[0][0]])
-        else:
-            exchange_met_index.append(
-                np.nonzero(stoi_matrix[excentry])[0].tolist()[0])
-    if exchange_met_index:
-        for metind in exchange_met_index:
-            exchange_met_ids.append(metabolite_identifiers[metind])
-    all_rxn_idx = list(range(len(reaction_in_model)))
-    internal_rxns = list(set(all_rxn_idx) ^ set(exchange_reaction_idx))
-    reversible_rxns = []
-    irreversible_rxns = []
-    rxns_lowerbound = []
-    rxns_upperbound = []
-    for rxns in model.reactions:
-        rxns_lowerbound.append(rxns.lower_bound)
-        rxns_upperbound.append(rxns.upper_bound)
-    for idxint in internal_rxns:
-        if rxns_lowerbound[idxint] < 0 and rxns_upperbound[idxint] >= 0:
-            reversible_rxns.append(idxint)
-        elif rxns_lowerbound[idxint] >= 0 and rxns_upperbound[idxint] >= 0:
-            irreversible_rxns.append(idxint)
     #  Irreversible reaction nodes
-    irrev_lhs_temporary = []
-    irrev_rhs_temporary = []
-    irrev_lhs_nodes = []
-    irrev_rhs_nodes = []
-    irrev_rxn_ids = []
-    for irridx in irreversible_rxns:
-        irrev_rxn_ids.append(reaction_identifiers[irridx])
-        irrev_lhs_temporary.append(np.where(stoi_matrix[irridx] < 0)[0].tolist())
-        irrev_rhs_temporary.append(np.where(stoi_matrix[irridx] > 0)[0].tolist())
-    for lhsirridx in range(len(irrev_lhs_temporary)):
-        temp_metab_list_lhs = []
-        for met_idx_lhs in irrev_lhs_temporary[lhsirridx]:
-            met_namech_lhs = "%s %s" % (current_model_name,
-                                        metabolite_identifiers[met_idx_lhs])
-            temp_metab_list_lhs.append(met_namech_lhs)
-        irrev_lhs_nodes.append(temp_metab_list_lhs)
-    for rhsirridx in range(len(irrev_rhs_temporary)):
-        temp_metab_list_rhs = []
-        for met_idx_rhs in irrev_rhs_temporary[rhsirridx]:
-            met_namech_rhs = "%s %s" % (current_model_name,
-                                        metabolite_identifiers[met_idx_rhs])
-            temp_metab_list_rhs.append(met_namech_rhs)
-        irrev_rhs_nodes.append(temp_metab_list_rhs)
+    irrev_rxn_ids = [reaction_identifiers[irridx] for irridx in irreversible_rxns]
+    irrev_lhs_nodes, irrev_rhs_nodes = _reactants_and_products(
+        stoi_matrix, irreversible_rxns, metabolite_names)
 
     #  Reversible reaction nodes
-    rev_lhs_temporary = []
-    rev_rhs_temporary = []
-    rev_lhs_nodes = []
-    rev_rhs_nodes = []
-    rev_rxn_ids = []
-    for rridx in reversible_rxns:
-        rev_rxn_ids.append(reaction_identifiers[rridx])
-        rev_lhs_temporary.append(np.where(stoi_matrix[rridx] < 0)[0].tolist())
-        rev_rhs_temporary.append(np.where(stoi_matrix[rridx] > 0)[0].tolist())
-    for lhsrevidx in range(len(rev_lhs_temporary)):
-        temp_metab_list_lhs_rev = []
-        for met_idx_lhs in rev_lhs_temporary[lhsrevidx]:
-            met_namech_lhs = "%s %s" % (current_model_name,
-                                        metabolite_identifiers[met_idx_lhs])
-            temp_metab_list_lhs_rev.append(met_namech_lhs)
-        rev_lhs_nodes.append(temp_metab_list_lhs_rev)
-    for rhsrevidx in range(len(rev_rhs_temporary)):
-        temp_metab_list_rhs_rev = []
-        for met_idx_rhs in rev_rhs_temporary[rhsrevidx]:
-            met_namech_rhs = "%s %s" % (current_model_name,
-                                        metabolite_identifiers[met_idx_rhs])
-            temp_metab_list_rhs_rev.append(met_namech_rhs)
-        rev_rhs_nodes.append(temp_metab_list_rhs_rev)
+    rev_rxn_ids = [reaction_identifiers[rridx] for rridx in reversible_rxns]
+    rev_lhs_nodes, rev_rhs_nodes = _reactants_and_products(
+        stoi_matrix, reversible_rxns, metabolite_names)
     return exchange_met_ids, irrev_lhs_nodes, \
         irrev_rhs_nodes, rev_lhs_nodes, rev_rhs_nodes, exchange_rxn_ids, \
         irrev_rxn_ids, rev_rxn_ids
+
+
+def _reactants_and_products(stoi_matrix, rxnidx, metabolite_names):
+    """
+    This function returns the names of the reactants and the products of
+    the given reactions, from the CSR arrays of the stoichiometric matrix.
+
+    Parameters
+    ----------
+    stoi_matrix : scipy.sparse.csr_matrix
+        Stoichiometric matrix with sorted indices, whose rows are reactions
+    rxnidx : numpy array
+        Indices of the reactions
+    metabolite_names : numpy array
+        Names of the metabolites
+
+    Returns
+    -------
+    lhs_nodes : list
+        For every reaction, the list of the names of its reactants
+    rhs_nodes : list
+        For every reaction, the list of the names of its products
+    """
+    reaction_matrix = stoi_matrix[rxnidx]
+    entry_rows = np.repeat(np.arange(len(rxnidx)), np.diff(reaction_matrix.indptr))
+    nodes = []
+    for entry_mask in (reaction_matrix.data < 0, reaction_matrix.data > 0):
+        names = metabolite_names[reaction_matrix.indices[entry_mask]].tolist()
+        ends = np.cumsum(np.bincount(entry_rows[entry_mask],
+                                     minlength=len(rxnidx))).tolist()
+        starts = [0] + ends[:-1]
+        nodes.append([names[start:end] for start, end in zip(starts, ends)])
+    return nodes[0], nodes[1]
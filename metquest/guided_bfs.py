@@ -2,7 +2,9 @@
 
 from __future__ import absolute_import
 
-from collections import deque, defaultdict
+from collections import defaultdict
+import numpy as np
+from metquest.compile_graph import compile_graph as _compile_graph
 
 
 def forward_pass(graph_object, seedmets):
@@ -12,7 +14,7 @@ def forward_pass(graph_object, seedmets):
 
     Parameters
     ----------
-    graph_object : NetworkX DiGraph Object
+    graph_object : NetworkX DiGraph Object or CompiledGraph
         Bipartite graph of the metabolic network
 
     seedmets : set
@@ -21,7 +23,8 @@ def forward_pass(graph_object, seedmets):
     Returns
     -------
     lower_bound_metabolite : defaultdict
-        Minimum number of steps required to reach a metabolite
+        Number of steps at which a metabolite is produced. The minimum of
+        these is the minimum number of steps required to reach a metabolite
     status_dict : defaultdict
         Dictionary pertaining to the status of every reaction - whether it
         has been visited or not
@@ -39,66 +42,292 @@ def forward_pass(graph_object, seedmets):
     predecessors and are added to the queue. This traversal continues in a
     breadth-first manner and stops when there are no further reactions to
     be visited.
+
+    Instead of checking all the predecessors of a reaction every time one
+    of its inputs is produced, the number of inputs which are yet to be
+    produced is tracked for every reaction. A reaction is added to the
+    queue exactly once, when this count reaches zero. Hence, the traversal
+    is linear in the number of nodes and edges of the graph.
     """
-    pred = graph_object.predecessors
-    succ = graph_object.successors
-    seed_metabolite_set = seedmets.copy()
+    compiled_graph = _compile_graph(graph_object)
+    seed_ids = [compiled_graph.node_ids[seedmetabs] for seedmetabs in seedmets
+                if seedmetabs in compiled_graph]
+    lower_bound, stages, scope_ids = _forward_pass_ids(compiled_graph, seed_ids)
+    # Resolving the node identifiers to names
+    node_names = compiled_graph.node_names
+    succ = compiled_graph.rxn_outputs
     lower_bound_metabolite = defaultdict(list)
-    lower_bound_reaction = defaultdict(list)
-    # Defaultdict is used simply because to avoid initialisations
-    status_dict = defaultdict(str)
-    # Using a deque since deques have O(1) speed for appendleft() and popleft()
-    # while lists have O(n) performance for inserting and popping.
-    queue = deque([])
     # All seed metabolites are always present, hence require 0 steps
-    for seedmetabs in seed_metabolite_set:
+    for seedmetabs in seedmets:
         lower_bound_metabolite[seedmetabs].append(0)
-    stage = 1
-    scope = seed_metabolite_set.copy()
-    starting_rxn_node = []
+    # Every metabolite is reached at the stages of all the reactions
+    # producing it, which were in the queue at that stage
+    for stage, queue in enumerate(stages, 1):
+        for rxn in queue:
+            for mets in succ[rxn]:
+                stages_of_met = lower_bound_metabolite[node_names[mets]]
+                if not stages_of_met or stages_of_met[-1] != stage:
+                    stages_of_met.append(stage)
+    status_dict = defaultdict(str)
+    for rxn in _visited_reactions(lower_bound, stages):
+        status_dict[node_names[rxn]] = 'V'
+    scope = set(seedmets)
+    scope.update(compiled_graph.names(scope_ids))
+    return lower_bound_metabolite, status_dict, scope
+
+
+def _forward_pass_ids(compiled_graph, seed_ids):
+    """
+    This function carries out the Guided Breadth First Search on a
+    compiled graph. This is the implementation of forward_pass, and works
+    with node identifiers instead of node names.
+
+    Parameters
+    ----------
+    compiled_graph : CompiledGraph
+        Compiled bipartite graph of the metabolic network
+    seed_ids : list
+        Identifiers of the seed metabolites present in the graph
+
+    Returns
+    -------
+    lower_bound : numpy array
+        For every node, the first stage at which a metabolite is produced
+        or a reaction is visited. Seed metabolites have 0 and nodes which
+        cannot be reached have -1.
+    stages : list
+        List of the queues of reactions evaluated at every stage
+    scope : set
+        Identifiers of the metabolites that can be produced
+    """
+    inputs = compiled_graph.rxn_inputs
+    succ = compiled_graph.rxn_outputs
+    seed_metabolite_set = set(seed_ids)
+    # Number of inputs of every reaction which are yet to be produced
+    inputs_needed = [0] * len(compiled_graph)
+    for rxn in compiled_graph.reactions:
+        inputs_needed[rxn] = len(inputs[rxn] - seed_metabolite_set)
+    lower_bound = [-1] * len(compiled_graph)
+    # All seed metabolites are always present, hence require 0 steps
+    for seedmetabs in seed_ids:
+        lower_bound[seedmetabs] = 0
     # First stage where starting_rxn_node list contains all the reactions
     # which require only the seed metabolites as input
-    for starting_met_nodes in seed_metabolite_set:
-        # Essential when analysing mutiple networks with same seed metabolite
-        # set, although would be redundant in case of single network
-        if starting_met_nodes in graph_object:
-            for startingrxns in succ(starting_met_nodes):
-                if set(pred(startingrxns)).issubset(seed_metabolite_set):
-                    if startingrxns not in starting_rxn_node:
-                        starting_rxn_node.append(startingrxns)
-                    for metsprod in succ(startingrxns):
-                        scope.add(metsprod)
-                        if stage not in lower_bound_metabolite[metsprod]:
-                            lower_bound_metabolite[metsprod].append(stage)
-                    if stage not in lower_bound_reaction[startingrxns]:
-                        lower_bound_reaction[startingrxns].append(stage)
+    starting_rxn_node = []
+    in_queue = set()
+    for starting_met_nodes in seed_ids:
+        for startingrxns in succ[starting_met_nodes]:
+            if inputs_needed[startingrxns] == 0 and \
+                    startingrxns not in in_queue:
+                in_queue.add(startingrxns)
+                starting_rxn_node.append(startingrxns)
+    for rxn in starting_rxn_node:
+        lower_bound[rxn] = 1
+        for metsprod in succ[rxn]:
+            if lower_bound[metsprod] == -1:
+                lower_bound[metsprod] = 1
+                for nextrxn in succ[metsprod]:
+                    inputs_needed[nextrxn] -= 1
+    # The queue for the second stage also has the starting reactions which
+    # use a metabolite produced in the first stage, as in the original
+    # traversal. These are not visited again.
+    queue = []
+    in_queue = set()
     for rxn in starting_rxn_node:
-        for metabs in succ(rxn):
-            for nextrxn in succ(metabs):
-                if set(pred(nextrxn)).issubset(scope):
-                    if nextrxn not in queue:
-                        queue.append(nextrxn)
-        status_dict[rxn] = 'V'
+        for metabs in succ[rxn]:
+            for nextrxn in succ[metabs]:
+                if inputs_needed[nextrxn] == 0 and nextrxn not in in_queue:
+                    in_queue.add(nextrxn)
+                    queue.append(nextrxn)
+    stages = [starting_rxn_node]
+    stage = 1
     while queue:
         stage += 1
-        for parentrxn in list(queue):
-            if status_dict[parentrxn] == '':
-                if stage not in lower_bound_reaction[parentrxn]:
-                    lower_bound_reaction[parentrxn].append(stage)
-                for mets in succ(parentrxn):
-                    scope.add(mets)
-                    if stage not in lower_bound_metabolite[mets]:
-                        lower_bound_metabolite[mets].append(stage)
-                    for progeny in succ(mets):
-                        if set(pred(progeny)).issubset(scope):
-
-                            if status_dict[progeny] != 'V':
-                                if progeny not in queue:
-                                    queue.append(progeny)
-                status_dict[parentrxn] = 'V'
-            elif status_dict[parentrxn] == 'V':
-                for mets in succ(parentrxn):
-                    if stage not in lower_bound_metabolite[mets]:
-                        lower_bound_metabolite[mets].append(stage)
-            queue.popleft()
-    return lower_bound_metabolite, status_dict, scope
+        stages.append(queue)
+        next_queue = []
+        for parentrxn in queue:
+            if lower_bound[parentrxn] != -1:
+                continue
+            lower_bound[parentrxn] = stage
+            for mets in succ[parentrxn]:
+                if lower_bound[mets] == -1:
+                    lower_bound[mets] = stage
+                    # A reaction is added to the queue only when the
+                    # last of its inputs is produced
+                    for progeny in succ[mets]:
+                        inputs_needed[progeny] -= 1
+                        if inputs_needed[progeny] == 0:
+                            next_queue.append(progeny)
+        queue = next_queue
+    lower_bound = np.array(lower_bound, dtype=np.int64)
+    scope = set(np.flatnonzero(
+        (lower_bound >= 0) & (compiled_graph.node_type == 0)).tolist())
+    return lower_bound, stages, scope
+
+
+def _visited_reactions(lower_bound, stages):
+    """
+    Returns the reactions visited in the guided BFS, in the order in which
+    they are visited.
+    """
+    return [rxn for stage, queue in enumerate(stages, 1) for rxn in queue
+            if lower_bound[rxn] == stage]
+
+
+def _distance_to_targets(compiled_graph, target_ids, rxns_visited):
+    """
+    This function carries out a BFS from the target metabolites on the
+    reversed graph, going through only the reactions visited in the guided
+    BFS. The distance of a reaction is the minimum number of reactions,
+    including itself, which have to be carried out in succession to
+    produce a target from one of its products. The distance of a
+    metabolite is the minimum distance of the reactions consuming it, and
+    0 for the targets.
+
+    Parameters
+    ----------
+    compiled_graph : CompiledGraph
+        Compiled bipartite graph of the metabolic network
+    target_ids : iterable
+        Identifiers of the target metabolites
+    rxns_visited : iterable
+        Identifiers of the reactions visited in the guided BFS
+
+    Returns
+    -------
+    distance : list
+        Distance of every node, which is -1 for nodes from which no target
+        can be reached
+    """
+    pred = compiled_graph._pred
+    distance = [-1] * len(compiled_graph)
+    in_scope = [False] * len(compiled_graph)
+    for rxnid in rxns_visited:
+        in_scope[rxnid] = True
+    queue = []
+    for metid in target_ids:
+        if distance[metid] == -1:
+            distance[metid] = 0
+            queue.append(metid)
+    stage = 0
+    while queue:
+        stage += 1
+        next_queue = []
+        for metid in queue:
+            for rxnid in pred[metid]:
+                if in_scope[rxnid] and distance[rxnid] == -1:
+                    distance[rxnid] = stage
+                    # The inputs of the reaction are as far as the reaction
+                    for inputid in pred[rxnid]:
+                        if distance[inputid] == -1:
+                            distance[inputid] = stage
+                            next_queue.append(inputid)
+        queue = next_queue
+    return distance
+
+
+def forward_pass_batch(graph_object, seed_sets):
+    """
+    This function carries out the Guided Breadth First Search for several
+    sets of seed metabolites (for instance, different media) in a single
+    pass over the graph.
+
+    Parameters
+    ----------
+    graph_object : NetworkX DiGraph Object or CompiledGraph
+        Bipartite graph of the metabolic network
+    seed_sets : list
+        List of sets of seed metabolites
+
+    Returns
+    -------
+    lower_bound : numpy array
+        Array of shape (number of seed sets, number of metabolites) with the
+        minimum number of steps required to reach every metabolite from
+        every seed set. Metabolites which cannot be reached have -1.
+    scope : numpy array
+        Boolean array of the same shape, which is True for the metabolites
+        in the scope of every seed set
+    metabolites : list
+        Names of the metabolites corresponding to the columns
+
+    Notes
+    -----
+    Every seed set is assigned one bit, and the bits are packed into
+    64-bit words for every node. At every stage, a reaction is visited for
+    a seed set if all its input metabolites have been reached, which is
+    obtained as the bitwise AND of the words of its inputs. Metabolites are
+    reached if any of the reactions producing them are visited (bitwise OR).
+    Hence, all the seed sets are propagated together, and the lower bounds
+    are the same as the ones obtained from forward_pass for every seed set.
+    """
+    compiled_graph = _compile_graph(graph_object)
+    number_of_sets = len(seed_sets)
+    number_of_words = max(1, (number_of_sets + 63) // 64)
+    number_of_nodes = len(compiled_graph)
+    reached = np.zeros((number_of_nodes, number_of_words), dtype=np.uint64)
+    for setidx, seedmets in enumerate(seed_sets):
+        seed_ids = list(compiled_graph.ids(seedmets))
+        reached[seed_ids, setidx // 64] |= np.uint64(1 << (setidx % 64))
+    # Edges from the inputs to the reactions, and from the reactions to
+    # their products, grouped by the node they point to. Nodes without
+    # inputs are left out, since they can never be visited.
+    rxn_nodes, rxn_inputs, rxn_starts = _grouped_predecessors(
+        compiled_graph, compiled_graph.reactions)
+    met_nodes, met_producers, met_starts = _grouped_predecessors(
+        compiled_graph, compiled_graph.metabolites)
+    metabolites = np.asarray(compiled_graph.metabolites, dtype=np.int64)
+    # Lower bounds are stored with one row per metabolite while propagating
+    lower_bound = np.full((len(metabolites), number_of_sets), -1,
+                          dtype=np.int32)
+    lower_bound[_unpack_sets(reached[metabolites], number_of_sets)] = 0
+    # Position of the metabolites with producers among all metabolites
+    met_positions = np.searchsorted(metabolites, met_nodes)
+    visited = np.zeros((number_of_nodes, number_of_words), dtype=np.uint64)
+    stage = 0
+    while len(rxn_nodes) and len(met_nodes):
+        stage += 1
+        visited[rxn_nodes] = np.bitwise_and.reduceat(
+            reached[rxn_inputs], rxn_starts, axis=0)
+        produced = np.bitwise_or.reduceat(
+            visited[met_producers], met_starts, axis=0)
+        newly_reached = produced & ~reached[met_nodes]
+        if not newly_reached.any():
+            break
+        reached[met_nodes] |= newly_reached
+        changed = np.flatnonzero(newly_reached.any(axis=1))
+        rows = met_positions[changed]
+        lower_bound[rows] = np.where(
+            _unpack_sets(newly_reached[changed], number_of_sets),
+            stage, lower_bound[rows])
+    lower_bound = np.ascontiguousarray(lower_bound.T)
+    scope = lower_bound >= 0
+    return lower_bound, scope, [compiled_graph.node_names[metid]
+                                for metid in compiled_graph.metabolites]
+
+
+def _grouped_predecessors(compiled_graph, nodes):
+    """
+    Returns the nodes with at least one predecessor, the concatenated
+    predecessors of these nodes and the start of every node's group.
+    """
+    indptr = compiled_graph.pred_indptr
+    nodes = np.asarray(nodes, dtype=np.int64)
+    counts = indptr[nodes + 1] - indptr[nodes]
+    nodes = nodes[counts > 0]
+    counts = counts[counts > 0]
+    predecessors = np.concatenate(
+        [compiled_graph.pred_indices[indptr[node]:indptr[node + 1]]
+         for node in nodes.tolist()] or [np.zeros(0, dtype=np.int64)])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    return nodes, predecessors, starts
+
+
+def _unpack_sets(words, number_of_sets):
+    """
+    Unpacks the words of every node into a boolean array of shape
+    (number of nodes, number of seed sets).
+    """
+    bits = np.unpackbits(words.astype('<u8').view(np.uint8), axis=1,
+                         bitorder='little')[:, :number_of_sets]
+    return bits.astype(bool)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import os
+import hashlib
+import pickle
+import sqlite3
+import zlib
+from metquest.package_data import __version__
+
+# Name of the environment variable which can be set to the library file
+# in which the models are cached
+CACHE_ENVIRONMENT_VARIABLE = 'METQUEST_MODEL_CACHE'
+# Library file used by the command line option --model-cache when no file
+# is given
+HOME_CACHE_FILE = os.path.join('~', '.metquest', 'model_cache.sqlite')
+
+
+def default_cache_file():
+    """
+    This function returns the library file in which the models are cached
+    when no file is given, which is given by the environment variable
+    METQUEST_MODEL_CACHE. The models are not cached by default.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    cache_file : str
+        Path of the library file, or None if the environment variable is
+        not set
+    """
+    cache_file = os.environ.get(CACHE_ENVIRONMENT_VARIABLE)
+    if cache_file:
+        return os.path.expanduser(cache_file)
+    return None
+
+
+def model_key(file_name, sbml_reader='cobra'):
+    """
+    This function returns the key of a model in the cache, which is the
+    SHA-256 hash of the bytes of the SBML file, along with the version of
+    MetQuest and the reader, so that models are read again when any of
+    them changes, and the data given by one reader is never returned for
+    the other. The name of the file is also part of the key, since it is
+    used as the name of models without an identifier.
+
+    Parameters
+    ----------
+    file_name : str
+        Path of the SBML file
+    sbml_reader : str
+        Reader used to read the model, as in
+        segregate_reactions_from_models in fetch_reactions
+
+    Returns
+    -------
+    key : str
+        Key of the model
+    """
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as modelfile:
+        for block in iter(lambda: modelfile.read(1 << 20), b''):
+            file_hash.update(block)
+    return __version__ + ':' + sbml_reader + ':' + file_hash.hexdigest() + \
+        ':' + os.path.basename(file_name)
+
+
+class ModelCache(object):
+    """
+    Library of the reaction data of the models, which is stored in a
+    single SQLite file shared by all the models. Every model is stored as
+    a compressed pickle under its key, and is loaded only when it is
+    looked up.
+
+    Parameters
+    ----------
+    cache_file : str
+        Path of the library file, which is created if it does not exist
+
+    Examples
+    --------
+    >>> with ModelCache('model_cache.sqlite') as cache:
+    ...     model_data = cache.get(model_key('iJO1366.xml'))
+    """
+
+    def __init__(self, cache_file):
+        directory = os.path.dirname(os.path.abspath(cache_file))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.cache_file = cache_file
+        # The library may be used by several processes at the same time
+        self.connection = sqlite3.connect(cache_file, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS models '
+                                '(key TEXT PRIMARY KEY, data BLOB)')
+        self.connection.commit()
+
+    def get(self, key):
+        """
+        Returns the data stored for a key, or None if it is not stored.
+        """
+        row = self.connection.execute(
+            'SELECT data FROM models WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, key, data):
+        """
+        Stores the data for a key, replacing the data stored before.
+        """
+        blob = zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        self.connection.execute(
+            'INSERT OR REPLACE INTO models (key, data) VALUES (?, ?)',
+            (key, sqlite3.Binary(blob)))
+        self.connection.commit()
+
+    def __contains__(self, key):
+        return self.connection.execute(
+            'SELECT 1 FROM models WHERE key = ?', (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM models').fetchone()[0]
+
+    def close(self):
+        """Closes the library file"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
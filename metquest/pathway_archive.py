@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import numpy as np
+from metquest.compile_graph import _memory_map_archive, _string_table, _strings
+from metquest.pathway_index import PathwayIndex
+from metquest.pathway_table import pathway_sizes, pathways_of_size
+
+# Version of the pathway archive format, which is changed whenever the
+# arrays stored in the archive change
+ARCHIVE_FILE_VERSION = 1
+
+
+def save_pathway_archive(file_name, pathway_table, cyclic_pathways, targets,
+                         cutoff=None, namemap=None):
+    """
+    This function saves the branched and cyclic pathways of the target
+    metabolites to an uncompressed .npz archive, which can be
+    memory-mapped by load_pathway_archive.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file (with the extension .npz)
+    pathway_table : dict
+        Dictionary of dictionary containing the pathways of different sizes
+        identified for every metabolite. This will have only the acyclic/
+        branched pathways.
+    cyclic_pathways : dict
+        Dictionary of dictionary containing cyclic pathways of different sizes
+        identified for every metabolite.
+    targets : list
+        Target metabolites whose pathways are saved
+    cutoff : int
+        If given, only the pathways whose sizes are less than or equal to
+        the cutoff are saved
+    namemap : dict
+        Dictionary mapping the adhoc reaction names to reaction names in
+        the model
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    Every reaction in the pathways is given an identifier, and the names
+    of the reactions (along with their names in the models) are stored as
+    string tables, as in save_compiled_graph. The pathways are grouped by
+    target, type (branched or cyclic) and size, in this order. The group
+    arrays give the target, type and size of every group, and the index
+    of its first pathway, and the reactions of every pathway are stored
+    as sorted reaction identifiers, along with the offset at which every
+    pathway starts.
+    """
+    if namemap is None:
+        namemap = {}
+    if cutoff is not None:
+        cutoff = int(cutoff)
+    targets = list(dict.fromkeys(targets))
+    reaction_ids = {}
+    group_target = []
+    group_cyclic = []
+    group_length = []
+    group_offsets = [0]
+    pathway_lengths = []
+    pathway_reactions = []
+    for targetidx, currenttarmet in enumerate(targets):
+        for cyclic, table in ((0, pathway_table), (1, cyclic_pathways)):
+            if currenttarmet not in table:
+                continue
+            for plen in sorted(pathway_sizes(table, currenttarmet)):
+                if plen == 0 or (cutoff is not None and plen > cutoff):
+                    continue
+                for items in pathways_of_size(table, currenttarmet, plen):
+                    rxnids = sorted(reaction_ids.setdefault(rxn, len(reaction_ids))
+                                    for rxn in items)
+                    pathway_lengths.append(len(rxnids))
+                    pathway_reactions.extend(rxnids)
+                group_target.append(targetidx)
+                group_cyclic.append(cyclic)
+                group_length.append(plen)
+                group_offsets.append(len(pathway_lengths))
+    pathway_offsets = np.zeros(len(pathway_lengths) + 1, dtype=np.int64)
+    np.cumsum(pathway_lengths, out=pathway_offsets[1:])
+    reaction_names = list(reaction_ids)
+    arrays = {'format_version': np.array([ARCHIVE_FILE_VERSION], dtype=np.int64),
+              'group_target': np.array(group_target, dtype=np.int32),
+              'group_cyclic': np.array(group_cyclic, dtype=np.uint8),
+              'group_length': np.array(group_length, dtype=np.int32),
+              'group_offsets': np.array(group_offsets, dtype=np.int64),
+              'pathway_offsets': pathway_offsets,
+              'pathway_reactions': np.array(pathway_reactions, dtype=np.int32)}
+    for table_name, strings in (
+            ('reaction_names', reaction_names),
+            ('reaction_model_names', [namemap.get(rxn, '') for rxn in reaction_names]),
+            ('target_names', targets)):
+        arrays[table_name], arrays[table_name + '_offsets'] = _string_table(strings)
+    with open(file_name, 'wb') as filetowrite:
+        np.savez(filetowrite, **arrays)
+
+
+def load_pathway_archive(file_name, mmap_mode='r'):
+    """
+    This function loads a pathway archive saved by save_pathway_archive.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file
+    mmap_mode : str
+        Mode in which the arrays are memory-mapped, as in
+        load_compiled_graph. If None, the arrays are read into memory.
+
+    Returns
+    -------
+    pathway_archive : PathwayArchive
+        Pathway archive, which reads the pathways only when they are
+        queried
+    """
+    if mmap_mode is None:
+        with np.load(file_name, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+    else:
+        arrays = _memory_map_archive(file_name, mmap_mode)
+    if 'format_version' not in arrays or \
+            int(arrays['format_version'][0]) != ARCHIVE_FILE_VERSION:
+        raise ValueError('%s is not a pathway archive of version %d'
+                         % (file_name, ARCHIVE_FILE_VERSION))
+    return PathwayArchive(arrays)
+
+
+class PathwayArchive(object):
+    """
+    Pathways of the target metabolites loaded by load_pathway_archive.
+    Only the names of the reactions and targets and the small group arrays
+    are read when the archive is loaded, and the reactions of the pathways
+    are read from the (memory-mapped) arrays when they are queried.
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays of the archive, as saved by save_pathway_archive
+
+    Examples
+    --------
+    >>> pathway_archive = load_pathway_archive('Results/pathways_leq_plen_6.npz')
+    >>> pathway_archive.counts('iJO1366 pyr_c')
+    {2: 3, 3: 17, 4: 102, 5: 430, 6: 1220}
+    >>> pathways = pathway_archive.pathways_containing('iJO1366 pyr_c',
+    ...                                                'Org_iJO1366 IR12', 4)
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.reaction_names = _strings(arrays['reaction_names'],
+                                       arrays['reaction_names_offsets'])
+        self.reaction_model_names = _strings(arrays['reaction_model_names'],
+                                             arrays['reaction_model_names_offsets'])
+        self.targets = _strings(arrays['target_names'],
+                                arrays['target_names_offsets'])
+        self.reaction_ids = {rxn: rxnid for rxnid, rxn
+                             in enumerate(self.reaction_names)}
+        self.target_ids = {currenttarmet: targetidx for targetidx, currenttarmet
+                           in enumerate(self.targets)}
+        self.group_target = np.asarray(arrays['group_target'])
+        self.group_cyclic = np.asarray(arrays['group_cyclic']).astype(bool)
+        self.group_length = np.asarray(arrays['group_length'])
+        self.group_offsets = np.asarray(arrays['group_offsets'])
+        self.pathway_offsets = arrays['pathway_offsets']
+        self.pathway_reactions = arrays['pathway_reactions']
+
+    def __len__(self):
+        return int(self.group_offsets[-1])
+
+    def _groups(self, currenttarmet, length=None, cyclic=False):
+        """
+        Returns the indices of the groups of a target, type and size (or
+        of all sizes, if length is None).
+        """
+        if currenttarmet not in self.target_ids:
+            raise KeyError(currenttarmet)
+        selected = (self.group_target == self.target_ids[currenttarmet]) & \
+            (self.group_cyclic == bool(cyclic))
+        if length is not None:
+            selected &= self.group_length == int(length)
+        return np.flatnonzero(selected)
+
+    def counts(self, currenttarmet, cyclic=False):
+        """
+        Returns the number of pathways of every size of a target, as a
+        dictionary {pathway size: number of pathways}.
+        """
+        groups = self._groups(currenttarmet, cyclic=cyclic)
+        return {int(self.group_length[group]):
+                int(self.group_offsets[group + 1] - self.group_offsets[group])
+                for group in groups}
+
+    def pathway_ids(self, currenttarmet, length=None, cyclic=False):
+        """
+        Returns the indices of the pathways of a target, of one size or of
+        all sizes if length is None, as an array.
+        """
+        groups = self._groups(currenttarmet, length, cyclic)
+        if len(groups) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # The groups of a target and type are contiguous
+        return np.arange(self.group_offsets[groups[0]],
+                         self.group_offsets[groups[-1] + 1])
+
+    def pathway(self, pathwayidx):
+        """
+        Returns the reaction names of a pathway.
+        """
+        start, end = self.pathway_offsets[pathwayidx:pathwayidx + 2]
+        return [self.reaction_names[rxnid]
+                for rxnid in self.pathway_reactions[start:end].tolist()]
+
+    def pathways(self, currenttarmet, length=None, cyclic=False):
+        """
+        Returns the pathways of a target, of one size or of all sizes if
+        length is None, as lists of reaction names.
+        """
+        return [self.pathway(pathwayidx) for pathwayidx in
+                self.pathway_ids(currenttarmet, length, cyclic).tolist()]
+
+    def pathway_index(self, currenttarmet, length=None, cyclic=False):
+        """
+        Returns the inverted index of the pathways of a target, of one
+        size or of all sizes if length is None, whose pathways are
+        numbered in the order of pathway_ids.
+        """
+        groups = self._groups(currenttarmet, length, cyclic)
+        return PathwayIndex(self.pathways(currenttarmet, length, cyclic),
+                            np.repeat(self.group_length[groups],
+                                      np.diff(self.group_offsets)[groups]))
+
+    def pathway_ids_containing(self, currenttarmet, rxn, length=None,
+                               cyclic=False):
+        """
+        Returns the indices of the pathways of a target which contain a
+        reaction, as an array.
+        """
+        pathway_ids = self.pathway_ids(currenttarmet, length, cyclic)
+        if rxn not in self.reaction_ids or len(pathway_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        start = self.pathway_offsets[pathway_ids[0]]
+        end = self.pathway_offsets[pathway_ids[-1] + 1]
+        positions = np.flatnonzero(
+            self.pathway_reactions[start:end] == self.reaction_ids[rxn]) + start
+        return np.searchsorted(self.pathway_offsets, positions, side='right') - 1
+
+    def pathways_containing(self, currenttarmet, rxn, length=None,
+                            cyclic=False):
+        """
+        Returns the pathways of a target which contain a reaction, as lists
+        of reaction names.
+        """
+        return [self.pathway(pathwayidx) for pathwayidx in
+                self.pathway_ids_containing(currenttarmet, rxn, length,
+                                            cyclic).tolist()]
+
@@ -2,16 +2,55 @@
 
 from __future__ import absolute_import
 
+import os
 import math
+import heapq
 import itertools
+import multiprocessing
+import pickle
 import time
 from numpy import prod
-from networkx import get_node_attributes
-from metquest.guided_bfs import forward_pass
+from metquest.compile_graph import compile_graph
+from metquest.guided_bfs import _forward_pass_ids, _visited_reactions, \
+    _distance_to_targets
 from metquest.generate_partitions import generate_partitions
+from metquest.pathway_table import PathwayTable, popcount, \
+    reactions_in_pathway, pathway_mask
+from metquest.pathway_costs import pathway_size, reaction_organism, \
+    is_exchange_reaction
+from metquest.pathway_stats import PathwayStats, COUNTER_NAMES
+from metquest.pathway_store import PathwayStore
+from metquest.package_data import __version__
 
+# Pathways found by a reaction in a worker process of the parallel
+# computation, which are inserted in the table by the main process
+_recorded_pathways = None
+_added_products = None
+# Counters of the work done while the current column is filled, which
+# are recorded in the PathwayStats of the state
+_counters = dict.fromkeys(COUNTER_NAMES, 0)
+# Keyword options of find_pathways, along with their default values, which
+# are shared by find_pathways_for_cutoffs, extend_pathways and
+# find_best_pathways (see _fill_options)
+FILL_OPTIONS = {'targets': None, 'state_file': None, 'n_jobs': 1,
+                'pathway_callback': None, 'return_stats': False,
+                'stats_file': None, 'memory_budget': None,
+                'spill_directory': None, 'time_budget': None,
+                'max_pathways': None, 'max_product_tuples': None,
+                'progress_callback': None, 'source_metabolites': None,
+                'forbidden_reactions': None, 'max_exchange_reactions': None,
+                'allowed_organisms': None}
+# Options which constrain the pathways (see _constraints)
+CONSTRAINT_OPTIONS = ('source_metabolites', 'forbidden_reactions',
+                      'max_exchange_reactions', 'allowed_organisms')
+# The targets and the constraints of a state are fixed when it is created
+EXTEND_OPTIONS = tuple(option_name for option_name in FILL_OPTIONS
+                       if option_name != 'targets' and
+                       option_name not in CONSTRAINT_OPTIONS)
+BEST_PATHWAY_OPTIONS = ('state_file', 'n_jobs') + CONSTRAINT_OPTIONS
 
-def find_pathways(G, seed_mets_input, path_len_cutoff, *args):
+
+def find_pathways(G, seed_mets_input, path_len_cutoff, *args, **options):
     """
     This function tries to identify pathways between a set of seed and
     target metabolites of a given size cut-off.
@@ -33,97 +72,1234 @@ def find_pathways(G, seed_mets_input, path_len_cutoff, *args):
         this combination will not be evaluated, provided C has been
         already found.
         By default, it is set to 1000
+    **options
+        Keyword options, which are given below, along with their default
+        values in FILL_OPTIONS
+    targets : set
+        If given, the table is filled only with the reactions which can
+        be part of a pathway of size at most path_len_cutoff producing
+        one of these target metabolites. The pathways of the targets are
+        complete till path_len_cutoff, but the entries of the other
+        metabolites are not.
+    state_file : str
+        If given, the state of the pathway assembler is saved to this file
+        after every column of the table is filled. If the file already
+        exists and was saved for the same graph, seed metabolites,
+        maxnumpath, targets and constraints, the computation resumes from
+        the last column saved, for instance, after a run has crashed.
+    n_jobs : int
+        Number of processes used to fill every column of the table. All
+        the processors are used if it is less than 1. The table is the
+        same for any number of processes.
+    pathway_callback : callable
+        If given, it is called after every column of the table is filled
+        as pathway_callback(column, pathway_table, cyclic_pathways), with
+        the index of the column and the tables filled so far. The
+        pathways of sizes up to the column do not change after the
+        column is filled, and hence, they can be used at once, for
+        instance, to write them to a file (see PathwayWriter).
+    return_stats : bool
+        If True, the profile of every column filled (see PathwayStats) is
+        returned as well.
+    stats_file : str
+        If given, the profile of every column is written to this JSON file.
+    memory_budget : int
+        If given, the maximum number of bytes taken by the pathways kept in
+        memory. When the table exceeds it after a column is filled, the
+        pathways of the largest finished cells are spilled to a file (see
+        PathwayStore), and are read back from the file when they are used.
+        The table is the same for any budget.
+    spill_directory : str
+        Directory of the file to which the pathways are spilled. By
+        default, the directory of the temporary files.
+    time_budget : float
+        If given, the maximum time (s) taken to fill the table.
+    max_pathways : int
+        If given, the maximum number of pathways in the table.
+    max_product_tuples : int
+        If given, the maximum number of tuples of pathways examined (see
+        PathwayStats) to fill the table.
+    progress_callback : callable
+        If given, it is called after every reaction is evaluated as
+        progress_callback(column, reaction, reactions_evaluated,
+        number_of_reactions), with the index of the column being filled,
+        the name of the reaction, and the number of reactions of the
+        column evaluated so far and in all.
+    source_metabolites : list
+        If given, only the pathways containing a reaction which consumes
+        one of these metabolites (such as a source) are returned.
+    forbidden_reactions : list
+        Reactions which are not part of any pathway, as if they were
+        deleted from the graph
+    max_exchange_reactions : int
+        If given, the maximum number of exchange reactions (ER or NCER,
+        see pathway_costs) in a pathway
+    allowed_organisms : list
+        If given, only the reactions of these organisms are part of the
+        pathways
 
     Returns
     -------
-    pathway_table : dict
+    pathway_table : PathwayTable
         Dictionary of dictionary containing the pathways of different sizes
         identified for every metabolite. This will have only the acyclic/
         branched pathways.
-    cyclic_pathways : dict
+    cyclic_pathways : PathwayTable
         Dictionary of dictionary containing cyclic pathways of different sizes
         identified for every metabolite.
     scope : set
         Set of metabolites which can be synthesised
+    stats : PathwayStats
+        Profile of every column filled, returned only if return_stats is
+        True
+
+    Notes
+    -----
+    The budgets are checked after every reaction is evaluated. When one
+    of them is exceeded, the pathways found in the current column are
+    removed, and the table at the last column filled completely is
+    returned, which is the same as the table returned for this column as
+    the cut-off. The column and the name of the budget exceeded are
+    recorded in the column and stop_reason attributes of the tables
+    returned.
+
+    The constraints are enforced while the table is filled. Forbidden
+    reactions and the reactions of the other organisms are removed from
+    the compiled graph before the guided BFS, and pathways with more
+    exchange reactions than allowed are discarded as soon as they are
+    formed, since the pathways built from them have these exchange
+    reactions as well. A pathway which does not consume a source
+    metabolite may still be part of a larger pathway which does, and
+    hence, this constraint is applied to the pathways returned.
+
+    Internally, every pathway is stored as a bitmask of the identifiers of
+    its reactions in the compiled graph, and the pathways of every size are
+    stored in a dictionary, so that duplicate pathways are found in
+    constant time. The tables returned are read-only views, which give
+    the reaction names of the pathways of a metabolite when it is looked up.
+
+    When targets are given, a BFS from the targets on the reversed graph
+    finds the minimum number of reactions needed to produce a target from
+    the products of every reaction in the scope. Every pathway through a
+    reaction has at least as many reactions as the step at which the
+    reaction is first carried out in the guided BFS, and each further
+    reaction leading to the target adds a new reaction, since pathways
+    containing a reaction which consumes a metabolite produced earlier are
+    cyclic. Reactions for which this sum exceeds path_len_cutoff are not
+    evaluated. Note that maxnumpath is applied to the combinations of the
+    reactions which are evaluated, and hence, when it limits the
+    combinations evaluated, the pathways may differ from those found
+    without targets.
+    """
+
+    tic = time.perf_counter()
+    maxnumpath, options = _fill_options('find_pathways', args, options)
+    state = _prepare_state(G, seed_mets_input, maxnumpath,
+                           options['state_file'], [path_len_cutoff],
+                           options['targets'], _constraints(options))
+    # For filling values from the second column
+    _fill_table(state, path_len_cutoff, [], options, tic)
+    if options['return_stats']:
+        return _views_at(state, path_len_cutoff) + (state['stats'],)
+    return _views_at(state, path_len_cutoff)
+
+
+def find_pathways_for_cutoffs(G, seed_mets_input, cutoffs, *args, **options):
     """
+    This function identifies pathways between a set of seed and target
+    metabolites for several size cut-offs at once. The pathway table is
+    filled only once, up to the largest cut-off, and the tables of the
+    smaller cut-offs are obtained from it.
+
+    Parameters
+    ----------
+    G : NetworkX DiGraph Object
+        Bipartite graph of the metabolic network
+    seed_mets_input : set
+        Set of seed metabolites including the source
+    cutoffs : list
+        List of maximum sizes of the pathways
+    *args
+        Maximum number of pathways (maxnumpath), as in find_pathways
+    **options
+        Keyword options of find_pathways. When targets are given, the
+        reactions are chosen for the largest cut-off.
+
+    Returns
+    -------
+    pathway_tables : dict
+        Dictionary mapping every cut-off to the tuple (pathway_table,
+        cyclic_pathways, scope), which is the same as the one returned
+        by find_pathways for that cut-off.
+    stats : PathwayStats
+        Profile of every column filled, returned only if return_stats is
+        True
+
+    Notes
+    -----
+    Since a column of the table only adds pathways whose size is at least
+    the column index, the columns filled after a cut-off do not change the
+    pathways stored till the cut-off. Hence, the table for a cut-off is
+    obtained by recording the number of pathways of every size for every
+    metabolite, once the column corresponding to the cut-off is filled.
+    This gives the same tables as calling find_pathways for every cut-off,
+    for all the target metabolites. If a budget is exceeded, the tables of
+    the cut-offs after the last column filled are the table at this
+    column, as in find_pathways.
+    """
+    tic = time.perf_counter()
+    maxnumpath, options = _fill_options('find_pathways_for_cutoffs', args,
+                                        options)
+    cutoffs = sorted(set(int(cutoff) for cutoff in cutoffs))
+    state = _prepare_state(G, seed_mets_input, maxnumpath,
+                           options['state_file'], cutoffs,
+                           options['targets'], _constraints(options))
+    # The table after the largest cut-off is used as is
+    _fill_table(state, cutoffs[-1], cutoffs[:-1], options, tic)
+    pathway_tables = {cutoff: _views_at(state, cutoff) for cutoff in cutoffs}
+    if options['return_stats']:
+        return pathway_tables, state['stats']
+    return pathway_tables
+
+
+def extend_pathways(state, new_cutoff, **options):
+    """
+    This function extends a pathway table, which has been filled till a
+    smaller cut-off, to a larger cut-off. Only the columns after the last
+    column filled are computed.
+
+    Parameters
+    ----------
+    state : dict
+        State of the pathway assembler, as returned by load_pathway_state
+    new_cutoff : int
+        Maximum size of the pathways
+    **options
+        Keyword options of find_pathways in EXTEND_OPTIONS, i.e., all but
+        the targets and the constraints, which are those of the state.
+        The budgets apply to the extension.
+
+    Returns
+    -------
+    pathway_table : PathwayTable
+        Pathway table for the new cut-off, as in find_pathways
+    cyclic_pathways : PathwayTable
+        Cyclic pathways for the new cut-off, as in find_pathways
+    scope : set
+        Set of metabolites which can be synthesised
+    stats : PathwayStats
+        Profile of all the columns filled, including those filled before
+        the extension, returned only if return_stats is True
+
+    Notes
+    -----
+    The pathway table at the column filled before the extension is
+    recorded in the state, so that the tables for the earlier cut-off can
+    still be obtained from the extended state. A state filled for target
+    metabolites cannot be extended beyond the cut-off for which its
+    reactions were chosen. A state whose filling was stopped since a
+    budget was exceeded can be extended in the same way. The constraints
+    on the pathways given when the state was created still apply.
+
+    Examples
+    --------
+    >>> pathway_table, cyclic_pathways, scope = find_pathways(
+    ...     G, seed_mets_input, 4, state_file='state.pickle')
+    >>> state = load_pathway_state('state.pickle')
+    >>> pathway_table, cyclic_pathways, scope = extend_pathways(state, 6)
+    """
+    tic = time.perf_counter()
+    _, options = _fill_options('extend_pathways', (), options, EXTEND_OPTIONS)
+    new_cutoff = int(new_cutoff)
+    if state['targets'] is not None and new_cutoff > state['max_cutoff']:
+        raise ValueError('The pathway table has been filled for the targets '
+                         'till a cut-off of ' + str(state['max_cutoff']) +
+                         ', and cannot be extended')
+    if new_cutoff > state['column']:
+        state['snapshots'].setdefault(state['column'], _snapshot_table(state))
+    _fill_table(state, new_cutoff, [], options, tic)
+    if options['return_stats']:
+        return _views_at(state, new_cutoff) + (state['stats'],)
+    return _views_at(state, new_cutoff)
+
+
+def _fill_options(function_name, args, options, option_names=FILL_OPTIONS):
+    """
+    This function returns the maximum number of pathways given as the last
+    positional argument of function_name (1000 by default), and its
+    keyword options, along with the default values in FILL_OPTIONS of the
+    options in option_names which are not given. Other keyword arguments
+    raise a TypeError, as for any function.
+    """
+    for option_name in options:
+        if option_name not in option_names:
+            raise TypeError('%s() got an unexpected keyword argument %r'
+                            % (function_name, option_name))
+    maxnumpath = args[-1] if args else 1000
+    filled_options = {option_name: FILL_OPTIONS[option_name]
+                      for option_name in option_names}
+    filled_options.update(options)
+    return maxnumpath, filled_options
+
+
+def _fill_table(state, cutoff, cutoffs_to_record, options, tic):
+    """
+    This function fills the pathway table till the cut-off with the
+    options from _fill_options, as in find_pathways, where the budgets
+    are counted from tic, and writes the profile to the stats file.
+    """
+    budgets = _budgets(tic, options['time_budget'], options['max_pathways'],
+                       options['max_product_tuples'])
+    _fill_columns(state, cutoff, cutoffs_to_record, options['state_file'],
+                  options['n_jobs'], options['pathway_callback'],
+                  options['memory_budget'], options['spill_directory'],
+                  budgets, options['progress_callback'])
+    toc = time.perf_counter()
+    timetaken = toc - tic
+    print('Time taken', timetaken)
+    if options['stats_file'] is not None:
+        state['stats'].write_json(options['stats_file'])
+
+
+def find_best_pathways(G, seed_mets_input, currenttarmet, number_of_pathways,
+                       path_len_cutoff, *args, cost=None, cost_bound=None,
+                       **options):
+    """
+    This function finds the best pathways producing a target metabolite,
+    i.e., the pathways of smallest cost whose size is at most a cut-off.
+    The columns of the pathway table are filled one at a time, only with
+    the reactions which can lead to the target, and the filling stops as
+    soon as the best pathways are known.
+
+    Parameters
+    ----------
+    G : NetworkX DiGraph Object
+        Bipartite graph of the metabolic network
+    seed_mets_input : set
+        Set of seed metabolites including the source
+    currenttarmet : str
+        Target metabolite
+    number_of_pathways : int
+        Number of best pathways (k)
+    path_len_cutoff : int
+        Maximum size of the pathways
+    *args
+        Maximum number of pathways (maxnumpath), as in find_pathways
+    cost : callable
+        Cost of a pathway, from the set of its reaction names, such as
+        number_of_organisms or number_of_exchange_reactions. The costs are
+        compared to each other, and may also be tuples. By default, the
+        number of reactions in the pathway.
+    cost_bound : callable
+        Lower bound of the cost of any pathway of a size or larger, as
+        cost_bound(size). By default, the size if cost is not given, and
+        None otherwise, in which case the table is filled till the cut-off.
+    **options
+        Keyword options of find_pathways in BEST_PATHWAY_OPTIONS, i.e.,
+        state_file, n_jobs and the constraints on the pathways
+
+    Returns
+    -------
+    best_pathways : list
+        List of tuples (cost, pathway) of the best pathways, in increasing
+        order of their cost and size, where every pathway is a set of
+        reaction names. Fewer pathways are returned if the target has
+        fewer pathways of size at most the cut-off.
+    column : int
+        Last column of the pathway table filled
+
+    Notes
+    -----
+    Once column c is filled, all the pathways of size at most c are in the
+    table, and every pathway which has not been found has at least c + 1
+    reactions, and at least as many reactions as the lower bound of the
+    target from the guided BFS. Hence, its cost is at least the cost bound
+    of the larger of these sizes, and the filling stops once the pathways
+    found include number_of_pathways pathways whose costs do not exceed
+    this bound. Pathways of equal cost are ordered by size, and then in
+    the order in which they are found. As in find_pathways with targets,
+    maxnumpath applies to the combinations of the reactions evaluated.
 
-    global succ, pred, lower_bound_metabolite, maxnumpath, seedmets, \
-        pathway_table, cyclic_pathways
+    Examples
+    --------
+    >>> best_pathways, column = find_best_pathways(
+    ...     G, seed_mets_input, 'iJO1366 pyr_c', 5, 15)
+    >>> best_pathways, column = find_best_pathways(
+    ...     G, seed_mets_input, 'iJO1366 pyr_c', 5, 15,
+    ...     cost=lambda pathway: (number_of_organisms(pathway), len(pathway)),
+    ...     cost_bound=lambda size: (1, size))
+    """
+    tic = time.perf_counter()
+    maxnumpath, options = _fill_options('find_best_pathways', args, options,
+                                        BEST_PATHWAY_OPTIONS)
+    if cost is None:
+        cost = pathway_size
+        if cost_bound is None:
+            # Every pathway of a size or larger costs at least the size
+            cost_bound = int
+    path_len_cutoff = int(path_len_cutoff)
+    state = _prepare_state(G, seed_mets_input, maxnumpath,
+                           options['state_file'], [path_len_cutoff],
+                           {currenttarmet}, _constraints(options))
+    required_reactions = state['required_reactions']
+    compiled_graph = state['compiled_graph']
+    targetid = compiled_graph.node_ids.get(currenttarmet)
+    if targetid is None or targetid in state['seedmets'] or \
+            state['lower_bound_metabolite'][targetid] == -1:
+        print(currenttarmet, ': Target could not be found.')
+        return [], state['column']
+    lower_bound = state['lower_bound_metabolite'][targetid]
+    # Cost and size of the pathways of the target found so far, and the
+    # number of pathways of every size whose cost has been computed
+    candidates = []
+    number_costed = {}
+    while True:
+        entry = state['pathway_table'].get(targetid, {})
+        for plen, pathways in entry.items():
+            if plen == 0 or plen > path_len_cutoff:
+                continue
+            for mask in itertools.islice(pathways, number_costed.get(plen, 0),
+                                         None):
+                if required_reactions is not None and \
+                        not mask & required_reactions:
+                    continue
+                pathway = compiled_graph.names(reactions_in_pathway(mask))
+                candidates.append((cost(pathway), plen, len(candidates),
+                                   pathway))
+            number_costed[plen] = len(pathways)
+        best_pathways = heapq.nsmallest(number_of_pathways, candidates)
+        if state['column'] >= path_len_cutoff:
+            break
+        if cost_bound is not None and \
+                len(best_pathways) == number_of_pathways and \
+                best_pathways[-1][0] <= cost_bound(
+                    max(state['column'] + 1, lower_bound)):
+            break
+        _fill_columns(state, state['column'] + 1, [], options['state_file'],
+                      options['n_jobs'])
+    toc = time.perf_counter()
+    print('The best pathways of', currenttarmet, 'were found after column',
+          state['column'])
+    print('Time taken', toc - tic)
+    return [(pathway_cost, pathway) for pathway_cost, _, _, pathway
+            in best_pathways], state['column']
+
+
+def save_pathway_state(state, state_file):
+    """
+    This function saves the state of the pathway assembler, i.e., the
+    compiled graph, the results of the guided BFS, the pathway table, the
+    cyclic pathways and the index of the last column filled, to a file.
+
+    Parameters
+    ----------
+    state : dict
+        State of the pathway assembler
+    state_file : str
+        Name of the file
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    The state is first written to a temporary file, which then replaces
+    state_file, so that state_file always holds a complete state even if
+    the program is terminated while saving.
+    """
+    # Bitmasks of the consumers of every metabolite are recomputed
+    # from the graph when the state is loaded. Spilled pathways are
+    # saved as the dictionaries which they replace, and the store of the
+    # spilled pathways is not saved.
+    state_to_save = {key: value for key, value in state.items()
+                     if key not in ('consumers', 'pathway_store')}
+    state_to_save['version'] = __version__
+    with open(state_file + '.tmp', 'wb') as filetodump:
+        pickle.dump(state_to_save, filetodump, pickle.HIGHEST_PROTOCOL)
+    os.replace(state_file + '.tmp', state_file)
+
+
+def load_pathway_state(state_file):
+    """
+    This function loads the state of the pathway assembler saved by
+    save_pathway_state, or by find_pathways with a state_file.
+
+    Parameters
+    ----------
+    state_file : str
+        Name of the file
+
+    Returns
+    -------
+    state : dict
+        State of the pathway assembler, which can be passed to
+        extend_pathways
+    """
+    with open(state_file, 'rb') as filetoload:
+        state = pickle.load(filetoload)
+    if state.get('version') != __version__:
+        raise ValueError(state_file + ' was saved by a different version '
+                         'of MetQuest')
+    state['consumers'] = _consumer_masks(state['compiled_graph'])
+    state.setdefault('stats', PathwayStats())
+    for key in ('constraints', 'required_reactions'):
+        state.setdefault(key, None)
+    state.setdefault('exchange_reactions', 0)
+    state.setdefault('max_exchange_reactions', None)
+    return state
+
+
+def _initialise_pathway_table(G, seed_mets_input, maxnumpath, targets=None,
+                              path_len_cutoff=None, constraints=None):
+    """
+    This function carries out the guided BFS and fills the first column of
+    the pathway table, i.e., the metabolites produced by the reactions
+    which require only the seed metabolites.
+
+    Parameters
+    ----------
+    G : NetworkX DiGraph Object
+        Bipartite graph of the metabolic network
+    seed_mets_input : set
+        Set of seed metabolites including the source
+    maxnumpath : int
+        Maximum number of pathways, as in find_pathways
+    targets : set
+        Target metabolites, as in find_pathways
+    path_len_cutoff : int
+        Maximum size of the pathways of the targets
+    constraints : dict
+        Constraints on the pathways, as returned by _constraints
+
+    Returns
+    -------
+    state : dict
+        Dictionary containing the compiled graph, the results of the guided
+        BFS, the pathway table, the cyclic pathways and the index of the
+        last column filled
+    """
     pathway_table = {}
     cyclic_pathways = {}
-    tic = time.perf_counter()
-    #  Setting the cutoff for maximum number of pathways
-    if args:
-        for maxnumpath_input in args:
-            maxnumpath = maxnumpath_input
-    else:
-        maxnumpath = 1000
-    # DiGraph definitions successors and predecessors
-    succ = G.successors
-    pred = G.predecessors
-    seedmets = seed_mets_input
-    # Removing reactions whose reactants are more than 5
-    node_attributes = get_node_attributes(G, 'bipartite')
-    node_attributes_inverted_dict = {}
-    # 0 metabolites , 1 are reactions
-    for keys, values in node_attributes.items():
-        node_attributes_inverted_dict[values] = \
-            node_attributes_inverted_dict.get(values, [])
-        node_attributes_inverted_dict[values].append(keys)
-    # If the number of metabolites, apart from the ones provided
-    # in seed are greater than 5, such reactions are removed
-    for rxnstoremove in node_attributes_inverted_dict[1]:
-        if len(set(pred(rxnstoremove)) - seedmets) >= 5:
-            G.remove_node(rxnstoremove)
+    _remove_large_reactions(G, seed_mets_input)
+    # All computations are carried out on the compiled graph, where
+    # nodes are integers. Names are resolved only in the output.
+    compiled_graph = compile_graph(G)
+    compiled_graph, required_reactions, exchange_reactions = \
+        _apply_constraints(compiled_graph, constraints)
+    succ = compiled_graph.rxn_outputs
+    inputs = compiled_graph.rxn_inputs
+    seedmets = compiled_graph.ids(seed_mets_input)
+    consumers = _consumer_masks(compiled_graph)
     # Performing guided BFS on directed graph by calling forward_pass
-    lower_bound_metabolite, status_dict, scope = forward_pass(G, seedmets)
+    lower_bound, stages, scope = _forward_pass_ids(
+        compiled_graph, [compiled_graph.node_ids[seedmetabs] for seedmetabs
+                         in seed_mets_input if seedmetabs in compiled_graph])
+    lower_bound_metabolite = lower_bound.tolist()
+    status_dict = _visited_reactions(lower_bound_metabolite, stages)
     # Sorting the keys (reactions) in the status dictionary,
     # since dictionary keys are not good to iterate over.
     # There could be differences in the order of insertion of
     # dictionary keys. Although, this does not matter with the
     # algorithm implementation.
-    rxns_to_visit = list(status_dict.keys())
-    rxns_to_visit.sort()
+    rxns_to_visit = list(status_dict)
+    rxns_to_visit.sort(key=compiled_graph.name)
     # For seed metabolites, the pathway table is initialised to 0
     for seedmetabs in list(seedmets):
         pathway_table[seedmetabs] = {0: ''}
     # Status dict consists of all the reactions that can be
     # visited from the seed metabolites
     for rxns in rxns_to_visit:
-        if set(pred(rxns)).issubset(seedmets):
+        if inputs[rxns] <= seedmets:
             # Initialisation of dictionary with the
             # metabolites produced with one rxn
-            for metssucc in succ(rxns):
+            for metssucc in succ[rxns]:
                 if metssucc not in pathway_table:
-                    pathway_table[metssucc] = {1: []}
+                    pathway_table[metssucc] = {1: {}}
             # Filling table with one reaction that produced metabolite
-            for metssucc in succ(rxns):
+            for metssucc in succ[rxns]:
                 # Since we don't want pathways generating seed metabolites
                 if metssucc not in seedmets:
-                    pathway_table[metssucc][1].append(set([rxns]))
+                    pathway_table[metssucc][1][1 << rxns] = None
+    # Reactions which are evaluated for filling the other columns
+    if targets is None:
+        rxns_to_fill = status_dict
+    else:
+        targets = set(targets)
+        rxns_to_fill = _reactions_reaching_targets(
+            compiled_graph, targets, status_dict, lower_bound_metabolite,
+            seedmets, path_len_cutoff)
+    return {'compiled_graph': compiled_graph,
+            'seed_mets_input': set(seed_mets_input),
+            'seedmets': seedmets,
+            'consumers': consumers,
+            'lower_bound_metabolite': lower_bound_metabolite,
+            'status_dict': status_dict,
+            'rxns_to_fill': rxns_to_fill,
+            'targets': targets,
+            'max_cutoff': path_len_cutoff,
+            'scope': scope,
+            'maxnumpath': maxnumpath,
+            'pathway_table': pathway_table,
+            'cyclic_pathways': cyclic_pathways,
+            'column': 1,
+            'snapshots': {},
+            'stats': PathwayStats(),
+            'constraints': constraints,
+            'required_reactions': required_reactions,
+            'exchange_reactions': exchange_reactions,
+            'max_exchange_reactions': (constraints or {}).get(
+                'max_exchange_reactions')}
 
-    # For filling values from the second column
-    for currentcolumnidx in range(2, path_len_cutoff+1):
-        for rxns in status_dict:  # rxns_to_visit:
-            # To eliminate seed metabolites, whose column value
-            # is always 0 - so that more partitions are not generated.
-            mets_needed = list(set(pred(rxns)) - seedmets)
-            # To only go over reactions whose inputs are not
-            # seed metabolites. There could be reactions whose inputs
-            # are only seed mets, eg atp + h2o
-            if mets_needed:
-                for val in range(currentcolumnidx-1,
-                                 len(mets_needed)*(currentcolumnidx-1)+1):
-                    if val <= len(mets_needed)*(currentcolumnidx-2):
-                        _first_round_calculations(
-                            mets_needed, currentcolumnidx, rxns, val)
-                    else:
-                        _second_round_calculations(
-                            mets_needed, currentcolumnidx, rxns, val)
-    toc = time.perf_counter()
-    timetaken = toc - tic
-    print('Time taken', timetaken)
-    return pathway_table, cyclic_pathways, scope
+
+def _constraints(options):
+    """
+    This function returns the constraints on the pathways in the options
+    of find_pathways (see CONSTRAINT_OPTIONS) as a dictionary, which is
+    compared with the constraints of a saved state, or None if there is
+    no constraint.
+    """
+    source_metabolites, forbidden_reactions, max_exchange_reactions, \
+        allowed_organisms = [options[option_name]
+                             for option_name in CONSTRAINT_OPTIONS]
+    if source_metabolites is None and forbidden_reactions is None and \
+            max_exchange_reactions is None and allowed_organisms is None:
+        return None
+    if source_metabolites is not None:
+        source_metabolites = frozenset(source_metabolites)
+    if max_exchange_reactions is not None:
+        max_exchange_reactions = int(max_exchange_reactions)
+    if allowed_organisms is not None:
+        allowed_organisms = frozenset(allowed_organisms)
+    return {'source_metabolites': source_metabolites,
+            'forbidden_reactions': frozenset(forbidden_reactions or ()),
+            'max_exchange_reactions': max_exchange_reactions,
+            'allowed_organisms': allowed_organisms}
+
+
+def _apply_constraints(compiled_graph, constraints):
+    """
+    This function removes the forbidden reactions and the reactions of the
+    organisms which are not allowed from the compiled graph (and all the
+    exchange reactions if none is allowed), and returns the compiled graph,
+    the bitmask of the reactions consuming the source metabolites (None
+    if there is no such constraint) and the bitmask of the exchange
+    reactions which are limited.
+    """
+    if constraints is None:
+        return compiled_graph, None, 0
+    node_names = compiled_graph.node_names
+    rxns_removed = set(rxns for rxns in
+                       compiled_graph.ids(constraints['forbidden_reactions'])
+                       if compiled_graph.node_type[rxns] == 1)
+    if constraints['allowed_organisms'] is not None:
+        rxns_removed.update(
+            rxns for rxns in compiled_graph.reactions
+            if reaction_organism(node_names[rxns])
+            not in constraints['allowed_organisms'])
+    exchange_rxns = set()
+    if constraints['max_exchange_reactions'] is not None:
+        exchange_rxns = set(rxns for rxns in compiled_graph.reactions
+                            if is_exchange_reaction(node_names[rxns]))
+        if constraints['max_exchange_reactions'] < 1:
+            rxns_removed.update(exchange_rxns)
+    compiled_graph = compiled_graph.without_reactions(rxns_removed)
+    required_reactions = None
+    if constraints['source_metabolites'] is not None:
+        source_ids = compiled_graph.ids(constraints['source_metabolites'])
+        required_reactions = pathway_mask(
+            rxns for sourcemets in source_ids
+            for rxns in compiled_graph.rxn_outputs[sourcemets])
+    return compiled_graph, required_reactions, \
+        pathway_mask(exchange_rxns - rxns_removed)
+
+
+def _reactions_reaching_targets(compiled_graph, targets, rxns_visited,
+                                lower_bound_metabolite, seedmets,
+                                path_len_cutoff):
+    """
+    This function returns the reactions visited in the guided BFS which
+    can be part of a pathway of size at most path_len_cutoff producing one
+    of the target metabolites, in the order in which they are visited.
+    """
+    inputs = compiled_graph.rxn_inputs
+    distance = _distance_to_targets(
+        compiled_graph, compiled_graph.ids(targets), rxns_visited)
+    rxns_to_fill = []
+    for rxns in rxns_visited:
+        if distance[rxns] == -1:
+            continue
+        # Smallest size of a pathway in which the reaction produces its
+        # products, from the lower bounds of its inputs
+        min_pathway_size = 1 + max([lower_bound_metabolite[met] for met
+                                    in inputs[rxns] - seedmets] or [0])
+        if min_pathway_size + distance[rxns] - 1 <= path_len_cutoff:
+            rxns_to_fill.append(rxns)
+    return rxns_to_fill
+
+
+def _remove_large_reactions(G, seed_mets_input):
+    """
+    This function removes the reactions which require 5 or more
+    metabolites apart from the seed metabolites from the graph.
+    """
+    for rxnstoremove in [nodes for nodes, nodetype in
+                         G.nodes(data='bipartite') if nodetype == 1]:
+        if len(set(G.predecessors(rxnstoremove)) - seed_mets_input) >= 5:
+            G.remove_node(rxnstoremove)
+
+
+def _consumer_masks(compiled_graph):
+    """
+    This function returns the bitmask of the reactions consuming every
+    metabolite, which is used to find if a pathway producing the
+    metabolite is cyclic.
+    """
+    succ = compiled_graph.rxn_outputs
+    consumers = {}
+    for metid in compiled_graph.metabolites:
+        consumers[metid] = 0
+        for rxnid in succ[metid]:
+            consumers[metid] |= 1 << rxnid
+    return consumers
+
+
+def _prepare_state(G, seed_mets_input, maxnumpath, state_file, cutoffs,
+                   targets=None, constraints=None):
+    """
+    This function returns the state from which the pathway table is
+    filled. If state_file holds a state saved for the same graph, seed
+    metabolites, maxnumpath, targets and constraints (from _constraints),
+    from which the tables of all the
+    cut-offs can be obtained, this state is loaded. Otherwise, the pathway
+    table is initialised.
+    """
+    if targets is not None:
+        targets = set(targets)
+    if state_file is not None and os.path.exists(state_file):
+        try:
+            state = load_pathway_state(state_file)
+        except Exception as error:
+            print('State in', state_file, 'could not be loaded:', error)
+        else:
+            _remove_large_reactions(G, seed_mets_input)
+            if (state['compiled_graph'].node_names == list(G.nodes()) and
+                    state['seed_mets_input'] == set(seed_mets_input) and
+                    state['maxnumpath'] == maxnumpath and
+                    state['targets'] == targets and
+                    state['constraints'] == constraints and
+                    (targets is None or
+                     max(cutoffs) <= state['max_cutoff']) and
+                    all(max(cutoff, 1) >= state['column'] or
+                        cutoff in state['snapshots'] for cutoff in cutoffs)):
+                print('Resuming from column', state['column'], 'saved in',
+                      state_file)
+                return state
+            print('State in', state_file, 'does not match the input.',
+                  'The pathway table is filled from the beginning')
+    state = _initialise_pathway_table(G, seed_mets_input, maxnumpath,
+                                      targets, max(cutoffs), constraints)
+    if state_file is not None:
+        save_pathway_state(state, state_file)
+    return state
+
+
+def _fill_columns(state, path_len_cutoff, cutoffs_to_record, state_file,
+                  n_jobs=1, pathway_callback=None, memory_budget=None,
+                  spill_directory=None, budgets=None, progress_callback=None):
+    """
+    This function fills the columns of the pathway table after the last
+    column filled, till path_len_cutoff. The tables at the cut-offs in
+    cutoffs_to_record are recorded in the state, the state is saved to
+    state_file, if given, and pathway_callback, if given, is called with
+    the tables after every column. The memory taken by the table is
+    accounted for after every column, and finished cells are spilled if
+    it exceeds memory_budget. The profile of every column is added to the
+    PathwayStats of the state. If one of the budgets (from _budgets) is
+    exceeded, the column being filled is rolled back, and the name of the
+    budget is recorded in the state as stop_reason.
+    """
+    n_jobs = _number_of_jobs(n_jobs)
+    pathway_store = _pathway_store(state, memory_budget, spill_directory)
+    state['stop_reason'] = state['stats'].stop_reason = None
+    for cutoff in cutoffs_to_record:
+        if cutoff <= state['column'] and cutoff not in state['snapshots']:
+            state['snapshots'][cutoff] = _snapshot_table(state)
+    for currentcolumnidx in range(state['column']+1, path_len_cutoff+1):
+        tic = time.perf_counter()
+        if budgets is not None:
+            # The table at the previous column, to which the table is
+            # rolled back if a budget is exceeded
+            snapshot = _snapshot_table(state)
+            budgets['pathways'] = sum(
+                size for sizes in snapshot[0].values()
+                for plen, size in sizes.items() if plen != 0)
+        try:
+            column_costs = _fill_column(state, currentcolumnidx, n_jobs,
+                                        budgets, progress_callback)
+        except _BudgetExceeded as error:
+            _restore_table(state, snapshot)
+            state['stop_reason'] = state['stats'].stop_reason = str(error)
+            print('The pathway table was filled till column', state['column'],
+                  'since', error, 'was exceeded')
+            break
+        if budgets is not None:
+            budgets['product_tuples'] += _counters['product_tuples']
+        memory = pathway_store.account(state['pathway_table'], currentcolumnidx)
+        _record_column_stats(state, currentcolumnidx,
+                             time.perf_counter() - tic, column_costs, memory)
+        if currentcolumnidx in cutoffs_to_record:
+            state['snapshots'][currentcolumnidx] = _snapshot_table(state)
+        if state_file is not None:
+            save_pathway_state(state, state_file)
+        if pathway_callback is not None:
+            table_view, cyclic_view, _ = _table_views(state)
+            pathway_callback(currentcolumnidx, table_view, cyclic_view)
+
+
+def _pathway_store(state, memory_budget, spill_directory):
+    """
+    This function returns the PathwayStore of the state, which is created
+    if the state has none or if it was created with another budget or
+    directory. Cells spilled to an earlier store remain readable.
+    """
+    pathway_store = state.get('pathway_store')
+    if pathway_store is None or \
+            pathway_store.memory_budget != memory_budget or \
+            pathway_store.directory != spill_directory:
+        pathway_store = PathwayStore(memory_budget, spill_directory)
+        state['pathway_store'] = pathway_store
+    return pathway_store
+
+
+def _fill_column(state, currentcolumnidx, n_jobs=1, budgets=None,
+                 progress_callback=None):
+    """
+    This function fills one column of the pathway table, i.e., finds the
+    pathways of every metabolite using the pathways stored in the
+    previous columns.
+
+    Parameters
+    ----------
+    state : dict
+        Dictionary returned by _initialise_pathway_table
+    currentcolumnidx : int
+        An integer denoting the column which is filled
+    n_jobs : int
+        Number of processes used to evaluate the reactions
+    budgets : dict
+        Budgets checked after every reaction, as returned by _budgets
+    progress_callback : callable
+        Called after every reaction, as in find_pathways
+
+    Returns
+    -------
+    column_costs : dict
+        Time taken and number of tuples of pathways examined by every
+        reaction evaluated, as a tuple (time, tuples)
+
+    Raises
+    ------
+    _BudgetExceeded
+        If a budget is exceeded, in which case the column is filled only
+        partially
+    """
+    global succ, inputs, consumers, lower_bound_metabolite, maxnumpath, \
+        seedmets, pathway_table, cyclic_pathways, exchange_reactions, \
+        max_exchange_reactions
+    succ = state['compiled_graph'].rxn_outputs
+    inputs = state['compiled_graph'].rxn_inputs
+    consumers = state['consumers']
+    lower_bound_metabolite = state['lower_bound_metabolite']
+    maxnumpath = state['maxnumpath']
+    seedmets = state['seedmets']
+    pathway_table = state['pathway_table']
+    cyclic_pathways = state['cyclic_pathways']
+    exchange_reactions = state['exchange_reactions']
+    max_exchange_reactions = state['max_exchange_reactions']
+    _reset_counters()
+    _check_budgets(budgets)
+    column_costs = {}
+    if budgets is None and progress_callback is None:
+        reaction_evaluated = None
+    else:
+        def reaction_evaluated(rxns):
+            if progress_callback is not None:
+                progress_callback(currentcolumnidx,
+                                  state['compiled_graph'].name(rxns),
+                                  len(column_costs), len(state['rxns_to_fill']))
+            _check_budgets(budgets)
+    if n_jobs > 1 and len(state['rxns_to_fill']) > 1:
+        _fill_column_parallel(state, currentcolumnidx, n_jobs, column_costs,
+                              reaction_evaluated)
+    else:
+        for rxns in state['rxns_to_fill']:  # rxns_to_visit:
+            column_costs[rxns] = _timed_evaluation(rxns, currentcolumnidx)
+            if reaction_evaluated is not None:
+                reaction_evaluated(rxns)
+    state['column'] = currentcolumnidx
+    return column_costs
+
+
+def _budgets(tic, time_budget=None, max_pathways=None,
+             max_product_tuples=None):
+    """
+    This function returns the budgets of the filling of the pathway table
+    which starts at tic (from time.perf_counter), as a dictionary, or None
+    if no budget is given. The dictionary also holds the number of
+    pathways in the table before the current column, and the number of
+    tuples examined in the columns filled.
+    """
+    if time_budget is None and max_pathways is None and \
+            max_product_tuples is None:
+        return None
+    return {'deadline': None if time_budget is None else tic + time_budget,
+            'max_pathways': max_pathways,
+            'max_product_tuples': max_product_tuples,
+            'pathways': 0,
+            'product_tuples': 0}
+
+
+def _check_budgets(budgets):
+    """
+    This function raises _BudgetExceeded, with the name of the budget, if
+    one of the budgets is exceeded, counting the work done in the current
+    column.
+    """
+    if budgets is None:
+        return
+    if budgets['deadline'] is not None and \
+            time.perf_counter() > budgets['deadline']:
+        raise _BudgetExceeded('time_budget')
+    if budgets['max_pathways'] is not None and \
+            budgets['pathways'] + _counters['pathways_inserted'] > \
+            budgets['max_pathways']:
+        raise _BudgetExceeded('max_pathways')
+    if budgets['max_product_tuples'] is not None and \
+            budgets['product_tuples'] + _counters['product_tuples'] > \
+            budgets['max_product_tuples']:
+        raise _BudgetExceeded('max_product_tuples')
+
+
+class _BudgetExceeded(Exception):
+    """
+    Raised when a budget of the filling of the pathway table is exceeded,
+    with the name of the budget.
+    """
+
+
+def _restore_table(state, snapshot):
+    """
+    This function rolls the pathway table and the cyclic pathways back to
+    a snapshot from _snapshot_table, i.e., removes the metabolites, sizes
+    and pathways added to the table after the snapshot, which are the
+    last ones stored, and restores the cyclic pathways. The tables are
+    changed in place, and are then the same as at the time of the
+    snapshot.
+    """
+    sizes, cyclic_pathways = snapshot
+    table = state['pathway_table']
+    for metid in list(table):
+        if metid not in sizes:
+            del table[metid]
+            continue
+        entry = table[metid]
+        for plen in list(entry):
+            if plen not in sizes[metid]:
+                del entry[plen]
+            elif plen != 0 and len(entry[plen]) > sizes[metid][plen]:
+                pathways = entry[plen]
+                for mask in list(itertools.islice(pathways, sizes[metid][plen], None)):
+                    del pathways[mask]
+    state['cyclic_pathways'].clear()
+    state['cyclic_pathways'].update(cyclic_pathways)
+
+
+def _timed_evaluation(rxns, currentcolumnidx):
+    """
+    This function evaluates a reaction, and returns the time taken and
+    the number of tuples of pathways examined.
+    """
+    tic = time.perf_counter()
+    tuples = _counters['product_tuples']
+    _evaluate_reaction(rxns, currentcolumnidx)
+    return time.perf_counter() - tic, _counters['product_tuples'] - tuples
+
+
+def _reset_counters():
+    """
+    This function sets all the counters of the work done to 0.
+    """
+    for counter_name in COUNTER_NAMES:
+        _counters[counter_name] = 0
+
+
+def _record_column_stats(state, currentcolumnidx, wall_time, column_costs,
+                         memory=None):
+    """
+    This function adds the counters of the column which has been filled,
+    the time taken by every reaction, the number of pathways in the table
+    and the memory accounting of the table to the PathwayStats of the
+    state.
+    """
+    name = state['compiled_graph'].name
+    table_pathways = sum(len(pathways) for entry in state['pathway_table'].values()
+                         for plen, pathways in entry.items() if plen != 0)
+    cyclic_pathways = sum(len(pathways) for entry in state['cyclic_pathways'].values()
+                          for pathways in entry.values())
+    state['stats'].add_column(
+        currentcolumnidx, wall_time, _counters,
+        {name(rxns): cost for rxns, cost in column_costs.items()},
+        table_pathways, cyclic_pathways, memory)
+
+
+def _evaluate_reaction(rxns, currentcolumnidx):
+    """
+    This function finds the pathways of the products of a reaction in the
+    current column, from the pathways of its inputs in the previous
+    columns.
+
+    Parameters
+    ----------
+    rxns : int
+        Identifier of the reaction which is evaluated
+    currentcolumnidx : int
+        An integer denoting the column which is filled
+
+    Returns
+    -------
+    None
+    """
+    _counters['reactions_visited'] += 1
+    # To eliminate seed metabolites, whose column value
+    # is always 0 - so that more partitions are not generated.
+    mets_needed = list(inputs[rxns] - seedmets)
+    # To only go over reactions whose inputs are not
+    # seed metabolites. There could be reactions whose inputs
+    # are only seed mets, eg atp + h2o
+    if mets_needed:
+        for val in range(currentcolumnidx-1,
+                         len(mets_needed)*(currentcolumnidx-1)+1):
+            if val <= len(mets_needed)*(currentcolumnidx-2):
+                _first_round_calculations(
+                    mets_needed, currentcolumnidx, rxns, val)
+            else:
+                _second_round_calculations(
+                    mets_needed, currentcolumnidx, rxns, val)
+
+
+def _fill_column_parallel(state, currentcolumnidx, n_jobs, column_costs,
+                          reaction_evaluated=None):
+    """
+    This function fills one column of the pathway table using a pool of
+    worker processes, and gives the same table as filling it serially.
+
+    Parameters
+    ----------
+    state : dict
+        Dictionary returned by _initialise_pathway_table
+    currentcolumnidx : int
+        An integer denoting the column which is filled
+    n_jobs : int
+        Number of worker processes
+    column_costs : dict
+        Dictionary to which the time taken and the number of tuples
+        examined by every reaction are added, as in _fill_column
+    reaction_evaluated : callable
+        If given, it is called with every reaction once its pathways are
+        inserted in the table, in the serial order. The worker processes
+        are terminated if it raises an exception.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    A column only uses the pathways whose size is less than the column
+    index, which are not changed while the column is filled. The worker
+    processes are forked once the previous column is filled, and hence
+    share these pathways with the main process, without copying them.
+    Every worker finds the pathways of a reaction, and the main process
+    inserts them in the table in the order in which the reactions are
+    evaluated serially, so that the table is the same as the serial one.
+    When the pathways of a reaction depend on the products added to the
+    table by the preceding reactions (through maxnumpath), the reaction
+    is evaluated by the main process, in its turn.
+    The reactions are given to the workers in the decreasing order of the
+    time they took in the previous column, so that the few reactions which
+    take the longest do not delay the column, and the reactions which take
+    little time are given in batches.
+    """
+    rxns_to_fill = state['rxns_to_fill']
+    reaction_costs = state.setdefault('reaction_costs', {})
+    # Sorting is stable, and the reactions are in the serial order till
+    # their time has been measured
+    order = sorted(range(len(rxns_to_fill)),
+                   key=lambda idx: -reaction_costs.get(rxns_to_fill[idx], 0))
+    tasks = _batch_reactions(
+        [(idx, rxns_to_fill[idx]) for idx in order],
+        [reaction_costs.get(rxns_to_fill[idx], 0) for idx in order], n_jobs)
+    results = {}
+    nextidx = 0
+    with multiprocessing.get_context('fork').Pool(n_jobs) as pool:
+        for batch_results in pool.imap_unordered(
+                _evaluate_in_worker,
+                [(batch, currentcolumnidx) for batch in tasks]):
+            for idx, pathways, timetaken, counters in batch_results:
+                reaction_costs[rxns_to_fill[idx]] = timetaken
+                results[idx] = pathways, timetaken, counters
+            while nextidx in results:
+                pathways, timetaken, counters = results.pop(nextidx)
+                rxns = rxns_to_fill[nextidx]
+                if pathways is None:
+                    column_costs[rxns] = _timed_evaluation(rxns,
+                                                           currentcolumnidx)
+                else:
+                    # The work done by the worker is counted in the
+                    # counters of the column
+                    for counter_name, count in counters.items():
+                        _counters[counter_name] += count
+                    column_costs[rxns] = timetaken, counters['product_tuples']
+                    _insert_pathways(rxns, pathways)
+                if reaction_evaluated is not None:
+                    reaction_evaluated(rxns)
+                nextidx += 1
+
+
+def _batch_reactions(reactions, costs, n_jobs):
+    """
+    This function divides the reactions, which are sorted by their costs,
+    into batches which are evaluated by a worker at a time. Every batch
+    takes about 1/(8 * n_jobs) of the total time, or has a few reactions
+    if their time is not known.
+    """
+    total_cost = sum(costs)
+    if total_cost:
+        max_cost = total_cost / (8.0 * n_jobs)
+        max_size = len(reactions)
+    else:
+        max_cost = 0
+        max_size = max(1, len(reactions) // (8 * n_jobs))
+    batches = []
+    batch = []
+    batch_cost = 0
+    for reaction, cost in zip(reactions, costs):
+        batch.append(reaction)
+        batch_cost += cost
+        if (max_cost and batch_cost >= max_cost) or len(batch) >= max_size:
+            batches.append(batch)
+            batch = []
+            batch_cost = 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _evaluate_in_worker(task):
+    """
+    This function evaluates a batch of reactions in a worker process, and
+    returns the pathways found for every reaction, or None if the reaction
+    has to be evaluated by the main process, along with the time taken and
+    the counters of the work done.
+    """
+    global _recorded_pathways, _added_products
+    batch, currentcolumnidx = task
+    batch_results = []
+    for idx, rxns in batch:
+        tic = time.perf_counter()
+        _recorded_pathways = []
+        _added_products = set()
+        _reset_counters()
+        try:
+            _evaluate_reaction(rxns, currentcolumnidx)
+            pathways = _recorded_pathways
+        except _OrderDependent:
+            pathways = None
+        finally:
+            _recorded_pathways = None
+            _added_products = None
+        batch_results.append((idx, pathways, time.perf_counter() - tic,
+                              dict(_counters)))
+    return batch_results
+
+
+def _number_of_jobs(n_jobs):
+    """
+    This function returns the number of processes to be used, which is the
+    number of processors if n_jobs is less than 1. A single process is used
+    if processes cannot be forked.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        print('Worker processes cannot be forked on this platform.',
+              'The pathway table is filled with a single process')
+        n_jobs = 1
+    return n_jobs
+
+
+def _snapshot_table(state):
+    """
+    This function records the number of pathways of every size for every
+    metabolite and a copy of the cyclic pathways, from which the tables
+    at the current column can be obtained later.
+    """
+    sizes = {metid: {plen: len(pathways) for plen, pathways in entry.items()}
+             for metid, entry in state['pathway_table'].items()}
+    cyclic_pathways = {metid: dict(entry) for metid, entry
+                       in state['cyclic_pathways'].items()}
+    return sizes, cyclic_pathways
+
+
+def _views_at(state, cutoff):
+    """
+    This function returns the output of find_pathways for a cut-off, from
+    a state which has been filled at least till the cut-off, or which was
+    stopped before the cut-off since a budget was exceeded. The column
+    and the stop reason are recorded in the tables returned.
+    """
+    # The first column is always filled
+    if max(cutoff, 1) >= state['column']:
+        views = _table_views(state)
+        column = state['column']
+        stop_reason = state.get('stop_reason') if cutoff > column else None
+    elif cutoff not in state['snapshots']:
+        raise ValueError('The pathway table has been filled till column ' +
+                         str(state['column']) + ', and the table at column ' +
+                         str(cutoff) + ' has not been recorded')
+    else:
+        views = _table_views(state, state['snapshots'][cutoff])
+        column = cutoff
+        stop_reason = None
+    for table_view in views[:2]:
+        table_view.column = column
+        table_view.stop_reason = stop_reason
+    return views
+
+
+def _table_views(state, snapshot=None):
+    """
+    This function returns the pathway table, the cyclic pathways and the
+    scope with node names, i.e., the output of find_pathways. If a
+    snapshot from _snapshot_table is given, the tables at the time of the
+    snapshot are returned.
+    """
+    compiled_graph = state['compiled_graph']
+    seed_mets_input = state['seed_mets_input']
+    # Seed metabolites which are absent in the graph are retained as well
+    absent_seeds = {seedmetabs: {0: ''} for seedmetabs in seed_mets_input
+                    if seedmetabs not in compiled_graph}
+    if snapshot is None:
+        sizes, cyclic_pathways = None, state['cyclic_pathways']
+    else:
+        sizes, cyclic_pathways = snapshot
+    required_reactions = state.get('required_reactions')
+    return PathwayTable(state['pathway_table'], compiled_graph, set,
+                        absent_seeds, sizes, required_reactions), \
+        PathwayTable(cyclic_pathways, compiled_graph, list,
+                     required_reactions=required_reactions), \
+        compiled_graph.names(state['scope']) | seed_mets_input
 
 
 def _first_round_calculations(mets_needed, currentcolumnidx, rxns, val):
@@ -139,11 +1315,11 @@ def _first_round_calculations(mets_needed, currentcolumnidx, rxns, val):
     Parameters
     ----------
     mets_needed : list
-        List of metabolites a reaction requires
+        List of metabolites (identifiers) a reaction requires
     currentcolumnidx : int
         An integer denoting the current column which is evaluated
-    rxns : str
-        Current reaction which is evaluated
+    rxns : int
+        Identifier of the current reaction which is evaluated
     val : int
         Maximum sum that is to be generated
 
@@ -168,7 +1344,7 @@ def _first_round_calculations(mets_needed, currentcolumnidx, rxns, val):
                     # To ensure that the current iteration uses metabs
                     # generated only till the previous iteration
                     if currentcolumnidx - 1 in pathway_table[metabolites]:
-                        temp_rxn_list.append([[rxns]])
+                        temp_rxn_list.append([1 << rxns])
                         number_of_pathways_found[metabolites] = \
                             len(pathway_table[metabolites][currentcolumnidx-1])
                     else:
@@ -188,15 +1364,30 @@ def _first_round_calculations(mets_needed, currentcolumnidx, rxns, val):
                     # This will give values of the lower bound of
                     # metabolites which are not involved in combination
                     for varmet in list(other_mets_not_in_comb):
-                        first_discovery_step.append(min(lower_bound_metabolite[varmet]))
+                        first_discovery_step.append(lower_bound_metabolite[varmet])
                     all_partitions = generate_partitions(val-((currentcolumnidx-1)*currentval),
-                                                         first_discovery_step, currentcolumnidx - 1)
+                                                         first_discovery_step, currentcolumnidx - 1,
+                                                         _available_lengths(other_mets_not_in_comb))
                     for partitions in all_partitions:
+                        _counters['partitions_generated'] += 1
                         _find_all_rxn_combination_firstround(rxns, partitions, other_mets_not_in_comb,
                                                              temp_rxn_list, number_of_pathways_found,
                                                              currentcolumnidx)
 
 
+def _available_lengths(mets):
+    """
+    This function returns the sizes of the pathways found for every
+    metabolite, so that partitions which require a size which is not
+    found are not generated. The sizes of the pathways of the inputs of a
+    reaction do not change while the reaction is evaluated, since
+    pathways producing an input of the reaction through the reaction are
+    cyclic.
+    """
+    return [pathway_table[met] if met in pathway_table else ()
+            for met in mets]
+
+
 def _find_all_rxn_combination_firstround(rxns, partitions, other_mets_not_in_comb,
                                         temp_rxn_list, number_of_pathways_found, currentcolumnidx):
     """
@@ -205,8 +1396,8 @@ def _find_all_rxn_combination_firstround(rxns, partitions, other_mets_not_in_com
 
     Parameters
     ----------
-    rxns : str
-        Current reaction which is evaluated
+    rxns : int
+        Identifier of the current reaction which is evaluated
     paritions : tuple
         Combinations of numbers that would geenrate the required sum
     other_mets_not_in_comb : list
@@ -237,9 +1428,10 @@ def _find_all_rxn_combination_firstround(rxns, partitions, other_mets_not_in_com
                 number_of_pathways_found[other_mets_not_in_comb[varmetidx]] = \
                     len(pathway_table[other_mets_not_in_comb[varmetidx]][partitions[varmetidx]])
     if counter == len(other_mets_not_in_comb):
-        if all([prod(list(number_of_pathways_found.values())) > maxnumpath,
-                set(succ(rxns)).issubset(set(pathway_table))]):
+        if prod(list(number_of_pathways_found.values())) > maxnumpath and \
+                _products_in_table(rxns):
             more_pathways_found = 'Y'
+            _counters['maxnumpath_prunes'] += 1
         else:
             # Deep copy of the reaction list, because temp_rxn_list_current
             # varies with every iteration to evaluate other partitions
@@ -248,6 +1440,8 @@ def _find_all_rxn_combination_firstround(rxns, partitions, other_mets_not_in_com
                 temp_rxn_list_current.append(
                     pathway_table[other_mets_not_in_comb[varmetidx]][partitions[varmetidx]])
             _populate_table(rxns, temp_rxn_list_current, currentcolumnidx)
+    else:
+        _counters['partitions_skipped'] += 1
 
 
 def _populate_table(rxns, temp_rxn_list_current, currentcolumnidx):
@@ -259,12 +1453,12 @@ def _populate_table(rxns, temp_rxn_list_current, currentcolumnidx):
 
     Parameters
     ----------
-    rxns : str
-        Current reaction which is evaluated
+    rxns : int
+        Identifier of the current reaction which is evaluated
     paritions : tuple
         Combinations of numbers that would geenrate the required sum
     temp_rxn_list_current : list of lists
-        a list of lists consisting of all the alternate pathways
+        a list of lists consisting of all the alternate pathways (bitmasks)
         producing the metabolites required by the reaction
     currentcolumnidx : int
          value of the current column index (pathway length)
@@ -275,43 +1469,117 @@ def _populate_table(rxns, temp_rxn_list_current, currentcolumnidx):
     """
     #  Temprxnlist consists of all combinations of pathways
     #  producing all the input metabolites
+    pathways = []
+    number_of_tuples = 1
+    number_of_short = 0
+    for rxn_list in temp_rxn_list_current:
+        number_of_tuples *= len(rxn_list)
     for rxnunion in itertools.product(*temp_rxn_list_current):
-        reaction_combntn = set([])
+        reaction_combntn = 0
         for rxnentry in rxnunion:
-            for individualele in rxnentry:
-                reaction_combntn.add(individualele)
-        metabs_in_cycle = set([])
-
-        for currentrxn in reaction_combntn:
-            for inputmetab in pred(currentrxn):
-                if inputmetab not in seedmets:
-                    metabs_in_cycle.add(inputmetab)
-        for succmets in succ(rxns):
-            if succmets not in seedmets:
-                if len(reaction_combntn) >= currentcolumnidx:
-                    if succmets in pathway_table:
-                        if succmets in metabs_in_cycle:
-                            if succmets in cyclic_pathways:
-                                cyclic_pathways[succmets].update(
-                                    {len(reaction_combntn): [list(reaction_combntn)]})
-                            else:
-                                cyclic_pathways[succmets] = \
-                                    {len(reaction_combntn): [list(reaction_combntn)]}
-                        else:
-                            if len(reaction_combntn) in pathway_table[succmets]:
-                                try:
-                                    if pathway_table[succmets][len(reaction_combntn)]. \
-                                                                index(reaction_combntn):
-                                        pass  # Because this entry is already in the pathway_table
-                                except ValueError:
-                                    pathway_table[succmets][len(reaction_combntn)].append(
-                                        reaction_combntn)
-                            else:
-                                pathway_table[succmets].update(
-                                    {len(reaction_combntn): [reaction_combntn]})
+            reaction_combntn |= rxnentry
+        pathway_length = popcount(reaction_combntn)
+        if pathway_length < currentcolumnidx:
+            number_of_short += 1
+            continue
+        # Pathways with too many exchange reactions cannot be part of a
+        # pathway with fewer exchange reactions
+        if exchange_reactions and \
+                popcount(reaction_combntn & exchange_reactions) > \
+                max_exchange_reactions:
+            continue
+        pathways.append((reaction_combntn, pathway_length))
+    _counters['product_tuples'] += number_of_tuples
+    _counters['short_tuples'] += number_of_short
+    _counters['constraint_prunes'] += \
+        number_of_tuples - number_of_short - len(pathways)
+    if _recorded_pathways is not None:
+        # In a worker process, the pathways are returned to the main
+        # process, and all the products are then in the table
+        _recorded_pathways.extend(pathways)
+        if pathways:
+            _added_products.update(succ[rxns])
+    else:
+        _insert_pathways(rxns, pathways)
+
+
+def _insert_pathways(rxns, pathways):
+    """
+    This function inserts the pathways found for a reaction in the entries
+    of its products in the pathway table, or in the cyclic pathways.
+
+    Parameters
+    ----------
+    rxns : int
+        Identifier of the reaction which produces the metabolites
+    pathways : list
+        List of tuples (bitmask, size) of the pathways, in the order in
+        which they are found
 
+    Returns
+    -------
+    None
+    """
+    products_of_rxn = [succmets for succmets in succ[rxns]
+                       if succmets not in seedmets]
+    number_inserted = 0
+    number_of_cyclic = 0
+    for reaction_combntn, pathway_length in pathways:
+        for succmets in products_of_rxn:
+            if succmets in pathway_table:
+                # The pathway is cyclic if one of its reactions
+                # consumes the metabolite produced
+                if reaction_combntn & consumers[succmets]:
+                    number_of_cyclic += 1
+                    if succmets in cyclic_pathways:
+                        cyclic_pathways[succmets].update(
+                            {pathway_length: [reaction_combntn]})
                     else:
-                        pathway_table[succmets] = {len(reaction_combntn): [reaction_combntn]}
+                        cyclic_pathways[succmets] = \
+                            {pathway_length: [reaction_combntn]}
+                elif pathway_length in pathway_table[succmets]:
+                    # Entries which are already in the pathway_table
+                    # are not added again
+                    entry = pathway_table[succmets][pathway_length]
+                    number_of_entries = len(entry)
+                    entry[reaction_combntn] = None
+                    number_inserted += len(entry) - number_of_entries
+                else:
+                    pathway_table[succmets].update(
+                        {pathway_length: {reaction_combntn: None}})
+                    number_inserted += 1
+            else:
+                pathway_table[succmets] = {pathway_length: {reaction_combntn: None}}
+                number_inserted += 1
+    _counters['pathways_inserted'] += number_inserted
+    _counters['cyclic_insertions'] += number_of_cyclic
+    _counters['duplicate_pathways'] += len(pathways) * len(products_of_rxn) - \
+        number_inserted - number_of_cyclic
+
+
+def _products_in_table(rxns):
+    """
+    This function checks if all the products of a reaction are present in
+    the pathway table. In a worker process, metabolites added to the table
+    by the reactions evaluated before this reaction in the same column are
+    not known, and hence, _OrderDependent is raised if the products are
+    not found, so that the reaction is evaluated by the main process.
+    """
+    if _recorded_pathways is None:
+        return set(succ[rxns]).issubset(pathway_table)
+    for succmets in succ[rxns]:
+        if succmets not in pathway_table and \
+                succmets not in _added_products:
+            raise _OrderDependent
+    return True
+
+
+class _OrderDependent(Exception):
+    """
+    Raised in a worker process when the pathways of a reaction depend on
+    the reactions evaluated before it in the same column.
+    """
+
 
 def _second_round_calculations(mets_needed, currentcolumnidx, rxns, val):
     """
@@ -325,11 +1593,11 @@ def _second_round_calculations(mets_needed, currentcolumnidx, rxns, val):
     Parameters
     ----------
     mets_needed : list
-        List of metabolites a reaction requires
+        List of metabolites (identifiers) a reaction requires
     currentcolumnidx : int
         An integer denoting the current column which is evaluated
-    rxns : str
-        Current reaction which is evaluated
+    rxns : int
+        Identifier of the current reaction which is evaluated
     val : int
         Maximum sum that is to be generated
 
@@ -339,14 +1607,16 @@ def _second_round_calculations(mets_needed, currentcolumnidx, rxns, val):
     """
     first_discovery_step = []
     for predmets in mets_needed:
-        first_discovery_step.append(min(lower_bound_metabolite[predmets]))
-    all_partitions = generate_partitions(val, first_discovery_step, currentcolumnidx-1)
+        first_discovery_step.append(lower_bound_metabolite[predmets])
+    all_partitions = generate_partitions(val, first_discovery_step, currentcolumnidx-1,
+                                         _available_lengths(mets_needed))
     for partitions in all_partitions:
+        _counters['partitions_generated'] += 1
         temp_rxn_list = []
         number_of_pathways_found = {}
         more_pathways_found = ''
         counter_new = 0
-        temp_rxn_list.append([[rxns]])
+        temp_rxn_list.append([1 << rxns])
         for item in range(len(mets_needed)):
             if mets_needed[item] in pathway_table:
                 if partitions[item] in pathway_table[mets_needed[item]]:
@@ -354,10 +1624,13 @@ def _second_round_calculations(mets_needed, currentcolumnidx, rxns, val):
                         len(pathway_table[mets_needed[item]][partitions[item]])
                     counter_new += 1
         if counter_new == len(mets_needed):
-            if all([prod(list(number_of_pathways_found.values())) > maxnumpath,
-                    set(succ(rxns)).issubset(set(pathway_table))]):
+            if prod(list(number_of_pathways_found.values())) > maxnumpath and \
+                    _products_in_table(rxns):
                 more_pathways_found = 'NA'
+                _counters['maxnumpath_prunes'] += 1
             else:
                 for item in range(len(mets_needed)):
                     temp_rxn_list.append(pathway_table[mets_needed[item]][partitions[item]])
                 _populate_table(rxns, temp_rxn_list, currentcolumnidx)
+        else:
+            _counters['partitions_skipped'] += 1
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+# Types of the adhoc names of the exchange reactions between an organism
+# and the common pool of metabolites (see create_graph), for metabolites
+# exchanged by all the organisms (ER) or not (NCER), along with their
+# reverse reactions (ERR and NCERR)
+EXCHANGE_REACTION_TYPES = ('ER', 'NCER')
+
+
+def reaction_organism(rxn):
+    """
+    This function returns the name of the organism of a reaction, from its
+    adhoc name, i.e., Org_<organism> <reaction type><number>.
+
+    Parameters
+    ----------
+    rxn : str
+        Adhoc name of the reaction
+
+    Returns
+    -------
+    organism : str
+        Name of the organism
+
+    >>> reaction_organism('Org_iJO1366 IR12')
+    'iJO1366'
+    """
+    return rxn.rsplit(' ', 1)[0][len('Org_'):]
+
+
+def is_exchange_reaction(rxn):
+    """
+    This function checks if a reaction is an exchange reaction (ER or
+    NCER, or their reverse reactions) between an organism and the common
+    pool of metabolites, from its adhoc name.
+
+    Parameters
+    ----------
+    rxn : str
+        Adhoc name of the reaction
+
+    Returns
+    -------
+    exchange : bool
+        True if the reaction is an exchange reaction
+
+    >>> is_exchange_reaction('Org_iJO1366 NCERR4')
+    True
+    >>> is_exchange_reaction('Org_iJO1366 RevBR4')
+    False
+    """
+    return rxn.rsplit(' ', 1)[-1].startswith(EXCHANGE_REACTION_TYPES)
+
+
+def pathway_size(pathway):
+    """
+    This function returns the number of reactions in a pathway, which is
+    the default cost of find_best_pathways.
+    """
+    return len(pathway)
+
+
+def number_of_organisms(pathway):
+    """
+    This function returns the number of organisms whose reactions are part
+    of a pathway, which can be used as the cost of find_best_pathways,
+    with a bound of 1 for every size.
+
+    Parameters
+    ----------
+    pathway : collection
+        Adhoc names of the reactions in the pathway
+
+    Returns
+    -------
+    number_of_organisms : int
+        Number of different organisms
+    """
+    return len(set(map(reaction_organism, pathway)))
+
+
+def number_of_exchange_reactions(pathway):
+    """
+    This function returns the number of exchange reactions (ER or NCER) in
+    a pathway, which can be used as the cost of find_best_pathways, with a
+    bound of 0 for every size.
+
+    Parameters
+    ----------
+    pathway : collection
+        Adhoc names of the reactions in the pathway
+
+    Returns
+    -------
+    number_of_exchange_reactions : int
+        Number of exchange reactions
+    """
+    return sum(1 for rxn in pathway if is_exchange_reaction(rxn))
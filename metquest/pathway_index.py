@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import numpy as np
+from metquest.pathway_table import pathway_sizes, pathways_of_size, popcount
+
+
+def build_pathway_index(pathway_table, currenttarmet, cutoff=None):
+    """
+    This function creates the inverted index of the pathways of a target
+    metabolite, from the reactions to the pathways containing them.
+
+    Parameters
+    ----------
+    pathway_table : dict
+        Dictionary of dictionary containing the pathways of different sizes
+        identified for every metabolite (a PathwayTable, or the cyclic
+        pathways)
+    currenttarmet : str
+        Target metabolite
+    cutoff : int
+        If given, only the pathways whose sizes are less than or equal to
+        the cutoff are indexed
+
+    Returns
+    -------
+    pathway_index : PathwayIndex
+        Inverted index of the pathways of the target, which are numbered
+        in the order in which they are stored in the table
+    """
+    pathways = []
+    sizes = []
+    if currenttarmet in pathway_table:
+        for plen in pathway_sizes(pathway_table, currenttarmet):
+            if plen == 0 or (cutoff is not None and plen > int(cutoff)):
+                continue
+            entries = pathways_of_size(pathway_table, currenttarmet, plen)
+            pathways.extend(entries)
+            sizes.extend([plen] * len(entries))
+    return PathwayIndex(pathways, sizes)
+
+
+class PathwayIndex(object):
+    """
+    Inverted index of a collection of pathways, from every reaction to the
+    pathways containing it. The pathways are numbered by their position
+    in the collection, and a set of pathways is a bitmap, i.e., an integer
+    whose bit i is set if the pathway i is in the set, in the same way as
+    the reactions of a pathway in the pathway table. Hence, the pathways
+    containing or avoiding some reactions are found by bitwise operations
+    on the bitmaps of the reactions.
+
+    Parameters
+    ----------
+    pathways : list
+        Pathways, as collections of reaction names
+    sizes : list
+        Size of every pathway. By default, the number of reactions.
+
+    Examples
+    --------
+    >>> pathway_index = build_pathway_index(pathway_table, 'C00022_c')
+    >>> surviving = pathway_index.knockout(['Org_iJO1366 IR12', 'Org_iJO1366 IR40'])
+    >>> pathway_index.count(surviving)
+    312
+    >>> pathways = pathway_index.pathways(surviving)
+    """
+
+    def __init__(self, pathways, sizes=None):
+        self._pathways = pathways
+        if sizes is None:
+            sizes = [len(items) for items in pathways]
+        self.sizes = np.array(sizes, dtype=np.int64)
+        # Reaction identifiers in the order in which the reactions are
+        # first found in the pathways
+        self.reaction_ids = {}
+        pathway_of_entry = []
+        reaction_of_entry = []
+        for pathwayidx, items in enumerate(pathways):
+            for rxn in items:
+                reaction_of_entry.append(
+                    self.reaction_ids.setdefault(rxn, len(self.reaction_ids)))
+            pathway_of_entry.extend([pathwayidx] * len(items))
+        self.reactions = list(self.reaction_ids)
+        reaction_of_entry = np.array(reaction_of_entry, dtype=np.int64)
+        order = np.argsort(reaction_of_entry, kind='stable')
+        # Pathways containing every reaction, in increasing order, as in a
+        # CSR matrix whose rows are the reactions
+        self.reaction_indptr = np.zeros(len(self.reactions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(reaction_of_entry, minlength=len(self.reactions)),
+                  out=self.reaction_indptr[1:])
+        self.reaction_pathways = np.array(pathway_of_entry,
+                                          dtype=np.int64)[order]
+        self.all_pathways = (1 << len(pathways)) - 1
+        self._bitmaps = {}
+
+    def __len__(self):
+        return len(self._pathways)
+
+    def pathway_ids_with(self, rxn):
+        """
+        Returns the numbers of the pathways containing a reaction, as a
+        sorted array.
+        """
+        rxnid = self.reaction_ids.get(rxn)
+        if rxnid is None:
+            return self.reaction_pathways[:0]
+        return self.reaction_pathways[
+            self.reaction_indptr[rxnid]:self.reaction_indptr[rxnid + 1]]
+
+    def reaction_bitmap(self, rxn):
+        """
+        Returns the bitmap of the pathways containing a reaction.
+        """
+        bitmap = self._bitmaps.get(rxn)
+        if bitmap is None:
+            bitmap = _bitmap(self.pathway_ids_with(rxn), len(self))
+            self._bitmaps[rxn] = bitmap
+        return bitmap
+
+    def containing_any(self, rxns):
+        """
+        Returns the bitmap of the pathways containing at least one of the
+        reactions.
+        """
+        bitmap = 0
+        for rxn in rxns:
+            bitmap |= self.reaction_bitmap(rxn)
+        return bitmap
+
+    def containing_all(self, rxns):
+        """
+        Returns the bitmap of the pathways containing all the reactions.
+        """
+        bitmap = self.all_pathways
+        for rxn in rxns:
+            bitmap &= self.reaction_bitmap(rxn)
+        return bitmap
+
+    def knockout(self, rxns):
+        """
+        Returns the bitmap of the pathways which remain when the reactions
+        are deleted, i.e., the pathways containing none of the reactions.
+        """
+        return self.all_pathways & ~self.containing_any(rxns)
+
+    def size_bitmap(self, cutoff):
+        """
+        Returns the bitmap of the pathways whose sizes are less than or
+        equal to the cutoff.
+        """
+        return _bitmap(np.flatnonzero(self.sizes <= int(cutoff)), len(self))
+
+    def pathway_ids(self, bitmap):
+        """
+        Returns the numbers of the pathways in a bitmap, in increasing
+        order.
+        """
+        if not bitmap:
+            return []
+        bits = np.unpackbits(np.frombuffer(
+            bitmap.to_bytes((len(self) + 7) // 8, 'little'), dtype=np.uint8),
+            bitorder='little')
+        return np.flatnonzero(bits).tolist()
+
+    def pathways(self, bitmap):
+        """
+        Returns the pathways in a bitmap, in the order of the collection.
+        """
+        return [self._pathways[pathwayidx]
+                for pathwayidx in self.pathway_ids(bitmap)]
+
+    def count(self, bitmap):
+        """
+        Returns the number of pathways in a bitmap.
+        """
+        return popcount(bitmap)
+
+    def reaction_counts(self):
+        """
+        Returns the number of pathways containing every reaction, as a
+        dictionary, in the order in which the reactions are first found in
+        the pathways.
+        """
+        counts = np.diff(self.reaction_indptr).tolist()
+        return dict(zip(self.reactions, counts))
+
+
+def _bitmap(pathway_ids, number_of_pathways):
+    """
+    Returns the bitmap of a sorted array of pathway numbers.
+    """
+    bits = np.zeros(number_of_pathways, dtype=bool)
+    bits[pathway_ids] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(),
+                          'little')
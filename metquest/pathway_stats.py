@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import json
+
+# Counters of the work done while a column of the pathway table is filled
+COUNTER_NAMES = ('reactions_visited', 'partitions_generated',
+                 'partitions_skipped', 'maxnumpath_prunes', 'product_tuples',
+                 'short_tuples', 'pathways_inserted', 'duplicate_pathways',
+                 'cyclic_insertions', 'constraint_prunes')
+
+
+class PathwayStats(object):
+    """
+    Profile of the filling of the pathway table, with one entry per column
+    filled, which is returned by find_pathways when return_stats is True.
+
+    Every entry is a dictionary with the index of the column, the wall
+    time taken to fill it (s), the counters in COUNTER_NAMES, i.e., the
+    number of reactions visited, partitions of the column index generated
+    and skipped (since one of the metabolites has no pathway of the size
+    in the partition), combinations skipped since the number of pathways
+    exceeds maxnumpath, tuples of pathways examined by itertools.product
+    in _populate_table, tuples giving pathways smaller than the column,
+    pathways inserted in the table, pathways already in the table, cyclic
+    pathways inserted, and pathways discarded since they have more
+    exchange reactions than allowed (see find_pathways), along with the
+    number of pathways and cyclic pathways in the table after the column,
+    and the reactions which took the longest time in the column. The memory accounting of
+    the table after the column (see PathwayStore.memory) is added to the
+    entry as well, i.e., the estimated bytes taken by the pathways in
+    memory, and the cells and pathways spilled to the disk.
+    If the filling was stopped since a budget was exceeded, stop_reason
+    is the name of the budget, and the column being filled is left out.
+
+    Parameters
+    ----------
+    top_n : int
+        Number of reactions which took the longest time which are listed
+        for every column and for all the columns
+
+    Examples
+    --------
+    >>> pathway_table, cyclic_pathways, scope, stats = find_pathways(
+    ...     G, seed_metabolites, 8, return_stats=True)
+    >>> stats.columns[-1]['product_tuples']
+    1203344
+    >>> stats.write_json('pathway_stats.json')
+    """
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self.columns = []
+        # Time taken and tuples examined by every reaction in all the
+        # columns
+        self.reaction_totals = {}
+        self.stop_reason = None
+
+    def add_column(self, column, wall_time, counters, reaction_costs,
+                   table_pathways, cyclic_pathways, memory=None):
+        """
+        Adds the entry of a column, from the counters of the column, the
+        time taken and the tuples examined by every reaction, as a
+        dictionary {reaction name: (time, tuples)}, and the memory
+        accounting of the table, if given.
+        """
+        for rxn, (timetaken, tuples) in reaction_costs.items():
+            totals = self.reaction_totals.setdefault(rxn, [0.0, 0])
+            totals[0] += timetaken
+            totals[1] += tuples
+        entry = {'column': column, 'wall_time': wall_time}
+        for counter_name in COUNTER_NAMES:
+            entry[counter_name] = counters[counter_name]
+        entry['table_pathways'] = table_pathways
+        entry['cyclic_pathways'] = cyclic_pathways
+        if memory is not None:
+            entry.update(memory)
+        entry['top_reactions'] = _top_reactions(reaction_costs, self.top_n)
+        self.columns.append(entry)
+        return entry
+
+    def top_reactions(self, top_n=None):
+        """
+        Returns the reactions which took the longest time in all the
+        columns, as a list of dictionaries with the name of the reaction,
+        the time taken and the tuples examined.
+        """
+        return _top_reactions(self.reaction_totals, top_n or self.top_n)
+
+    def totals(self):
+        """
+        Returns the sum of the wall time and of every counter over all the
+        columns.
+        """
+        totals = {'wall_time': sum(entry['wall_time'] for entry in self.columns)}
+        for counter_name in COUNTER_NAMES:
+            totals[counter_name] = sum(entry[counter_name] for entry in self.columns)
+        return totals
+
+    def to_dict(self):
+        """
+        Returns the profile as a dictionary, which can be written as JSON.
+        """
+        return {'columns': self.columns, 'totals': self.totals(),
+                'top_reactions': self.top_reactions(),
+                'stop_reason': self.stop_reason}
+
+    def write_json(self, file_name):
+        """
+        Writes the profile to a JSON file.
+        """
+        with open(file_name, 'w') as filetowrite:
+            json.dump(self.to_dict(), filetowrite, indent=2)
+
+
+def _top_reactions(reaction_costs, top_n):
+    """
+    Returns the top_n reactions which took the longest time.
+    """
+    ranked = sorted(reaction_costs.items(), key=lambda item: -item[1][0])
+    return [{'reaction': rxn, 'time': timetaken, 'product_tuples': tuples}
+            for rxn, (timetaken, tuples) in ranked[:top_n]]
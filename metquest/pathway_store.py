@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+from itertools import islice
+
+# Fraction of the memory budget used to cache the cells read back from
+# the disk, when the size of the cache is not given
+CACHE_FRACTION = 4
+# Maximum number of bitmasks measured to estimate the bytes taken by the
+# bitmasks of a cell
+ACCOUNTING_SAMPLE = 64
+
+
+class PathwayStore(object):
+    """
+    Memory accounting of the pathway table, and store on the disk of the
+    cells of the table which are spilled when the table exceeds a memory
+    budget.
+
+    A cell, i.e., the pathways of one size of a metabolite, is finished
+    once the column of its size has been filled, since a column only adds
+    pathways whose size is at least the column index. After every column,
+    the memory taken by the cells which are in memory is estimated, and
+    if it exceeds the budget, the largest finished cells are written to a
+    temporary segment file and replaced in the table by SpilledPathways,
+    until the table fits in the budget. The pathways of a spilled cell are
+    read back from the file when the cell is used to fill a later column,
+    and the cells read back most recently are cached.
+
+    Parameters
+    ----------
+    memory_budget : int
+        Maximum number of bytes taken by the cells kept in memory. If None,
+        the memory is only accounted for, and no cell is spilled.
+    directory : str
+        Directory of the segment file. By default, the directory of the
+        temporary files.
+    cache_budget : int
+        Maximum number of bytes taken by the cells read back from the disk
+        which are cached. By default, a quarter of the memory budget.
+
+    Notes
+    -----
+    The memory taken by a cell is estimated from the size of its
+    dictionary and of its bitmasks, which are the bulk of the memory taken
+    by the table. The cells read back are cached in every worker process
+    of a parallel computation.
+    """
+
+    def __init__(self, memory_budget=None, directory=None, cache_budget=None):
+        self.memory_budget = memory_budget
+        self.directory = directory
+        if cache_budget is None:
+            cache_budget = (memory_budget or 0) // CACHE_FRACTION
+        self.cache_budget = cache_budget
+        self.table_bytes = 0
+        self.spilled_cells = 0
+        self.spilled_pathways = 0
+        self.file_bytes = 0
+        self.cells_read = 0
+        self._file = None
+        # Mean number of bytes taken by a bitmask of every cell in memory
+        self._mask_bytes = {}
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def account(self, pathway_table, column):
+        """
+        Estimates the bytes taken by the cells of the pathway table which
+        are in memory, after the column has been filled, and spills the
+        largest finished cells if they exceed the memory budget. Returns
+        the memory accounting of the column as a dictionary.
+        """
+        table_bytes = 0
+        finished = []
+        for metid, entry in pathway_table.items():
+            for plen, pathways in entry.items():
+                if plen == 0 or not isinstance(pathways, dict):
+                    continue
+                cell_bytes = self._cell_bytes(metid, plen, pathways)
+                if plen <= column and pathways:
+                    finished.append((cell_bytes, metid, plen))
+                table_bytes += cell_bytes
+        if self.memory_budget is not None and table_bytes > self.memory_budget:
+            finished.sort(key=lambda cell: -cell[0])
+            for cell_bytes, metid, plen in finished:
+                if table_bytes <= self.memory_budget:
+                    break
+                pathway_table[metid][plen] = self.spill(pathway_table[metid][plen])
+                del self._mask_bytes[metid, plen]
+                table_bytes -= cell_bytes
+        self.table_bytes = table_bytes
+        return self.memory()
+
+    def _cell_bytes(self, metid, plen, pathways):
+        """
+        Returns the estimated number of bytes taken by a cell in memory.
+        The bytes taken by a bitmask of the cell are estimated once, as the
+        mean of the bytes taken by its first ACCOUNTING_SAMPLE bitmasks, so
+        that the cells are not read again after every column.
+        """
+        mask_bytes = self._mask_bytes.get((metid, plen))
+        if mask_bytes is None:
+            if not pathways:
+                return sys.getsizeof(pathways)
+            sample = list(islice(pathways, ACCOUNTING_SAMPLE))
+            mask_bytes = sum(map(sys.getsizeof, sample)) / len(sample)
+            self._mask_bytes[metid, plen] = mask_bytes
+        return sys.getsizeof(pathways) + int(mask_bytes * len(pathways))
+
+    def memory(self):
+        """
+        Returns the memory accounting, i.e., the bytes taken by the cells
+        in memory, the number of cells and pathways spilled to the disk,
+        the size of the segment file, and the number of cells read back.
+        """
+        return {'table_bytes': self.table_bytes,
+                'spilled_cells': self.spilled_cells,
+                'spilled_pathways': self.spilled_pathways,
+                'spill_file_bytes': self.file_bytes,
+                'cells_read': self.cells_read}
+
+    def spill(self, pathways):
+        """
+        Writes the bitmasks of a cell to the segment file, and returns the
+        SpilledPathways which replaces the cell in the table.
+        """
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='metquest_pathways_',
+                                                suffix='.seg', dir=self.directory)
+        width = (max(mask.bit_length() for mask in pathways) + 7) // 8
+        data = b''.join([mask.to_bytes(width, 'little') for mask in pathways])
+        offset = self.file_bytes
+        self._file.seek(offset)
+        self._file.write(data)
+        self._file.flush()
+        self.file_bytes += len(data)
+        self.spilled_cells += 1
+        self.spilled_pathways += len(pathways)
+        return SpilledPathways(self, offset, len(pathways), width)
+
+    def load(self, offset, number_of_pathways, width):
+        """
+        Returns the bitmasks of a spilled cell, in the order in which they
+        were stored, from the cache or the segment file.
+        """
+        masks = self._cache.get(offset)
+        if masks is not None:
+            self._cache.move_to_end(offset)
+            return masks
+        data = self._read(offset, number_of_pathways * width)
+        from_bytes = int.from_bytes
+        masks = [from_bytes(data[start:start + width], 'little')
+                 for start in range(0, len(data), width)]
+        self.cells_read += 1
+        cell_bytes = _cell_bytes(masks)
+        if cell_bytes <= self.cache_budget:
+            self._cache[offset] = masks
+            self._cache_bytes += cell_bytes
+            while self._cache_bytes > self.cache_budget:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= _cell_bytes(evicted)
+        return masks
+
+    def _read(self, offset, nbytes):
+        """
+        Reads bytes from the segment file. The file is read at the offset
+        without moving its position when possible, so that worker processes
+        sharing the file can read it at the same time.
+        """
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), nbytes, offset)
+        self._file.seek(offset)
+        return self._file.read(nbytes)
+
+
+class SpilledPathways(object):
+    """
+    Cell of the pathway table whose bitmasks are stored in the segment
+    file of a PathwayStore. It gives the number of pathways without
+    reading them, and the bitmasks, in the order in which they were
+    stored, when it is iterated over. It is saved (pickled) as the
+    dictionary of bitmasks which it replaces.
+    """
+
+    __slots__ = ('store', 'offset', 'number_of_pathways', 'width')
+
+    def __init__(self, store, offset, number_of_pathways, width):
+        self.store = store
+        self.offset = offset
+        self.number_of_pathways = number_of_pathways
+        self.width = width
+
+    def __len__(self):
+        return self.number_of_pathways
+
+    def __iter__(self):
+        return iter(self.store.load(self.offset, self.number_of_pathways,
+                                    self.width))
+
+    def __reduce__(self):
+        return _pathway_cell, (list(self),)
+
+
+def _pathway_cell(masks):
+    """
+    Returns the cell of the pathway table holding the bitmasks.
+    """
+    return dict.fromkeys(masks)
+
+
+def _cell_bytes(pathways):
+    """
+    Returns the estimated number of bytes taken by a cell, i.e., by its
+    collection and its bitmasks.
+    """
+    return sys.getsizeof(pathways) + sum(map(sys.getsizeof, pathways))
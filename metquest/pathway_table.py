@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from itertools import islice
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(mask):
+        """Returns the number of reactions in a pathway bitmask"""
+        return bin(mask).count('1')
+
+
+def reactions_in_pathway(mask):
+    """
+    This function returns the identifiers of the reactions in a pathway,
+    which is stored as a bitmask where bit i is set if the reaction with
+    identifier i is part of the pathway.
+
+    Parameters
+    ----------
+    mask : int
+        Bitmask of the pathway
+
+    Returns
+    -------
+    rxnids : list
+        Identifiers of the reactions in the pathway, in increasing order
+
+    >>> reactions_in_pathway(0b10110)
+    [1, 2, 4]
+    """
+    rxnids = []
+    while mask:
+        lowest_bit = mask & -mask
+        rxnids.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+    return rxnids
+
+
+def pathway_mask(rxnids):
+    """
+    This function returns the bitmask of a pathway from the identifiers
+    of its reactions.
+
+    Parameters
+    ----------
+    rxnids : iterable
+        Identifiers of the reactions in the pathway
+
+    Returns
+    -------
+    mask : int
+        Bitmask of the pathway
+
+    >>> pathway_mask([1, 2, 4])
+    22
+    """
+    mask = 0
+    for rxnid in rxnids:
+        mask |= 1 << rxnid
+    return mask
+
+
+def pathway_sizes(table, metname):
+    """
+    This function returns the sizes of the pathways of a metabolite, in
+    the order in which they are stored, from a pathway table which is
+    either a PathwayTable or a dictionary of dictionary.
+
+    Parameters
+    ----------
+    table : PathwayTable or dict
+        Pathway table
+    metname : str
+        Name of the metabolite
+
+    Returns
+    -------
+    sizes : list
+        Sizes of the pathways of the metabolite
+    """
+    if isinstance(table, PathwayTable):
+        return table.pathway_sizes(metname)
+    return list(table[metname])
+
+
+def pathways_of_size(table, metname, plen):
+    """
+    This function returns the pathways of one size of a metabolite, from
+    a pathway table which is either a PathwayTable or a dictionary of
+    dictionary. The pathways of the other sizes are not resolved.
+
+    Parameters
+    ----------
+    table : PathwayTable or dict
+        Pathway table
+    metname : str
+        Name of the metabolite
+    plen : int
+        Size of the pathways
+
+    Returns
+    -------
+    pathways : list
+        Pathways of the size, as collections of reaction names
+    """
+    if isinstance(table, PathwayTable):
+        return table.pathways(metname, plen)
+    return table[metname][plen]
+
+
+class PathwayTable(Mapping):
+    """
+    Read-only view of a table of pathways whose metabolites are node
+    identifiers and whose pathways are reaction bitmasks. The view is
+    indexed by metabolite names, and returns the pathways of every size
+    as collections of reaction names, i.e., for a metabolite, a dictionary
+    {pathway size: list of pathways}. The names of a metabolite's pathways
+    are resolved only when the metabolite is looked up.
+
+    Parameters
+    ----------
+    table : dict
+        Dictionary of dictionary containing the pathways of different sizes
+        for every metabolite identifier. Pathways of every size are stored
+        in a dictionary (or list) of bitmasks.
+    compiled_graph : CompiledGraph
+        Compiled graph on which the table was computed
+    pathway_type : type
+        Type of the collection of reaction names of every pathway (set for
+        branched pathways and list for cyclic pathways)
+    named_entries : dict
+        Entries of metabolites which are not in the graph, indexed by name
+    sizes : dict
+        If given, only the first sizes[metabolite][pathway size] pathways
+        of every size are part of the view, and metabolites or sizes absent
+        in sizes are left out. This is used to obtain the table at an
+        earlier column, since pathways are stored in the order in which
+        they are found.
+    required_reactions : int
+        If given, the bitmask of reactions of which every pathway of the
+        view contains at least one, such as the reactions consuming the
+        source metabolites. The other pathways, and the metabolites which
+        are left without pathways, are left out.
+
+    The view also records the last column of the table which was filled
+    completely (column), and if the table was filled only partially since
+    a budget of find_pathways was exceeded, the name of this budget
+    (stop_reason). Otherwise, stop_reason is None.
+    """
+
+    def __init__(self, table, compiled_graph, pathway_type=set,
+                 named_entries=None, sizes=None, required_reactions=None):
+        self.table = table
+        self.compiled_graph = compiled_graph
+        self.pathway_type = pathway_type
+        self.sizes = sizes
+        self.required_reactions = required_reactions
+        # Whether every metabolite has a pathway with a required reaction
+        self._has_required = {}
+        self._named_entries = dict(named_entries or {})
+        self._resolved = {}
+        self.column = None
+        self.stop_reason = None
+
+    def _metabolite_id(self, metname):
+        metid = self.compiled_graph.node_ids.get(metname)
+        if metid is None or metid not in self.table:
+            return None
+        if self.sizes is not None and metid not in self.sizes:
+            return None
+        if self.required_reactions is not None and \
+                not self._with_required(metid):
+            return None
+        return metid
+
+    def _with_required(self, metid):
+        """
+        Checks if a metabolite has a pathway containing a required
+        reaction, or is a seed metabolite.
+        """
+        if metid not in self._has_required:
+            self._has_required[metid] = \
+                next(self._cells(metid), None) is not None
+        return self._has_required[metid]
+
+    def _cells(self, metid):
+        """
+        Yields the size and the bitmasks of the pathways of every size.
+        Sizes without pathways containing a required reaction are left
+        out.
+        """
+        for plen, pathways in self.table[metid].items():
+            if self.sizes is not None:
+                if plen not in self.sizes[metid]:
+                    continue
+                pathways = islice(pathways, self.sizes[metid][plen])
+            if self.required_reactions is not None and plen != 0:
+                pathways = [mask for mask in pathways
+                            if mask & self.required_reactions]
+                if not pathways:
+                    continue
+            yield plen, pathways
+
+    def __getitem__(self, metname):
+        if metname in self._resolved:
+            return self._resolved[metname]
+        if metname in self._named_entries:
+            return self._named_entries[metname]
+        metid = self._metabolite_id(metname)
+        if metid is None:
+            raise KeyError(metname)
+        entry = {}
+        for plen, pathways in self._cells(metid):
+            entry[plen] = self._resolve(metid, plen, pathways)
+        self._resolved[metname] = entry
+        return entry
+
+    def _resolve(self, metid, plen, pathways):
+        """
+        Returns the reaction names of the pathways of one size.
+        """
+        if plen == 0:
+            return self.table[metid][plen]
+        node_names = self.compiled_graph.node_names
+        return [self.pathway_type(
+            node_names[rxnid] for rxnid in reactions_in_pathway(mask))
+            for mask in pathways]
+
+    def __contains__(self, metname):
+        if metname in self._named_entries:
+            return True
+        return self._metabolite_id(metname) is not None
+
+    def __iter__(self):
+        node_names = self.compiled_graph.node_names
+        for metid in self.table:
+            if (self.sizes is None or metid in self.sizes) and \
+                    (self.required_reactions is None or
+                     self._with_required(metid)):
+                yield node_names[metid]
+        for metname in self._named_entries:
+            yield metname
+
+    def __len__(self):
+        if self.sizes is None and self.required_reactions is None:
+            return len(self.table) + len(self._named_entries)
+        return sum(1 for _ in self)
+
+    def masks(self, metname):
+        """
+        Returns the pathways of a metabolite as a dictionary
+        {pathway size: list of bitmasks}.
+        """
+        metid = self._metabolite_id(metname)
+        if metid is None:
+            raise KeyError(metname)
+        return {plen: list(pathways) for plen, pathways
+                in self._cells(metid) if plen != 0}
+
+    def pathway_sizes(self, metname):
+        """
+        Returns the sizes of the pathways of a metabolite, in the order in
+        which they are stored.
+        """
+        if metname in self._resolved or metname in self._named_entries:
+            return list(self[metname])
+        metid = self._metabolite_id(metname)
+        if metid is None:
+            raise KeyError(metname)
+        return [plen for plen, _ in self._cells(metid)]
+
+    def pathways(self, metname, plen):
+        """
+        Returns the pathways of one size of a metabolite as collections of
+        reaction names, without resolving the pathways of the other sizes.
+        """
+        if metname in self._resolved or metname in self._named_entries:
+            return self[metname][plen]
+        metid = self._metabolite_id(metname)
+        if metid is None:
+            raise KeyError(metname)
+        for size, pathways in self._cells(metid):
+            if size == plen:
+                return self._resolve(metid, plen, pathways)
+        raise KeyError(plen)
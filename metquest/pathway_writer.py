@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import os
+from metquest.pathway_table import pathway_sizes, pathways_of_size
+
+# Size of the buffer of the files to which the pathways are written
+WRITE_BUFFER_SIZE = 1 << 20
+
+_SEPARATOR = '--------------------\n'
+
+
+class PathwayWriter(object):
+    """
+    Writer of the pathways producing a target metabolite, whose sizes are
+    less than or equal to a cut-off, to the files written by
+    write_output_to_file, i.e., the branched pathways from the seed, the
+    branched pathways from the source and the cyclic pathways. The line
+    of every reaction is computed only once, and every file is written in
+    a single pass through a large buffer.
+
+    The pathways are written by write_column, which may be called once
+    with the complete tables, or after every column of the pathway table
+    is filled (as the pathway_callback of find_pathways), so that the
+    pathways are written while they are found. The files are written to
+    temporary files, which are renamed by close.
+
+    Parameters
+    ----------
+    G : NetworkX DiGraph Object
+        Bipartite graph of the metabolic network
+    namemap : dict
+        Dictionary mapping the adhoc reaction names to reaction names in
+        the model
+    currenttarmet : str
+        Target metabolite
+    cutoff : int
+        Maximum pathway length cutoff
+    folder_to_create : str
+        Name of the folder where results have to be written
+    source_metabolites : list
+        List of source metabolites
+
+    Examples
+    --------
+    >>> writer = PathwayWriter(G, namemap, 'C00022_c', 5, 'Results/',
+    ...                        ['C00031_e'])
+    >>> pathway_table, cyclic_pathways, scope = find_pathways(
+    ...     G, seed_metabolites, 5, pathway_callback=writer.write_column)
+    >>> writer.close()
+    """
+
+    def __init__(self, G, namemap, currenttarmet, cutoff, folder_to_create,
+                 source_metabolites):
+        self.G = G
+        self.namemap = namemap
+        self.currenttarmet = currenttarmet
+        self.cutoff = int(cutoff)
+        self.source_metabolites = list(source_metabolites)
+        file_suffix = currenttarmet.replace(' ', '') + '_' + 'leq_plen_' + \
+            str(cutoff) + '.txt'
+        self.cyclic_file_name = folder_to_create + 'cyclic_pathways_' + \
+            file_suffix
+        self.seed_file_name = folder_to_create + \
+            'branched_pathways_from_seed_' + file_suffix
+        self.source_file_name = folder_to_create + \
+            'branched_pathways_from_source_' + file_suffix
+        self._labels = {}
+        self._source_reactions = None
+        # Pathways from every source, which are written in the order of
+        # the source metabolites once all of them are found
+        self._source_pathways = [[] for _ in self.source_metabolites]
+        self._branched_sizes = set()
+        self._cyclic_sizes = set()
+        self._branched_count = 0
+        self._cyclic_count = 0
+        self._seed_file = None
+        self._cyclic_file = None
+        self.target_found = False
+        self.finished = False
+
+    def reaction_line(self, rxn):
+        """
+        Returns the line of a reaction in the files, with the name of the
+        reaction in the model, its reactants and its products.
+        """
+        line = self._labels.get(rxn)
+        if line is None:
+            line = self.namemap[rxn] + '\t' + ' + '.join(self.G.predecessors(rxn)) + \
+                '->' + ' + '.join(self.G.successors(rxn)) + '\n'
+            self._labels[rxn] = line
+        return line
+
+    def write_column(self, column, pathway_table, cyclic_pathways):
+        """
+        Writes the pathways of the target whose sizes are at most the
+        column and have not been written yet. Once the column reaches the
+        cut-off, the remaining pathways are written, and the tables are
+        not read any further.
+        """
+        if self.finished:
+            return
+        column = int(column)
+        if column >= self.cutoff:
+            self.finished = True
+        if self.currenttarmet not in pathway_table:
+            return
+        self.target_found = True
+        for plen, pathways in _cells(pathway_table, self.currenttarmet,
+                                     self._branched_sizes, min(column, self.cutoff)):
+            self._write_branched(plen, pathways)
+        if self.currenttarmet in cyclic_pathways:
+            # Cyclic pathways larger than the cut-off are written as well,
+            # without the header of their size
+            largest_size = None if self.finished else column
+            for plen, pathways in _cells(cyclic_pathways, self.currenttarmet,
+                                         self._cyclic_sizes, largest_size):
+                self._write_cyclic(plen, pathways)
+
+    def _write_branched(self, plen, pathways):
+        """
+        Writes the branched pathways of one size to the seed file, and
+        records the pathways which start from a source metabolite.
+        """
+        if self._source_reactions is None:
+            self._source_reactions = [set(self.G.successors(sourcemets))
+                                      for sourcemets in self.source_metabolites]
+        if self._seed_file is None and self.source_metabolites:
+            self._seed_file = _open_temporary(self.seed_file_name)
+        lines = ['Path length ' + str(plen) + '\n']
+        for items in pathways:
+            self._branched_count += 1
+            lines.append(str(self._branched_count) + '\n')
+            lines.extend(map(self.reaction_line, items))
+            lines.append(_SEPARATOR)
+            for sourceidx, source_reactions in enumerate(self._source_reactions):
+                if not source_reactions.isdisjoint(items):
+                    self._source_pathways[sourceidx].append(list(items))
+        lines.append(_SEPARATOR)
+        if self._seed_file is not None:
+            self._seed_file.writelines(lines)
+
+    def _write_cyclic(self, plen, pathways):
+        """
+        Writes the cyclic pathways of one size to the cyclic file.
+        """
+        if self._cyclic_file is None:
+            self._cyclic_file = _open_temporary(self.cyclic_file_name)
+        lines = []
+        if plen <= self.cutoff:
+            lines.append('Path length ' + str(plen) + '\n')
+        for items in pathways:
+            self._cyclic_count += 1
+            lines.append(str(self._cyclic_count) + '\n')
+            lines.extend(map(self.reaction_line, items))
+            lines.append(_SEPARATOR)
+        self._cyclic_file.writelines(lines)
+
+    def close(self):
+        """
+        Completes the files, i.e., renames the cyclic and seed files, and
+        writes the source file. As in write_output_to_file, the files
+        from the seed and the source are kept only if there are pathways
+        whose size is the cut-off.
+        """
+        if not self.target_found:
+            _discard(self._cyclic_file)
+            _discard(self._seed_file)
+            print(self.currenttarmet, ': Target could not be found.')
+            print('Consider changing the cut-off or the seed metabolite set')
+            return
+        if self._cyclic_file is not None:
+            print('\nWriting cyclic pathways to a file')
+            _keep(self._cyclic_file, self.cyclic_file_name)
+        if self._seed_file is None:
+            return
+        if self.cutoff not in self._branched_sizes:
+            _discard(self._seed_file)
+            return
+        print('Writing branched pathways (from seed) to a file')
+        _keep(self._seed_file, self.seed_file_name)
+        only_source_to_target = [listentries for pathways in self._source_pathways
+                                 for listentries in pathways]
+        if only_source_to_target:
+            print('Writing branched pathways (from source) to a file \n')
+            with open(self.source_file_name, 'w',
+                      buffering=WRITE_BUFFER_SIZE) as filetowrite:
+                for currentidx, listentries in enumerate(only_source_to_target):
+                    filetowrite.write(str(currentidx + 1) + '\n' + 'Path length ' +
+                                      str(len(listentries)) + '\n')
+                    filetowrite.writelines(map(self.reaction_line, listentries))
+                    filetowrite.write(_SEPARATOR)
+
+
+def _cells(table, metname, sizes_written, largest_size):
+    """
+    Yields the sizes and the pathways of a metabolite which have not been
+    written, and whose sizes are at most largest_size (if it is not None),
+    in the order in which they are stored. The sizes yielded are added to
+    sizes_written.
+    """
+    for plen in pathway_sizes(table, metname):
+        if plen in sizes_written or \
+                (largest_size is not None and plen > largest_size):
+            continue
+        sizes_written.add(plen)
+        yield plen, pathways_of_size(table, metname, plen)
+
+
+def _open_temporary(file_name):
+    """
+    Opens the temporary file to which a file is written till it is
+    complete.
+    """
+    return open(file_name + '.part', 'w', buffering=WRITE_BUFFER_SIZE)
+
+
+def _keep(filetowrite, file_name):
+    """
+    Closes a temporary file and renames it to the file.
+    """
+    filetowrite.close()
+    os.replace(filetowrite.name, file_name)
+
+
+def _discard(filetowrite):
+    """
+    Closes and removes a temporary file, if it was opened.
+    """
+    if filetowrite is not None:
+        filetowrite.close()
+        os.remove(filetowrite.name)
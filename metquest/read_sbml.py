@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import gzip
+import re
+from collections import namedtuple
+from xml.etree import ElementTree
+
+import numpy as np
+from scipy import sparse
+
+# Bounds of reactions whose bounds are not given in the model, which are
+# the default bounds of COBRA
+DEFAULT_LOWER_BOUND = -1000.0
+DEFAULT_UPPER_BOUND = 1000.0
+
+# Characters which are encoded in SBML identifiers as __<ASCII code>__
+_ESCAPED_CHARACTER = re.compile(r"__(\d+)__")
+
+SBMLModel = namedtuple('SBMLModel', ['id', 'metabolites', 'reactions',
+                                     'stoichiometric_matrix'])
+SBMLMetabolite = namedtuple('SBMLMetabolite', ['id'])
+SBMLReaction = namedtuple('SBMLReaction', ['id', 'lower_bound', 'upper_bound',
+                                           'reaction'])
+
+
+def read_sbml_model(file_name):
+    """
+    This function reads the data required to construct the graph from an
+    SBML model, i.e., the identifiers of the metabolites, and the
+    identifiers, bounds and stoichiometry of the reactions. The file is
+    parsed incrementally, without constructing a COBRA model, and may be
+    compressed with gzip (.xml.gz).
+
+    Parameters
+    ----------
+    file_name : str
+        Path of the SBML file
+
+    Returns
+    -------
+    model : SBMLModel
+        Named tuple with the identifier of the model ('' if it is not
+        given), the metabolites and the reactions (as named tuples with the
+        same attributes as the COBRA objects, in the same order as in a
+        COBRA model), and the stoichiometric matrix as a scipy.sparse CSR
+        matrix whose rows are the metabolites and whose columns are the
+        reactions
+
+    Notes
+    -----
+    The identifiers, bounds and stoichiometric coefficients are the same
+    as those obtained from cobra.io.read_sbml_model: the prefixes M_ and
+    R_ are removed from the identifiers of the metabolites and reactions,
+    an exchange reaction EX_<metabolite> is added for every boundary
+    metabolite, and the bounds which are not given are set to -1000 and
+    1000. Bounds are read from the fbc package (version 1 or 2), or else
+    from the LOWER_BOUND and UPPER_BOUND parameters of the kinetic laws.
+    """
+    if file_name.endswith('.gz'):
+        modelfile = gzip.open(file_name, 'rb')
+    else:
+        modelfile = open(file_name, 'rb')
+    with modelfile:
+        return _parse_sbml(modelfile)
+
+
+def _parse_sbml(modelfile):
+    """
+    Parses an SBML file object, as described in read_sbml_model.
+    """
+    level = 3
+    has_fbc = False
+    model_id = ''
+    species = []
+    boundary_species = []
+    parameters = {}
+    flux_bounds = []
+    reactions = []
+    reaction = None
+    sign = None
+    in_kinetic_law = False
+    for event, element in ElementTree.iterparse(
+            modelfile, events=('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            if '/fbc/' in element[1]:
+                has_fbc = True
+            continue
+        tag = element.tag[element.tag.rfind('}') + 1:]
+        if event == 'end':
+            if tag == 'reaction':
+                reactions.append(reaction)
+                reaction = None
+                element.clear()
+            elif tag == 'species':
+                element.clear()
+            elif tag == 'kineticLaw':
+                in_kinetic_law = False
+            elif tag in ('listOfReactants', 'listOfProducts'):
+                sign = None
+            continue
+        if tag == 'speciesReference':
+            if reaction is not None and sign is not None:
+                stoichiometry = element.get('stoichiometry')
+                if stoichiometry is not None:
+                    coefficient = float(stoichiometry)
+                elif level < 3:
+                    coefficient = 1.0
+                else:
+                    coefficient = float('nan')
+                metid = _metabolite_id(element.get('species'))
+                reaction['stoichiometry'][metid] = \
+                    reaction['stoichiometry'].get(metid, 0) + sign * coefficient
+        elif tag == 'species':
+            metid = _metabolite_id(element.get('id'))
+            species.append(metid)
+            if element.get('boundaryCondition') == 'true':
+                boundary_species.append(metid)
+        elif tag in ('parameter', 'localParameter'):
+            value = float(element.get('value', 'nan'))
+            if in_kinetic_law:
+                if element.get('id') in ('LOWER_BOUND', 'UPPER_BOUND'):
+                    reaction['bounds'][element.get('id')] = value
+            else:
+                parameters[element.get('id')] = (
+                    value, element.get('constant', 'true') == 'true')
+        elif tag == 'reaction':
+            reaction = {'id': _reaction_id(element.get('id')),
+                        'stoichiometry': {}, 'bounds': {},
+                        'flux_bounds': {
+                            'LOWER_BOUND': _attribute(element, 'lowerFluxBound'),
+                            'UPPER_BOUND': _attribute(element, 'upperFluxBound')}}
+        elif tag == 'listOfReactants':
+            sign = -1
+        elif tag == 'listOfProducts':
+            sign = 1
+        elif tag == 'kineticLaw':
+            in_kinetic_law = True
+        elif tag == 'fluxBound':
+            flux_bounds.append((_attribute(element, 'reaction'),
+                                _attribute(element, 'operation'),
+                                float(_attribute(element, 'value'))))
+        elif tag == 'model':
+            model_id = element.get('id', '')
+        elif tag == 'sbml':
+            level = int(element.get('level', 3))
+
+    # Bounds of the version 1 of the fbc package, which are given for
+    # every reaction in a separate list
+    fbc_v1_bounds = {}
+    for rxnid, operation, value in flux_bounds:
+        bounds = fbc_v1_bounds.setdefault(_reaction_id(rxnid), {})
+        if operation in ('greaterEqual', 'greater', 'equal'):
+            bounds['LOWER_BOUND'] = value
+        if operation in ('lessEqual', 'less', 'equal'):
+            bounds['UPPER_BOUND'] = value
+
+    metabolites = []
+    metabolite_index = {}
+    for metid in species:
+        if metid not in metabolite_index:
+            metabolite_index[metid] = len(metabolites)
+            metabolites.append(SBMLMetabolite(metid))
+    rxn_list = []
+    reaction_ids = set()
+    rows = []
+    columns = []
+    coefficients = []
+    # The exchange reactions of the boundary metabolites come first
+    exchange_reactions = [{'id': 'EX_' + metid, 'stoichiometry': {metid: -1.0},
+                           'bounds': {}} for metid in boundary_species]
+    for reaction in exchange_reactions + reactions:
+        # Reactions with the identifier of an earlier reaction are ignored
+        if reaction['id'] in reaction_ids:
+            continue
+        reaction_ids.add(reaction['id'])
+        bounds = reaction['bounds']
+        # Bounds in kinetic laws are used only for models without fbc
+        if has_fbc and 'flux_bounds' in reaction:
+            bounds = dict(fbc_v1_bounds.get(reaction['id'], {}))
+            for bound, parameter_id in reaction['flux_bounds'].items():
+                if parameter_id:
+                    bounds[bound] = _bound_value(parameters, parameter_id,
+                                                 reaction['id'])
+        lower_bound = bounds.get('LOWER_BOUND', DEFAULT_LOWER_BOUND)
+        upper_bound = bounds.get('UPPER_BOUND', DEFAULT_UPPER_BOUND)
+        # Metabolites whose coefficients add up to zero are not part of
+        # the reaction
+        stoichiometry = {metid: coefficient for metid, coefficient
+                         in reaction['stoichiometry'].items() if coefficient != 0}
+        for metid, coefficient in stoichiometry.items():
+            rows.append(metabolite_index[metid])
+            columns.append(len(rxn_list))
+            coefficients.append(coefficient)
+        rxn_list.append(SBMLReaction(
+            reaction['id'], lower_bound, upper_bound,
+            _reaction_string(stoichiometry, lower_bound, upper_bound)))
+    stoichiometric_matrix = sparse.csr_matrix(
+        (np.array(coefficients, dtype=float), (rows, columns)),
+        shape=(len(metabolites), len(rxn_list)))
+    return SBMLModel(model_id, metabolites, rxn_list, stoichiometric_matrix)
+
+
+def _attribute(element, name):
+    """
+    Returns the value of an attribute of an element, which may be in the
+    namespace of a package such as fbc, or None if it is not set.
+    """
+    value = element.get(name)
+    if value is not None:
+        return value
+    for key, value in element.attrib.items():
+        if key.endswith('}' + name):
+            return value
+    return None
+
+
+def _bound_value(parameters, parameter_id, rxnid):
+    """
+    Returns the value of the parameter which is the bound of a reaction.
+    """
+    value, constant = parameters.get(parameter_id, (None, False))
+    if not constant:
+        raise ValueError("No constant bound '%s' for reaction: %s"
+                         % (parameter_id, rxnid))
+    return value
+
+
+def _metabolite_id(sid):
+    """
+    Returns the identifier of a metabolite as in COBRA, with the escaped
+    characters decoded and the prefix M_ removed.
+    """
+    sid = _ESCAPED_CHARACTER.sub(lambda match: chr(int(match.group(1))), sid)
+    return sid[2:] if sid.startswith('M_') else sid
+
+
+def _reaction_id(sid):
+    """
+    Returns the identifier of a reaction as in COBRA, with the escaped
+    characters decoded and the prefix R_ removed.
+    """
+    sid = _ESCAPED_CHARACTER.sub(lambda match: chr(int(match.group(1))), sid)
+    return sid[2:] if sid.startswith('R_') else sid
+
+
+def _reaction_string(stoichiometry, lower_bound, upper_bound):
+    """
+    Returns the equation of a reaction, in the same form as the reaction
+    attribute of COBRA reactions.
+    """
+    def _with_coefficient(coefficient, metid):
+        if coefficient == 1:
+            return metid
+        return str(coefficient).rstrip('.') + ' ' + metid
+
+    reactants = []
+    products = []
+    for metid in sorted(stoichiometry):
+        coefficient = stoichiometry[metid]
+        if coefficient >= 0:
+            products.append(_with_coefficient(coefficient, metid))
+        else:
+            reactants.append(_with_coefficient(abs(coefficient), metid))
+    if lower_bound < 0 < upper_bound:
+        arrow = ' <=> '
+    elif lower_bound < 0 and upper_bound <= 0:
+        arrow = ' <-- '
+    else:
+        arrow = ' --> '
+    return ' + '.join(reactants) + arrow + ' + '.join(products)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+from metquest.pathway_assembler import find_pathways, \
+    find_pathways_for_cutoffs, extend_pathways, load_pathway_state
+
+data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'example', 'data')
+reference_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'data', 'pathway_reference.json')
+# Cut-offs of the tables in the reference, the smaller of which is used
+# as the cut-off before the tables are extended
+REFERENCE_CUTOFFS = (8, 12)
+
+
+def example_input():
+    """
+    This function returns the graph of the iJO1366 example and its seed
+    metabolites, including the sources.
+    """
+    with open(os.path.join(data_dir, 'iJO1366_.gpickle'), 'rb') as graphfile:
+        G = pickle.load(graphfile)
+    seed_metabolites = set()
+    for file_name in ('seed_mets.txt', 'source_mets.txt'):
+        with open(os.path.join(data_dir, file_name), 'r') as metfile:
+            seed_metabolites.update(metfile.read().splitlines())
+    return G, seed_metabolites
+
+
+def table_digest(pathway_table, cyclic_pathways, scope):
+    """
+    This function returns a summary of the output of find_pathways which
+    can be stored as JSON. For every metabolite and size of the pathway
+    table, the number of pathways and a hash of the sorted pathways are
+    given. The cyclic pathway of a size which is kept depends on the order
+    in which the pathways are found, and hence, only the sizes of the
+    cyclic pathways of every metabolite are given.
+    """
+    pathways_of_mets = {}
+    for metname in pathway_table:
+        entry = pathway_table[metname]
+        sizes = {}
+        for plen in entry:
+            if plen == 0:
+                continue
+            pathways = sorted('|'.join(sorted(items)) for items in entry[plen])
+            sizes[str(plen)] = [len(pathways), hashlib.sha256(
+                '\n'.join(pathways).encode('utf-8')).hexdigest()[:16]]
+        pathways_of_mets[metname] = sizes
+    return {'pathway_table': pathways_of_mets,
+            'cyclic_sizes': {metname: sorted(cyclic_pathways[metname])
+                             for metname in cyclic_pathways},
+            'scope': sorted(scope)}
+
+
+def write_reference(find_pathways_function=find_pathways):
+    """
+    This function writes the reference of the tests, i.e., the summary of
+    the output of find_pathways for every cut-off in REFERENCE_CUTOFFS.
+    The reference in the package was written with find_pathways as it
+    was before the pathways were stored as bitmasks, and it should only
+    be written again if the pathways found are meant to change.
+    """
+    G, seed_metabolites = example_input()
+    reference = {}
+    for cutoff in REFERENCE_CUTOFFS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = find_pathways_function(G.copy(), seed_metabolites, cutoff)
+        reference[str(cutoff)] = table_digest(*output[:3])
+    with open(reference_file, 'w') as filetowrite:
+        json.dump(reference, filetowrite, indent=0, sort_keys=True)
+
+
+class TestFindPathways(unittest.TestCase):
+    """
+    Checks that the pathway tables of the iJO1366 example are the same as
+    the reference for every way of filling them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with open(reference_file, 'r') as filetoread:
+            cls.reference = json.load(filetoread)
+        cls.G, cls.seed_metabolites = example_input()
+
+    def setUp(self):
+        self.temporary_dir = tempfile.mkdtemp(prefix='metquest_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.temporary_dir)
+
+    def assert_reference(self, output, cutoff):
+        digest = table_digest(*output[:3])
+        expected = self.reference[str(cutoff)]
+        for key in ('scope', 'cyclic_sizes'):
+            self.assertEqual(digest[key], expected[key], key)
+        self.assertEqual(sorted(digest['pathway_table']),
+                         sorted(expected['pathway_table']))
+        for metname, sizes in expected['pathway_table'].items():
+            self.assertEqual(digest['pathway_table'][metname], sizes, metname)
+
+    def find_pathways(self, cutoff, **options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return find_pathways(self.G.copy(), self.seed_metabolites, cutoff,
+                                 **options)
+
+    def test_serial(self):
+        for cutoff in REFERENCE_CUTOFFS:
+            self.assert_reference(self.find_pathways(cutoff), cutoff)
+
+    def test_parallel(self):
+        self.assert_reference(self.find_pathways(12, n_jobs=3), 12)
+
+    def test_memory_budget(self):
+        # Every finished cell is spilled to the disk
+        self.assert_reference(self.find_pathways(
+            12, memory_budget=1, spill_directory=self.temporary_dir), 12)
+        self.assert_reference(self.find_pathways(
+            12, n_jobs=3, memory_budget=1,
+            spill_directory=self.temporary_dir), 12)
+
+    def test_extend(self):
+        state_file = os.path.join(self.temporary_dir, 'pathway_state.pickle')
+        self.assert_reference(self.find_pathways(8, state_file=state_file), 8)
+        state = load_pathway_state(state_file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = extend_pathways(state, 12, state_file=state_file)
+        self.assert_reference(output, 12)
+        # Resuming from the saved state gives the tables of both cut-offs
+        with contextlib.redirect_stdout(io.StringIO()):
+            pathway_tables = find_pathways_for_cutoffs(
+                self.G.copy(), self.seed_metabolites, [8, 12],
+                state_file=state_file)
+        for cutoff in REFERENCE_CUTOFFS:
+            self.assert_reference(pathway_tables[cutoff], cutoff)
+
+    def test_cutoffs(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            pathway_tables = find_pathways_for_cutoffs(
+                self.G.copy(), self.seed_metabolites, list(REFERENCE_CUTOFFS))
+        for cutoff in REFERENCE_CUTOFFS:
+            self.assert_reference(pathway_tables[cutoff], cutoff)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--write-reference']:
+        write_reference()
+    else:
+        unittest.main()